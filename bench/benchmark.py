@@ -0,0 +1,429 @@
+"""Benchmark sin conexión del pipeline de planificación.
+
+Levanta servidores locales que reemplazan a Serper, Amadeus y el LLM (ver
+bench/servidores.py), apunta la configuración a ellos y mide sobre el corpus
+de viajes de bench/corpus.json:
+
+  - cada herramienta por separado (BuscadorWeb, BuscadorVuelos),
+  - la búsqueda de traslados en bloque frente a la secuencial (rutas.buscar_tramos),
+  - generar_itinerario completo, con una caché vacía en cada viaje.
+
+Por cada medición informa p50/p95 de latencia, llamadas a cada proveedor,
+tokens y memoria pico. El repositorio no incluye bench/fixtures: sin una
+grabación propia (bench/grabar.py) las respuestas son sintéticas y los números
+sirven para comparar commits entre sí, no para estimar latencias reales. El resultado se guarda en bench/resultados/<commit>.json
+para compararlo con otro commit:
+
+    python bench/benchmark.py
+    python bench/benchmark.py --modo paralelo --escala 0
+    python bench/benchmark.py --comparar bench/resultados/a1b2c3d.json bench/resultados/e4f5a6b.json
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(BENCH_DIR)
+CORPUS = os.path.join(BENCH_DIR, "corpus.json")
+RESULTADOS_DIR = os.path.join(BENCH_DIR, "resultados")
+
+sys.path.insert(0, BENCH_DIR)
+from servidores import AmadeusFalso, LLMFalso, SerperFalso  # noqa: E402
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (no interpola, así dos corridas iguales dan lo mismo)."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def resumir(latencias):
+    return {
+        "n": len(latencias),
+        "p50_s": round(percentil(latencias, 50), 4) if latencias else None,
+        "p95_s": round(percentil(latencias, 95), 4) if latencias else None,
+        "total_s": round(sum(latencias), 4),
+    }
+
+
+def cargar_corpus(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        contenido = f.read()
+    viajes = json.loads(contenido)
+    for viaje in viajes:
+        viaje["fecha_inicio"] = date.fromisoformat(viaje["fecha_inicio"])
+        viaje["fecha_fin"] = date.fromisoformat(viaje["fecha_fin"])
+        viaje["dias"] = str((viaje["fecha_fin"] - viaje["fecha_inicio"]).days + 1)
+    return viajes, hashlib.sha1(contenido.encode("utf-8")).hexdigest()[:12]
+
+
+def commit_actual():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        sucio = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "sin-git", False
+    return commit, sucio
+
+
+def configurar_entorno(servidores, args, cache_dir):
+    """Apunta la aplicación a los servidores locales. Debe correr antes de importar src/."""
+    serper, amadeus, llm = servidores
+    os.environ.update({
+        "SERPER_URL": f"{serper.url}/search",
+        "SERPER_API_KEY": "bench",
+        "AMADEUS_API_KEY": "bench",
+        "AMADEUS_API_SECRET": "bench",
+        "AMADEUS_HOST": f"127.0.0.1:{amadeus.puerto}",
+        "AMADEUS_SSL": "0",
+        "LLM_MODELO": "openai/bench",
+        "LLM_API_BASE": f"{llm.url}/v1",
+        "GROQ_API_KEY": "bench",
+        "CACHE_DIR": cache_dir,
+        "CACHE_DESACTIVADA": "0",
+        "MODO_PLANIFICACION": args.modo,
+        "VUELOS_DIAS_FLEXIBLES": str(args.dias_flexibles),
+        "LIMITES_COMPARTIDOS": "0",
+        "LIMITE_AMADEUS": "1000,1000",
+        "LIMITE_SERPER": "1000,1000",
+        "LIMITE_GROQ": "1000,1000",
+        "TRAZAS_ACTIVAS": "1",
+        "AGENTES_VERBOSE": "0",
+    })
+    os.environ.pop("TRAZAS_DIR", None)
+    sys.path.insert(0, RAIZ)
+    sys.path.insert(0, os.path.join(RAIZ, "src"))
+
+
+class Medidor:
+    """Diferencia de llamadas y tokens en los servidores locales entre dos momentos."""
+
+    def __init__(self, servidores):
+        self.servidores = servidores
+        self.inicio = self._leer()
+
+    def _leer(self):
+        serper, amadeus, llm = self.servidores
+        llamadas = {f"{s.nombre}.{endpoint}": n for s in self.servidores for endpoint, n in s.llamadas.items()}
+        return llamadas, dict(llm.tokens), sum(s.sintetizadas for s in self.servidores)
+
+    def diferencia(self):
+        (llamadas, tokens, sintetizadas), (llamadas0, tokens0, sintetizadas0) = self._leer(), self.inicio
+        return {
+            "llamadas": {k: n - llamadas0.get(k, 0) for k, n in sorted(llamadas.items()) if n - llamadas0.get(k, 0)},
+            "tokens_prompt": tokens.get("prompt", 0) - tokens0.get("prompt", 0),
+            "tokens_respuesta": tokens.get("respuesta", 0) - tokens0.get("respuesta", 0),
+            "sintetizadas": sintetizadas - sintetizadas0,
+        }
+
+
+def vaciar_caches():
+    import prefetch
+    import tools
+    tools.cache_web.limpiar()
+    tools.cache_vuelos.limpiar()
+    prefetch.cache_iata.limpiar()
+    prefetch.piezas.limpiar()
+
+
+def medir_herramientas(viajes, servidores):
+    import prefetch
+    from tools import BuscadorVuelos, BuscadorWeb
+
+    web, vuelos = BuscadorWeb(usar_cache=False), BuscadorVuelos(usar_cache=False)
+    consultas_web, consultas_vuelos = [], []
+    for viaje in viajes:
+        consultas_web += prefetch.calcular_consultas_actividades(viaje["destinos"], viaje["preferencias"]).values()
+        consultas_web += [c for tipos in prefetch.calcular_consultas_hoteles(viaje["destinos"]).values()
+                          for c in tipos.values()]
+        for tramo in prefetch.calcular_tramos(viaje["origen"], viaje["destinos"], viaje["fecha_inicio"], viaje["fecha_fin"]):
+            origen, destino = prefetch.resolver_codigo_iata(tramo["origen"]), prefetch.resolver_codigo_iata(tramo["destino"])
+            if origen and destino:
+                consultas_vuelos.append(f"{origen},{destino},{tramo['fecha'].strftime('%Y-%m-%d')}")
+
+    resultados = {}
+    for nombre, herramienta, consultas in (("buscar_en_web", web, consultas_web), ("buscar_vuelos", vuelos, consultas_vuelos)):
+        medidor, latencias = Medidor(servidores), []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            herramienta._run(consulta)
+            latencias.append(time.perf_counter() - inicio)
+        resultados[nombre] = dict(resumir(latencias), **medidor.diferencia())
+    return resultados
+
+
+def medir_rutas(viajes, servidores, dias_flexibles):
+    """Compara la búsqueda de traslados en bloque contra la misma búsqueda de a una consulta."""
+    import prefetch
+    import tools
+    from rutas import buscar_tramos, optimizar_ruta
+
+    filas = []
+    for viaje in viajes:
+        tramos, ciudades = [], {}
+        for tramo in prefetch.calcular_tramos(viaje["origen"], viaje["destinos"], viaje["fecha_inicio"], viaje["fecha_fin"]):
+            resuelto = prefetch._tramo_flexible(tramo, max(1, dias_flexibles))
+            if resuelto is not None:
+                tramos.append(resuelto[0])
+                ciudades.update(resuelto[1])
+        tiempos = {}
+        for nombre, max_paralelo in (("secuencial", 1), ("bloque", None)):
+            tools.cache_vuelos.limpiar()
+            medidor = Medidor(servidores)
+            inicio = time.perf_counter()
+            resultados = buscar_tramos(tramos, max_paralelo=max_paralelo)
+            tiempos[nombre] = time.perf_counter() - inicio
+            llamadas = medidor.diferencia()["llamadas"].get("amadeus.flight-offers", 0)
+        inicio = time.perf_counter()
+        ruta = optimizar_ruta(tramos, resultados, ciudades=ciudades)
+        filas.append({
+            "destinos": len(viaje["destinos"]),
+            "tramos": len(tramos),
+            "consultas": llamadas,
+            "secuencial_s": round(tiempos["secuencial"], 4),
+            "bloque_s": round(tiempos["bloque"], 4),
+            "aceleracion": round(tiempos["secuencial"] / tiempos["bloque"], 2) if tiempos["bloque"] else None,
+            "optimizar_s": round(time.perf_counter() - inicio, 4),
+            "precio_ruta": ruta.precio if ruta else None,
+        })
+    secuencial = [f["secuencial_s"] for f in filas]
+    bloque = [f["bloque_s"] for f in filas]
+    return {
+        "secuencial": resumir(secuencial),
+        "bloque": resumir(bloque),
+        "aceleracion_total": round(sum(secuencial) / sum(bloque), 2) if sum(bloque) else None,
+        "por_viaje": filas,
+    }
+
+
+def medir_itinerarios(viajes, servidores, modo, repeticiones):
+    import trazas
+    from agents import generar_itinerario
+
+    filas, latencias, picos = [], [], []
+    total = Medidor(servidores)
+    for _ in range(repeticiones):
+        for viaje in viajes:
+            vaciar_caches()
+            medidor = Medidor(servidores)
+            tracemalloc.reset_peak()
+            inicio = time.perf_counter()
+            with trazas.nueva_traza("benchmark") as traza:
+                itinerario = generar_itinerario(viaje["origen"], viaje["destinos"], viaje["fecha_inicio"], viaje["fecha_fin"],
+                                                viaje["preferencias"], viaje["dias"], modo=modo, usar_cache=False)
+            latencia = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1] / 2**20
+            latencias.append(latencia)
+            picos.append(pico)
+            ejecucion = trazas.resumen(traza)[0] if traza else {}
+            filas.append(dict({
+                "destinos": len(viaje["destinos"]),
+                "dias": int(viaje["dias"]),
+                "latencia_s": round(latencia, 4),
+                "memoria_pico_mb": round(pico, 2),
+                "caracteres": len(itinerario),
+                "tokens_traza": ejecucion.get("tokens"),
+                "tokens_ahorrados": ejecucion.get("tokens_ahorrados"),
+            }, **medidor.diferencia()))
+    return dict(resumir(latencias), memoria_pico_mb=round(max(picos, default=0), 2), **total.diferencia(),
+                tokens_ahorrados=sum(f["tokens_ahorrados"] or 0 for f in filas), por_viaje=filas)
+
+
+def _editar(viaje, **cambios):
+    editado = dict(viaje, **cambios)
+    editado["dias"] = str((editado["fecha_fin"] - editado["fecha_inicio"]).days + 1)
+    return editado
+
+
+def medir_ediciones(viajes, servidores, modo):
+    """Replanifica cada viaje después de editarlo, como haría un usuario en el formulario."""
+    from agents import generar_itinerario
+
+    ediciones = {
+        "mover_fechas": lambda v: _editar(v, fecha_inicio=v["fecha_inicio"] + timedelta(days=2),
+                                          fecha_fin=v["fecha_fin"] + timedelta(days=2)),
+        "agregar_ciudad": lambda v: _editar(v, destinos=v["destinos"] + ["Lisboa"]),
+        "cambiar_preferencia": lambda v: _editar(v, preferencias=v["preferencias"][:-1] + ["Relax"]),
+    }
+    resultados = {}
+    for nombre, editar in ediciones.items():
+        latencias, llamadas = [], {}
+        for viaje in viajes:
+            vaciar_caches()
+            generar_itinerario(viaje["origen"], viaje["destinos"], viaje["fecha_inicio"], viaje["fecha_fin"],
+                               viaje["preferencias"], viaje["dias"], modo=modo, usar_cache=False)
+            editado = editar(viaje)
+            medidor = Medidor(servidores)
+            inicio = time.perf_counter()
+            generar_itinerario(editado["origen"], editado["destinos"], editado["fecha_inicio"], editado["fecha_fin"],
+                               editado["preferencias"], editado["dias"], modo=modo, usar_cache=False)
+            latencias.append(time.perf_counter() - inicio)
+            for proveedor, n in medidor.diferencia()["llamadas"].items():
+                llamadas[proveedor] = llamadas.get(proveedor, 0) + n
+        resultados[nombre] = dict(resumir(latencias), llamadas=llamadas)
+    return resultados
+
+
+def imprimir(resultado):
+    print(f"commit {resultado['commit']}{' (con cambios sin commitear)' if resultado['sucio'] else ''}"
+          f"  modo={resultado['modo']}  escala={resultado['escala']}  corpus={resultado['corpus']}")
+    importacion, preparacion = resultado["importacion"], resultado["preparacion"]
+    print(f"  {'importar':<22} app={importacion['app_s']}s  itinerario={importacion['itinerario_s']}s")
+    print(f"  {'preparar agentes':<22} desde cero={preparacion['armar_agentes']}s"
+          f"  reutilizado={preparacion['reutilizar_planificador']}s")
+    for nombre, datos in resultado["herramientas"].items():
+        print(f"  {nombre:<22} n={datos['n']:<4} p50={datos['p50_s']}s  p95={datos['p95_s']}s  llamadas={datos['llamadas']}")
+    rutas = resultado.get("rutas")
+    if rutas:
+        print(f"  {'rutas secuencial':<22} total={rutas['secuencial']['total_s']}s")
+        print(f"  {'rutas en bloque':<22} total={rutas['bloque']['total_s']}s  aceleración x{rutas['aceleracion_total']}")
+    itinerarios = resultado.get("itinerarios")
+    if itinerarios:
+        print(f"  {'generar_itinerario':<22} n={itinerarios['n']:<4} p50={itinerarios['p50_s']}s  p95={itinerarios['p95_s']}s"
+              f"  tokens={itinerarios['tokens_prompt']}+{itinerarios['tokens_respuesta']}"
+              f" (ahorrados {itinerarios.get('tokens_ahorrados', 0)})"
+              f"  memoria pico={itinerarios['memoria_pico_mb']} MB")
+        print(f"  {'':<22} llamadas={itinerarios['llamadas']}")
+    for nombre, datos in resultado.get("ediciones", {}).items():
+        print(f"  {'editar: ' + nombre:<22} p50={datos['p50_s']}s  p95={datos['p95_s']}s  llamadas={datos['llamadas']}")
+    if resultado["sintetizadas"]:
+        print(f"  ({resultado['sintetizadas']} respuestas sintéticas: no había grabación en bench/fixtures)")
+
+
+def _metricas(resultado):
+    metricas = {}
+    for nombre, valor in resultado.get("importacion", {}).items():
+        metricas[f"importacion.{nombre}"] = valor
+    for nombre, valor in resultado.get("preparacion", {}).items():
+        metricas[f"preparacion.{nombre}_s"] = valor
+    for nombre, datos in resultado.get("herramientas", {}).items():
+        metricas[f"{nombre}.p50_s"] = datos["p50_s"]
+        metricas[f"{nombre}.p95_s"] = datos["p95_s"]
+    if resultado.get("rutas"):
+        metricas["rutas.bloque_s"] = resultado["rutas"]["bloque"]["total_s"]
+        metricas["rutas.aceleracion"] = resultado["rutas"]["aceleracion_total"]
+    itinerarios = resultado.get("itinerarios")
+    if itinerarios:
+        for clave in ("p50_s", "p95_s", "tokens_prompt", "tokens_respuesta", "tokens_ahorrados", "memoria_pico_mb"):
+            metricas[f"itinerario.{clave}"] = itinerarios.get(clave)
+        for proveedor, n in itinerarios["llamadas"].items():
+            metricas[f"itinerario.llamadas.{proveedor}"] = n
+    for nombre, datos in resultado.get("ediciones", {}).items():
+        metricas[f"edicion.{nombre}.p50_s"] = datos["p50_s"]
+        for proveedor, n in datos["llamadas"].items():
+            metricas[f"edicion.{nombre}.llamadas.{proveedor}"] = n
+    return metricas
+
+
+def comparar(ruta_a, ruta_b):
+    with open(ruta_a, encoding="utf-8") as f:
+        a = json.load(f)
+    with open(ruta_b, encoding="utf-8") as f:
+        b = json.load(f)
+    for clave in ("corpus", "modo", "escala"):
+        if a.get(clave) != b.get(clave):
+            print(f"Aviso: {clave} distinto ({a.get(clave)} vs {b.get(clave)}), la comparación no es directa")
+    metricas_a, metricas_b = _metricas(a), _metricas(b)
+    print(f"{'métrica':<40} {a['commit']:>12} {b['commit']:>12} {'cambio':>9}")
+    for nombre in sorted(set(metricas_a) | set(metricas_b)):
+        va, vb = metricas_a.get(nombre), metricas_b.get(nombre)
+        cambio = f"{(vb - va) / va * 100:+.1f}%" if va and vb is not None else ""
+        print(f"{nombre:<40} {str(va):>12} {str(vb):>12} {cambio:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--modo", default="directo", choices=("directo", "paralelo", "secuencial"))
+    parser.add_argument("--repeticiones", type=int, default=1, help="pasadas del corpus completo por generar_itinerario")
+    parser.add_argument("--escala", type=float, default=1.0, help="multiplicador de las latencias simuladas (0 = sin espera)")
+    parser.add_argument("--latencia-serper", type=float, default=0.25)
+    parser.add_argument("--latencia-amadeus", type=float, default=0.6)
+    parser.add_argument("--latencia-llm", type=float, default=0.4, help="segundos hasta el primer token")
+    parser.add_argument("--latencia-token", type=float, default=0.002, help="segundos por token generado")
+    parser.add_argument("--dias-flexibles", type=int, default=0)
+    parser.add_argument("--solo", choices=("herramientas", "rutas", "itinerarios", "ediciones"))
+    parser.add_argument("--salida", default=RESULTADOS_DIR)
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DESPUES"))
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    viajes, huella_corpus = cargar_corpus(args.corpus)
+    servidores = (
+        SerperFalso(args.latencia_serper, args.escala).iniciar(),
+        AmadeusFalso(args.latencia_amadeus, args.escala).iniciar(),
+        LLMFalso(args.latencia_llm, args.escala, args.latencia_token).iniciar(),
+    )
+    commit, sucio = commit_actual()
+    with tempfile.TemporaryDirectory(prefix="bench-cache-") as cache_dir:
+        configurar_entorno(servidores, args, cache_dir)
+        import arranque
+        importacion = {
+            "app_s": arranque.medir_importacion(arranque.MODULOS_APP),
+            "itinerario_s": arranque.medir_importacion(arranque.MODULOS_APP + arranque.MODULOS_ITINERARIO),
+        }
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        # Se importa acá para medir el arranque con la configuración del benchmark
+        importlib.import_module("agents")
+        importacion["en_proceso_s"] = round(time.perf_counter() - inicio, 4)
+        medidor = Medidor(servidores)
+
+        resultado = {
+            "commit": commit,
+            "sucio": sucio,
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "corpus": huella_corpus,
+            "viajes": len(viajes),
+            "modo": args.modo,
+            "escala": args.escala,
+            "latencias": {"serper": args.latencia_serper, "amadeus": args.latencia_amadeus,
+                          "llm": args.latencia_llm, "token": args.latencia_token},
+            "importacion": importacion,
+            "preparacion": arranque.medir_preparacion(),
+            "herramientas": {},
+        }
+        if args.solo in (None, "herramientas"):
+            resultado["herramientas"] = medir_herramientas(viajes, servidores)
+        if args.solo in (None, "rutas"):
+            resultado["rutas"] = medir_rutas(viajes, servidores, args.dias_flexibles)
+        if args.solo in (None, "itinerarios"):
+            resultado["itinerarios"] = medir_itinerarios(viajes, servidores, args.modo, args.repeticiones)
+        if args.solo in (None, "ediciones"):
+            resultado["ediciones"] = medir_ediciones(viajes, servidores, args.modo)
+        tracemalloc.stop()
+        resultado["sintetizadas"] = medidor.diferencia()["sintetizadas"]
+        resultado["rss_max_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    for servidor in servidores:
+        servidor.detener()
+
+    imprimir(resultado)
+    os.makedirs(args.salida, exist_ok=True)
+    ruta = os.path.join(args.salida, f"{commit}{'-sucio' if sucio else ''}-{args.modo}.json")
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=1)
+    print(f"Resultados guardados en {ruta}")
+
+
+if __name__ == "__main__":
+    main()
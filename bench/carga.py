@@ -0,0 +1,165 @@
+"""Prueba de carga de las herramientas: un hilo por llamada frente a corrutinas.
+
+Levanta los servidores locales de Serper y Amadeus (ver bench/servidores.py) con
+una latencia fija y lanza búsquedas distintas, sin caché, de dos formas:
+
+  - hilos: `_run` en un ThreadPoolExecutor, un hilo bloqueado por llamada en curso,
+  - async: `_arun` con asyncio.gather en un único event loop y un solo hilo.
+
+Por cada forma informa búsquedas por segundo, p50/p95 de latencia y la cantidad
+de hilos del proceso.
+
+    python bench/carga.py
+    python bench/carga.py --llamadas 2000 --hilos 32 --concurrencia 256 --latencia 0.3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+from benchmark import resumir  # noqa: E402
+from servidores import AmadeusFalso, SerperFalso  # noqa: E402
+
+DESTINOS = ("JFK", "CDG", "FCO", "LIS", "BCN", "AMS", "BER", "LHR", "ATH", "PRG")
+
+
+def configurar_entorno(serper, amadeus, conexiones):
+    """Apunta las herramientas a los servidores locales. Debe correr antes de importar src/."""
+    os.environ.update({
+        "SERPER_URL": f"{serper.url}/search",
+        "SERPER_API_KEY": "bench",
+        "AMADEUS_API_KEY": "bench",
+        "AMADEUS_API_SECRET": "bench",
+        "AMADEUS_HOST": f"127.0.0.1:{amadeus.puerto}",
+        "AMADEUS_SSL": "0",
+        "LIMITES_COMPARTIDOS": "0",
+        "LIMITE_AMADEUS": "100000,100000",
+        "LIMITE_SERPER": "100000,100000",
+        # El pool no debe ser el cuello de botella de ninguna de las dos formas
+        "HTTP_POOL_HOSTS": "2",
+        "HTTP_POOL_POR_HOST": str(conexiones),
+        "TRAZAS_ACTIVAS": "0",
+    })
+    sys.path.insert(0, RAIZ)
+    sys.path.insert(0, os.path.join(RAIZ, "src"))
+
+
+def armar_consultas(llamadas):
+    """Mitad búsquedas web y mitad de vuelos, todas distintas para que ninguna se resuelva en memoria."""
+    salida = date.today() + timedelta(days=60)
+    consultas = []
+    for i in range(llamadas):
+        if i % 2:
+            fecha = salida + timedelta(days=i // (2 * len(DESTINOS)))
+            consultas.append(("vuelos", f"MAD,{DESTINOS[i // 2 % len(DESTINOS)]},{fecha.isoformat()}"))
+        else:
+            consultas.append(("web", f"qué hacer en la ciudad {i}"))
+    return consultas
+
+
+def _cronometrar(funcion, consulta, latencias):
+    inicio = time.perf_counter()
+    resultado = funcion(consulta)
+    latencias.append(time.perf_counter() - inicio)
+    return resultado
+
+
+def medir_hilos(herramientas, consultas, hilos):
+    latencias, maximo_hilos = [], threading.active_count()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="carga") as executor:
+        futuros = [executor.submit(_cronometrar, herramientas[tipo]._run, consulta, latencias)
+                   for tipo, consulta in consultas]
+        for futuro in futuros:
+            futuro.result()
+            maximo_hilos = max(maximo_hilos, threading.active_count())
+    return inicio, latencias, maximo_hilos, [f.result() for f in futuros]
+
+
+async def _cronometrar_async(funcion, consulta, latencias, semaforo):
+    async with semaforo:
+        inicio = time.perf_counter()
+        resultado = await funcion(consulta)
+        latencias.append(time.perf_counter() - inicio)
+        return resultado
+
+
+async def _medir_async(herramientas, consultas, concurrencia):
+    from conexiones import cerrar_cliente_http_async
+
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias = []
+    inicio = time.perf_counter()
+    try:
+        resultados = await asyncio.gather(*(
+            _cronometrar_async(herramientas[tipo]._arun, consulta, latencias, semaforo) for tipo, consulta in consultas
+        ))
+    finally:
+        await cerrar_cliente_http_async()
+    return inicio, latencias, threading.active_count(), resultados
+
+
+def medir(nombre, correr, servidores, consultas):
+    llamadas_antes = sum(sum(s.llamadas.values()) for s in servidores)
+    inicio, latencias, hilos, resultados = correr()
+    segundos = time.perf_counter() - inicio
+    errores = sum(1 for r in resultados if str(r).startswith("Error"))
+    return dict(
+        resumir(latencias),
+        forma=nombre,
+        segundos=round(segundos, 3),
+        por_segundo=round(len(consultas) / segundos, 1),
+        hilos=hilos,
+        errores=errores,
+        llamadas_servidores=sum(sum(s.llamadas.values()) for s in servidores) - llamadas_antes,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llamadas", type=int, default=1000, help="búsquedas por forma (mitad web, mitad vuelos)")
+    parser.add_argument("--hilos", type=int, default=32, help="hilos del ThreadPoolExecutor en la forma sincrónica")
+    parser.add_argument("--concurrencia", type=int, default=256, help="búsquedas en curso a la vez en la forma async")
+    parser.add_argument("--latencia", type=float, default=0.2, help="segundos que tarda cada respuesta simulada")
+    parser.add_argument("--json", action="store_true", help="imprimir el resultado como JSON")
+    args = parser.parse_args()
+
+    servidores = (SerperFalso(args.latencia).iniciar(), AmadeusFalso(args.latencia).iniciar())
+    configurar_entorno(*servidores, conexiones=max(args.hilos, args.concurrencia))
+    from tools import BuscadorVuelos, BuscadorWeb
+
+    herramientas = {"web": BuscadorWeb(usar_cache=False), "vuelos": BuscadorVuelos(usar_cache=False)}
+    consultas = armar_consultas(args.llamadas)
+    try:
+        filas = [
+            medir(f"hilos ({args.hilos})", lambda: medir_hilos(herramientas, consultas, args.hilos),
+                  servidores, consultas),
+            medir(f"async ({args.concurrencia})",
+                  lambda: asyncio.run(_medir_async(herramientas, consultas, args.concurrencia)),
+                  servidores, consultas),
+        ]
+    finally:
+        for servidor in servidores:
+            servidor.detener()
+
+    if args.json:
+        print(json.dumps(filas, indent=1))
+        return
+    print(f"{args.llamadas} búsquedas, latencia simulada {args.latencia} s")
+    print(f"{'forma':<14}{'búsq/s':>9}{'p50 s':>9}{'p95 s':>9}{'hilos':>7}{'errores':>9}")
+    for fila in filas:
+        print(f"{fila['forma']:<14}{fila['por_segundo']:>9}{fila['p50_s']:>9}{fila['p95_s']:>9}"
+              f"{fila['hilos']:>7}{fila['errores']:>9}")
+    print(f"Aceleración async/hilos: {filas[1]['por_segundo'] / filas[0]['por_segundo']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Graba las respuestas reales de Serper y Amadeus para las consultas del corpus.
+
+Usa las claves del archivo .env y guarda cada respuesta en bench/fixtures, con
+el mismo nombre que buscan los servidores locales de bench/servidores.py. Las
+consultas que ya tienen grabación se saltean salvo con --regrabar.
+
+    python bench/grabar.py
+"""
+import argparse
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "src"))
+
+from benchmark import CORPUS, cargar_corpus  # noqa: E402
+from servidores import clave_fixture, guardar_fixture, leer_fixture  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--regrabar", action="store_true", help="volver a pedir las consultas ya grabadas")
+    args = parser.parse_args()
+
+    import prefetch
+    from config import SERPER_API_KEY, SERPER_URL
+    from conexiones import TIMEOUT, obtener_cliente_amadeus, obtener_sesion
+    from rutas import consultas_tramos
+
+    viajes, _ = cargar_corpus(args.corpus)
+    consultas_web, consultas_vuelos = set(), set()
+    for viaje in viajes:
+        consultas_web.update(prefetch.calcular_consultas_actividades(viaje["destinos"], viaje["preferencias"]).values())
+        for tipos in prefetch.calcular_consultas_hoteles(viaje["destinos"]).values():
+            consultas_web.update(tipos.values())
+        for tramo in prefetch.calcular_tramos(viaje["origen"], viaje["destinos"], viaje["fecha_inicio"], viaje["fecha_fin"]):
+            resuelto = prefetch._tramo_flexible(tramo)
+            if resuelto is not None:
+                consultas_vuelos.update(consultas_tramos([resuelto[0]]))
+
+    grabadas = 0
+    for consulta in sorted(consultas_web):
+        clave = clave_fixture(consulta)
+        if not args.regrabar and leer_fixture("serper", clave) is not None:
+            continue
+        respuesta = obtener_sesion().post(SERPER_URL, json={"q": consulta, "num": 3}, timeout=TIMEOUT,
+                                          headers={"X-API-KEY": SERPER_API_KEY})
+        respuesta.raise_for_status()
+        guardar_fixture("serper", clave, respuesta.json())
+        grabadas += 1
+
+    amadeus = obtener_cliente_amadeus()
+    for origen, destino, fecha in sorted(consultas_vuelos):
+        clave = clave_fixture(origen, destino, fecha)
+        if not args.regrabar and leer_fixture("amadeus_vuelos", clave) is not None:
+            continue
+        respuesta = amadeus.shopping.flight_offers_search.get(
+            originLocationCode=origen, destinationLocationCode=destino, departureDate=fecha, adults=1, max=5
+        )
+        guardar_fixture("amadeus_vuelos", clave, respuesta.result)
+        grabadas += 1
+
+    print(f"{grabadas} respuestas grabadas en {os.path.join(BENCH_DIR, 'fixtures')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Servidores locales que reemplazan a Serper, Amadeus y el LLM durante los benchmarks.
+
+Cada servidor responde con la grabación de bench/fixtures si existe (ver
+bench/grabar.py) y, si no, con una respuesta sintética determinista derivada
+de la consulta. Las latencias simuladas se multiplican por `escala`, así que
+escala=0 mide solo el costo propio de la aplicación.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+AEROLINEAS = ("IB", "UX", "VY", "AF", "LH", "KL", "TP", "AZ")
+PATRON_DIAS = re.compile(r"(\d+)\s*días")
+PATRON_FINAL_ANSWER = re.compile(r"Final Answer:")
+
+
+def clave_fixture(*partes):
+    """Nombre de archivo estable para una consulta (el mismo que usa bench/grabar.py)."""
+    texto = "|".join(str(p).strip().lower() for p in partes)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def leer_fixture(tipo, clave):
+    ruta = os.path.join(FIXTURES_DIR, tipo, f"{clave}.json")
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_fixture(tipo, clave, datos):
+    directorio = os.path.join(FIXTURES_DIR, tipo)
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, f"{clave}.json"), "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=1)
+
+
+def _azar(*partes):
+    return random.Random(hashlib.sha1("|".join(map(str, partes)).encode("utf-8")).digest())
+
+
+def sintetizar_serper(consulta):
+    azar = _azar("serper", consulta)
+    return {
+        "searchParameters": {"q": consulta, "type": "search"},
+        "organic": [
+            {
+                "title": f"{consulta.title()} - guía {i + 1}",
+                "link": f"https://ejemplo.com/{clave_fixture(consulta, i)}",
+                "snippet": " ".join(azar.choice(("Visitá", "Descubrí", "Recorré", "Probá", "Reservá"))
+                                    + f" opción {azar.randint(1, 99)} en {consulta}" for _ in range(3)),
+                "position": i + 1,
+            }
+            for i in range(3)
+        ],
+    }
+
+
+def sintetizar_ofertas(origen, destino, fecha, cantidad=5):
+    azar = _azar("amadeus", origen, destino, fecha)
+    salida_base = datetime.strptime(fecha, "%Y-%m-%d")
+    ofertas = []
+    for _ in range(cantidad):
+        salida = salida_base + timedelta(hours=azar.randint(6, 20), minutes=azar.choice((0, 15, 30, 45)))
+        escalas = azar.choice((0, 0, 1))
+        puntos = [origen] + ["FRA"] * escalas + [destino]
+        segmentos = []
+        momento = salida
+        for desde, hasta in zip(puntos, puntos[1:]):
+            llegada = momento + timedelta(minutes=azar.randint(60, 480))
+            segmentos.append({
+                "departure": {"iataCode": desde, "at": momento.strftime("%Y-%m-%dT%H:%M:%S")},
+                "arrival": {"iataCode": hasta, "at": llegada.strftime("%Y-%m-%dT%H:%M:%S")},
+                "carrierCode": azar.choice(AEROLINEAS),
+                "number": str(azar.randint(100, 9999)),
+            })
+            momento = llegada + timedelta(minutes=azar.randint(45, 180))
+        minutos = int((llegada - salida).total_seconds() // 60)
+        ofertas.append({
+            "type": "flight-offer",
+            "price": {"currency": "EUR", "total": f"{azar.uniform(40, 900):.2f}"},
+            "itineraries": [{"duration": f"PT{minutos // 60}H{minutos % 60}M", "segments": segmentos}],
+        })
+    return {"meta": {"count": len(ofertas)}, "data": ofertas}
+
+
+def sintetizar_ubicaciones(palabra):
+    return {"data": [{"type": "location", "subType": "CITY", "name": palabra, "iataCode": palabra[:3].upper()}]}
+
+
+def sintetizar_itinerario(prompt):
+    """Itinerario determinista con un bloque por día, de largo proporcional al viaje."""
+    coincidencia = PATRON_DIAS.search(prompt)
+    dias = int(coincidencia.group(1)) if coincidencia else 3
+    azar = _azar("llm", prompt)
+    lineas = [f"# Itinerario de {dias} días\n"]
+    for dia in range(1, dias + 1):
+        lineas.append(f"## Día {dia}\n")
+        for momento in ("Mañana", "Tarde", "Noche"):
+            lineas.append(f"- **{momento}:** actividad {azar.randint(1, 999)} con traslado a pie y tips locales.\n")
+    lineas.append("\n## Presupuesto estimado\n- Total aproximado: 1.500 EUR\n")
+    return "".join(lineas)
+
+
+class _Servidor(ThreadingHTTPServer):
+    # La cola por defecto (5) descarta conexiones en las pruebas de carga
+    request_queue_size = 1024
+
+
+class ServidorFalso:
+    """Servidor HTTP en un hilo que cuenta las llamadas recibidas por endpoint."""
+
+    nombre = ""
+
+    def __init__(self, latencia=0.0, escala=1.0):
+        self.latencia = latencia
+        self.escala = escala
+        self.llamadas = Counter()
+        self.sintetizadas = 0
+        self._lock = threading.Lock()
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                servidor._atender(self, "GET")
+
+            def do_POST(self):
+                servidor._atender(self, "POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = _Servidor(("127.0.0.1", 0), Manejador)
+        self.httpd.daemon_threads = True
+        self._hilo = threading.Thread(target=self.httpd.serve_forever, name=f"falso-{self.nombre}", daemon=True)
+
+    @property
+    def puerto(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.puerto}"
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def contar(self, endpoint, sintetizada=False):
+        with self._lock:
+            self.llamadas[endpoint] += 1
+            self.sintetizadas += sintetizada
+
+    def dormir(self, segundos):
+        if segundos * self.escala > 0:
+            time.sleep(segundos * self.escala)
+
+    def _atender(self, peticion, metodo):
+        url = urlparse(peticion.path)
+        largo = int(peticion.headers.get("Content-Length") or 0)
+        cuerpo = peticion.rfile.read(largo) if largo else b""
+        try:
+            self.atender(peticion, metodo, url.path, parse_qs(url.query), cuerpo)
+        except Exception as e:
+            self.responder(peticion, {"error": str(e)}, estado=500)
+
+    def atender(self, peticion, metodo, ruta, parametros, cuerpo):
+        raise NotImplementedError
+
+    def responder(self, peticion, datos, estado=200, tipo="application/json"):
+        contenido = json.dumps(datos).encode("utf-8")
+        peticion.send_response(estado)
+        peticion.send_header("Content-Type", tipo)
+        peticion.send_header("Content-Length", str(len(contenido)))
+        peticion.end_headers()
+        peticion.wfile.write(contenido)
+
+
+class SerperFalso(ServidorFalso):
+    nombre = "serper"
+
+    def atender(self, peticion, metodo, ruta, parametros, cuerpo):
+        consulta = json.loads(cuerpo or b"{}").get("q", "")
+        datos = leer_fixture("serper", clave_fixture(consulta))
+        self.contar("search", sintetizada=datos is None)
+        self.dormir(self.latencia)
+        self.responder(peticion, datos if datos is not None else sintetizar_serper(consulta))
+
+
+class AmadeusFalso(ServidorFalso):
+    nombre = "amadeus"
+    TIPO = "application/vnd.amadeus+json"
+
+    def atender(self, peticion, metodo, ruta, parametros, cuerpo):
+        valor = lambda nombre: parametros.get(nombre, [""])[0]
+        if ruta.endswith("/oauth2/token"):
+            self.contar("token")
+            self.responder(peticion, {"type": "amadeusOAuth2Token", "access_token": "bench",
+                                      "token_type": "Bearer", "expires_in": 1799}, tipo="application/json")
+            return
+        if ruta == "/v2/shopping/flight-offers":
+            origen, destino, fecha = valor("originLocationCode"), valor("destinationLocationCode"), valor("departureDate")
+            datos = leer_fixture("amadeus_vuelos", clave_fixture(origen, destino, fecha))
+            self.contar("flight-offers", sintetizada=datos is None)
+            self.dormir(self.latencia)
+            self.responder(peticion, datos if datos is not None else sintetizar_ofertas(origen, destino, fecha),
+                           tipo=self.TIPO)
+            return
+        if ruta == "/v1/reference-data/locations":
+            palabra = valor("keyword")
+            datos = leer_fixture("amadeus_ubicaciones", clave_fixture(palabra))
+            self.contar("locations", sintetizada=datos is None)
+            self.dormir(self.latencia)
+            self.responder(peticion, datos if datos is not None else sintetizar_ubicaciones(palabra), tipo=self.TIPO)
+            return
+        self.responder(peticion, {"errors": [{"status": 404, "detail": ruta}]}, estado=404, tipo=self.TIPO)
+
+
+class LLMFalso(ServidorFalso):
+    """Endpoint /chat/completions compatible con OpenAI, con respuestas deterministas.
+
+    Si el prompt es de CrewAI (pide un "Final Answer:") responde directamente en ese
+    formato, sin usar herramientas. Las fichas de uso se estiman como caracteres / 4
+    para que el conteo sea reproducible sin depender de un tokenizador.
+    """
+
+    nombre = "llm"
+
+    def __init__(self, latencia=0.0, escala=1.0, latencia_token=0.0):
+        super().__init__(latencia, escala)
+        self.latencia_token = latencia_token
+        self.tokens = Counter()
+
+    def atender(self, peticion, metodo, ruta, parametros, cuerpo):
+        solicitud = json.loads(cuerpo or b"{}")
+        mensajes = solicitud.get("messages", [])
+        prompt = "\n".join(str(m.get("content") or "") for m in mensajes)
+        texto = sintetizar_itinerario(prompt)
+        if PATRON_FINAL_ANSWER.search(prompt):
+            texto = f"Thought: I now know the final answer\nFinal Answer: {texto}"
+        tokens_prompt, tokens_respuesta = len(prompt) // 4, len(texto) // 4
+        self.contar("chat")
+        with self._lock:
+            self.tokens["prompt"] += tokens_prompt
+            self.tokens["respuesta"] += tokens_respuesta
+        self.dormir(self.latencia)
+        modelo = solicitud.get("model", "bench")
+        if not solicitud.get("stream"):
+            self.dormir(self.latencia_token * tokens_respuesta)
+            self.responder(peticion, {
+                "id": "bench", "object": "chat.completion", "created": 0, "model": modelo,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": texto}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": tokens_prompt, "completion_tokens": tokens_respuesta,
+                          "total_tokens": tokens_prompt + tokens_respuesta},
+            })
+            return
+
+        peticion.send_response(200)
+        peticion.send_header("Content-Type", "text/event-stream")
+        peticion.end_headers()
+        lineas = texto.splitlines(keepends=True)
+        for i, linea in enumerate(lineas):
+            self.dormir(self.latencia_token * max(1, len(linea) // 4))
+            fragmento = {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": modelo,
+                         "choices": [{"index": 0, "delta": {"content": linea},
+                                      "finish_reason": "stop" if i == len(lineas) - 1 else None}]}
+            peticion.wfile.write(f"data: {json.dumps(fragmento)}\n\n".encode("utf-8"))
+            peticion.wfile.flush()
+        peticion.wfile.write(b"data: [DONE]\n\n")
+        peticion.wfile.flush()
+        peticion.close_connection = True
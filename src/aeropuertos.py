@@ -0,0 +1,171 @@
+"""Índice local de ciudades y aeropuertos para resolver códigos IATA sin LLM ni llamadas web.
+
+Los datos están en `datos/aeropuertos.tsv`, una línea por clave de búsqueda:
+
+    clave<TAB>rango<TAB>ciudad<TAB>país<TAB>código_ciudad<TAB>aeropuertos
+
+La clave es el nombre normalizado (sin acentos, en minúsculas, solo letras,
+números y espacios) y el rango ordena las ciudades que comparten clave (ej:
+"cordoba"). El archivo DEBE estar ordenado: se abre con mmap y se busca por
+bisección sin cargarlo en memoria. Después de editarlo, ordenarlo con:
+
+    python src/aeropuertos.py ordenar
+"""
+import difflib
+import mmap
+import os
+import re
+import sys
+import threading
+import unicodedata
+from array import array
+from dataclasses import dataclass
+
+# "Ciudad, País" o "Ciudad (País)"
+PATRON_PAIS = re.compile(r"(.*?)\s*(?:,\s*(.+)|\((.+)\))?")
+
+RUTA_DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "aeropuertos.tsv")
+
+
+@dataclass(slots=True, frozen=True)
+class Ubicacion:
+    ciudad: str
+    pais: str
+    codigo: str  # código IATA de la ciudad (cubre todos sus aeropuertos)
+    aeropuertos: tuple
+
+
+def normalizar(texto):
+    """Clave de búsqueda: sin acentos, en minúsculas y solo letras, números y espacios."""
+    texto = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", texto.casefold()).split())
+
+
+class IndiceAeropuertos:
+    """Búsqueda exacta, por prefijo y aproximada sobre el archivo de aeropuertos.
+
+    El archivo se abre recién en la primera búsqueda, así el arranque no paga su costo.
+    """
+
+    def __init__(self, ruta=RUTA_DATOS):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._datos = None
+        self._inicios = None
+        self._claves = None
+
+    def _cargar(self):
+        if self._datos is None:
+            with self._lock:
+                if self._datos is None:
+                    with open(self.ruta, "rb") as archivo:
+                        datos = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+                    # Posición de inicio de cada línea, para poder bisecar
+                    inicios = array("L", [0])
+                    fin = datos.find(b"\n")
+                    while fin != -1 and fin + 1 < len(datos):
+                        inicios.append(fin + 1)
+                        fin = datos.find(b"\n", fin + 1)
+                    self._inicios = inicios
+                    self._datos = datos
+        return self._datos
+
+    def _clave(self, i):
+        inicio = self._inicios[i]
+        return self._datos[inicio:self._datos.find(b"\t", inicio)]
+
+    def _fila(self, i):
+        inicio = self._inicios[i]
+        fin = self._datos.find(b"\n", inicio)
+        _, _, ciudad, pais, codigo, aeropuertos = self._datos[inicio:fin].decode("utf-8").split("\t")
+        return Ubicacion(ciudad, pais, codigo, tuple(aeropuertos.split(",")))
+
+    def _primera(self, clave):
+        # Primera línea cuya clave es >= `clave`
+        bajo, alto = 0, len(self._inicios)
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._clave(medio) < clave:
+                bajo = medio + 1
+            else:
+                alto = medio
+        return bajo
+
+    def exacto(self, texto):
+        """Todas las ubicaciones cuya clave coincide exactamente, ordenadas por rango."""
+        self._cargar()
+        clave = normalizar(texto).encode("utf-8")
+        encontradas = []
+        i = self._primera(clave)
+        while i < len(self._inicios) and self._clave(i) == clave:
+            encontradas.append(self._fila(i))
+            i += 1
+        return encontradas
+
+    def prefijo(self, texto, limite=5):
+        """Ubicaciones cuya clave empieza con `texto`, sin repetir ciudades."""
+        self._cargar()
+        clave = normalizar(texto).encode("utf-8")
+        encontradas = []
+        i = self._primera(clave)
+        while i < len(self._inicios) and len(encontradas) < limite and self._clave(i).startswith(clave):
+            fila = self._fila(i)
+            if fila not in encontradas:
+                encontradas.append(fila)
+            i += 1
+        return encontradas
+
+    def aproximado(self, texto, limite=5):
+        """Ubicaciones con claves parecidas a `texto` (tolera errores de tipeo)."""
+        self._cargar()
+        if self._claves is None:
+            self._claves = list(dict.fromkeys(self._clave(i).decode("utf-8") for i in range(len(self._inicios))))
+        parecidas = difflib.get_close_matches(normalizar(texto), self._claves, n=limite, cutoff=0.8)
+        return [fila for clave in parecidas for fila in self.exacto(clave)][:limite]
+
+    def buscar(self, texto, limite=5):
+        """Busca una ciudad probando coincidencia exacta, por prefijo y aproximada, en ese orden.
+
+        Acepta "Ciudad, País" o "Ciudad (País)" para desambiguar (ej: "Córdoba (España)").
+        """
+        ciudad, pais_coma, pais_parentesis = PATRON_PAIS.fullmatch(texto.strip()).groups()
+        pais = (pais_coma or pais_parentesis or "").strip()
+        for buscar in (self.exacto, self.prefijo, self.aproximado):
+            encontradas = buscar(ciudad)
+            if pais:
+                encontradas = [u for u in encontradas if normalizar(u.pais) == normalizar(pais)]
+            if encontradas:
+                return encontradas[:limite]
+        return []
+
+    def resolver(self, texto):
+        """La ubicación más probable para `texto`, o None si no está en el índice."""
+        encontradas = self.buscar(texto, limite=1)
+        return encontradas[0] if encontradas else None
+
+
+indice = IndiceAeropuertos()
+
+
+def buscar(texto, limite=5):
+    return indice.buscar(texto, limite)
+
+
+def resolver(texto):
+    return indice.resolver(texto)
+
+
+def ordenar(ruta=RUTA_DATOS):
+    """Ordena el archivo de datos después de editarlo a mano."""
+    with open(ruta, encoding="utf-8") as archivo:
+        lineas = sorted(linea for linea in archivo if linea.strip())
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        archivo.writelines(lineas)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["ordenar"]:
+        ordenar()
+    else:
+        for ubicacion in buscar(" ".join(sys.argv[1:])):
+            print(f"{ubicacion.codigo}\t{ubicacion.ciudad}, {ubicacion.pais}\t{','.join(ubicacion.aeropuertos)}")
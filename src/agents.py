@@ -1,108 +1,215 @@
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from functools import partial
+import queue
+import threading
+import time
 from crewai import Agent, Task, Crew , Process
-from config import llm
-from tools import BuscadorWeb, BuscadorVuelos
-from datetime import datetime
+from config import (MODO_PLANIFICACION, TIMEOUT_RAMA, CACHE_ITINERARIOS_TTL, CACHE_ITINERARIOS_MAX_ENTRADAS,
+                    AGENTES_VERBOSE, AGENTES_EN_CACHE, PROMPT_MAX_TOKENS)
+from modelo_llm import llm, completar_en_stream, contar_tokens
+from cache import CacheDisco, clave_viaje
+from trazas import acumular, evento, propagar, registrar, span
+from tools import obtener_buscador_web, obtener_buscador_vuelos
+from prefetch import recopilar_datos, formatear_datos, describir_codigos
+from prompts import Plantilla, ajustar_secciones
+import conocimiento
 
-# Función para generar el itinerario
-def generar_itinerario(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias):
+# Itinerarios ya generados, para servir al instante las solicitudes repetidas
+cache_itinerarios = CacheDisco(
+    "itinerarios", ttl=CACHE_ITINERARIOS_TTL, max_entradas=CACHE_ITINERARIOS_MAX_ENTRADAS
+)
 
-    # Definir agentes 
-    agente_actividades = Agent(
-        role="Buscador de Actividades",
-        goal="Encontrar actividades turísticas basadas en las preferencias del usuario.",
-        backstory=(f"""Basado en las preferencias del usuario: '{preferencias}', **busca las actividades turísticas MÁS POPULARES y RECONOCIDAS** en las siguientes ciudades: {destinos} para un viaje de {dias} días.
+_ROL_COORDINADOR = (
+        "Sos el Manager y Planificador de Viajes principal. Tu función es COORDINAR a los agentes: para buscar actividades recreativas debes delegar al 'Buscador de Actividades', para buscar transportes debes delegar al 'Buscador de Transportes' y para buscar hoteles debes delegar al 'Buscador de Hoteles'. " 
+        "Recibís la información de ellos y la USÁS para crear un itinerario detallado y atractivo. " 
+        "Una vez que recibas informacion de vuelos, hoteles y actividades, presenta los datos de forma ordenada y DETENÉ LA BÚSQUEDA INMEDIATAMENTE. NO REALICES BÚSQUEDAS ADICIONALES BAJO NINGUNA CIRCUNSTANCIA."
+)
+
+_ROL_PLANIFICADOR = (
+        "Sos el Planificador de Viajes principal. Recibís la información de actividades, transportes y hoteles ya recopilada por los otros agentes "
+        "y la USÁS para crear un itinerario detallado y atractivo. NO REALICES BÚSQUEDAS ADICIONALES BAJO NINGUNA CIRCUNSTANCIA."
+)
+
+
+def registrar_paso(paso):
+    # Cada paso de un agente (acción con herramienta o respuesta final) queda en la traza
+    evento(type(paso).__name__, "agente", herramienta=getattr(paso, "tool", None))
+
+
+# Los agentes no dependen de la solicitud: los datos de cada viaje van en la
+# descripción de las tareas (o en la delegación del coordinador)
+_BACKSTORY_ACTIVIDADES = Plantilla("""Basado en las preferencias del usuario, **busca las actividades turísticas MÁS POPULARES y RECONOCIDAS** en las ciudades que te indiquen.
         **Genera una lista CONCISA de las actividades MÁS POPULARES por ciudad.**
-        **Debes tener en cuenta que el usuario está buscando actividades para un viaje de {dias} días, debes buscar una cantidad de actividades acorde a la cantidad de dias.**
+        **Debes tener en cuenta la cantidad de días del viaje y buscar una cantidad de actividades acorde.**
         **NO incluyas detalles como horarios, precios, requisitos o información de transporte.**
-        Simplemente enumera las atracciones principales que un turista debería considerar visitar en cada ciudad."""),
-    tools=[BuscadorWeb()],
+        Simplemente enumera las atracciones principales que un turista debería considerar visitar en cada ciudad.""")
+
+_DATOS_ACTIVIDADES = Plantilla(
+    "Buscá las actividades turísticas más populares en {destinos} para un viaje de {dias} días, "
+    "según las preferencias: {preferencias}."
+)
+
+
+def crear_agente_actividades():
+    return Agent(
+        role="Buscador de Actividades",
+        goal="Encontrar actividades turísticas basadas en las preferencias del usuario.",
+        backstory=_BACKSTORY_ACTIVIDADES.formatear(),
+    tools=[obtener_buscador_web()],
     llm=llm,
-    verbose=True,
+    verbose=AGENTES_VERBOSE,
+    step_callback=registrar_paso,
     allow_delegation=False,
     max_iter=3
     )
 
-    agente_vuelos = Agent(
-        role="Buscador de Transportes",
-        goal="Encontrar vuelos para los traslados especificados. **Encontrar una opción para cada traslado (ida y vuelta y entre ciudades).** Si es un vuelo, debes explicitar el nombre del vuelo.", 
-        backstory=(f"""Encuentra una opcion de vuelo de ida desde {origen} a {destinos[0]}, y de vuelta desde {destinos[-1]} a {origen} (si no está disponible por alguna razón, entonces encuentra una forma de volver a {destinos[0]} y de ahí a {origen}) para el {fecha_inicio.strftime('%Y-%m-%d')} y {fecha_fin.strftime('%Y-%m-%d')}.
-        También encuentra una opcion de transporte de viaje entre ciudades de destino según itinerario (si hay más de uno): {destinos}.
+
+_BACKSTORY_VUELOS = Plantilla("""Encuentra una opcion de vuelo de ida desde el origen a la primera ciudad de destino, y de vuelta desde la última ciudad de destino al origen (si no está disponible por alguna razón, entonces encuentra una forma de volver a la primera ciudad y de ahí al origen).
+        También encuentra una opcion de transporte de viaje entre ciudades de destino según itinerario (si hay más de uno).
         Si no encuentras un vuelo directo, debes buscar un vuelo que te permita llegar al destino, aunque contenga escalas.
     Usa la herramienta buscar_vuelos con códigos IATA de 3 letras para aeropuertos (3 letras, ej: MAD, BCN, JFK) y formato de fecha YYYY-MM-DD.
-    IMPORTANTE: Para la fecha de ida, usa EXACTAMENTE: {fecha_inicio.strftime('%Y-%m-%d')}
-    IMPORTANTE: Para la fecha de vuelta, usa EXACTAMENTE: {fecha_fin.strftime('%Y-%m-%d')}
+    IMPORTANTE: Para las fechas de ida y de vuelta, usa EXACTAMENTE las que te indiquen.
     Ejemplo de uso: 'MAD,JFK,2025-04-24' para buscar vuelos de Madrid a Nueva York el 24 de abril de 2025.
     Encuentra el horario del vuelo, pasaje, aerolinea y precio. **Los vuelos deben ser reales, no debes inventar informacion.** 
     Presenta la información de manera concisa: aerolínea, número de vuelo, horarios aproximados de salida y llegada, y precio.
     IMPORTANTE: busca opciones directas. Si no hay, busca opciones con la menor cantidad de escalas posibles.
-    IMPORTANTE: NO REPITAS LA MISMA BÚSQUEDA. Si ya has realizado una búsqueda para un origen, destino y fecha específicos, NO realices otra búsqueda con los mismos parámetros."""
-    ),
-    tools=[BuscadorWeb(), BuscadorVuelos()],
+    IMPORTANTE: NO REPITAS LA MISMA BÚSQUEDA. Si ya has realizado una búsqueda para un origen, destino y fecha específicos, NO realices otra búsqueda con los mismos parámetros.
+    Si te indican CÓDIGOS IATA YA RESUELTOS, usalos directamente, no los busques.""")
+
+_DATOS_VUELOS = Plantilla(
+    "Buscá una opción de vuelo para cada traslado: ida de {origen} a {primero} el {ida}, "
+    "traslados entre {destinos} (si hay más de un destino) y vuelta de {ultimo} a {origen} el {vuelta}. "
+    "Para la fecha de ida usa EXACTAMENTE {ida} y para la de vuelta EXACTAMENTE {vuelta}. "
+    "CÓDIGOS IATA YA RESUELTOS (usalos directamente, no los busques): {codigos}"
+)
+
+
+def _datos_vuelos(origen, destinos, fecha_inicio, fecha_fin):
+    return _DATOS_VUELOS.formatear(
+        origen=origen, destinos=destinos, primero=destinos[0], ultimo=destinos[-1],
+        ida=fecha_inicio.strftime('%Y-%m-%d'), vuelta=fecha_fin.strftime('%Y-%m-%d'),
+        codigos=describir_codigos([origen] + list(destinos)),
+    )
+
+
+def crear_agente_vuelos():
+    return Agent(
+        role="Buscador de Transportes",
+        goal="Encontrar vuelos para los traslados especificados. **Encontrar una opción para cada traslado (ida y vuelta y entre ciudades).** Si es un vuelo, debes explicitar el nombre del vuelo.", 
+        backstory=_BACKSTORY_VUELOS.formatear(),
+    tools=[obtener_buscador_web(), obtener_buscador_vuelos()],
     llm=llm,
-    verbose=True,
+    verbose=AGENTES_VERBOSE,
+    step_callback=registrar_paso,
     allow_delegation=False,
     max_iter=3
     )
 
-    agente_hoteles = Agent(
-    role="Buscador de Hoteles",
-    goal="Encontrar hoteles para las ciudades en los destinos especificados. Buscar 2 opciones por ciudad (lujosa y económica)",
-    backstory=(f"""Investiga y encuentra enlaces a listas de hoteles lujosos y económicos en cada una de las ciudades de {destinos}. 
+
+_BACKSTORY_HOTELES = Plantilla("""Investiga y encuentra enlaces a listas de hoteles lujosos y económicos en cada una de las ciudades que te indiquen. 
     Proporcioná un enlace para hoteles lujosos y un enlace para hoteles económicos por cada ciudad. 
     **Realizá SOLO UNA BÚSQUEDA por tipo de hotel (lujoso y económico) por ciudad y DETENETE una vez que tengas los enlaces.**
-    No es necesario buscar nombres específicos de hoteles, simplemente entrega los enlaces a las listas relevantes."""
-    ),
-    tools=[BuscadorWeb()],
+    No es necesario buscar nombres específicos de hoteles, simplemente entrega los enlaces a las listas relevantes.""")
+
+_DATOS_HOTELES = Plantilla("Buscá un enlace a hoteles lujosos y uno a hoteles económicos en cada ciudad de {destinos}.")
+
+
+def crear_agente_hoteles():
+    return Agent(
+    role="Buscador de Hoteles",
+    goal="Encontrar hoteles para las ciudades en los destinos especificados. Buscar 2 opciones por ciudad (lujosa y económica)",
+    backstory=_BACKSTORY_HOTELES.formatear(),
+    tools=[obtener_buscador_web()],
     llm=llm,
-    verbose=True,
+    verbose=AGENTES_VERBOSE,
+    step_callback=registrar_paso,
     allow_delegation=False,
     max_iter=3
     )
 
-    agente_planificacion = Agent(
-    role="Planificador de Itinerarios",
-    goal=f"Crear un itinerario de viaje de {dias} días **DETALLADO, ATRACTIVO y en ESPAÑOL ARGENTINO con emojis.** **UTILIZANDO LA INFORMACIÓN PROPORCIONADA POR LOS OTROS AGENTES. NO REDUNDAR EN BÚSQUEDAS INNECESARIAS.**", 
-    backstory=(
-        "Sos el Manager y Planificador de Viajes principal. Tu función es COORDINAR a los agentes: para buscar actividades recreativas debes delegar al 'Buscador de Actividades', para buscar transportes debes delegar al 'Buscador de Transportes' y para buscar hoteles debes delegar al 'Buscador de Hoteles'. " 
-        "Recibís la información de ellos y la USÁS para crear un itinerario detallado y atractivo. " 
-        "Una vez que recibas informacion de vuelos, hoteles y actividades, presenta los datos de forma ordenada y DETENÉ LA BÚSQUEDA INMEDIATAMENTE. NO REALICES BÚSQUEDAS ADICIONALES BAJO NINGUNA CIRCUNSTANCIA."
+
+_BACKSTORY_PLANIFICACION = Plantilla(
+        "{rol}"
         "**NO realizás búsquedas de actividades directamente. Tu foco es PLANIFICAR y PRESENTAR la información en un itinerario genial.**"
-        f"Es fundamental que respetes la cantidad de {dias} días del viaje. Es FUNDAMENTAL que cada día tenga su actividad de mañana,tarde y noche."
+        "Es fundamental que respetes la cantidad de días del viaje. Es FUNDAMENTAL que cada día tenga su actividad de mañana,tarde y noche."
         "**MANEJO PRECISO DE LOS DÍAS DE VIAJE:** Tenés que tener especial cuidado con los horarios de vuelo. Si un vuelo sale el día 1 a la noche y llega el día 3 por la mañana, NO programes actividades en destino durante los días 1 y 2, ya que el viajero está en tránsito. Solo programa actividades DESPUÉS de que el viajero haya llegado físicamente al destino."
         "**Escribí en un ESPAÑOL ARGENTINO natural y amigable. Utiliza emojis** " 
         "**DESARROLLÁ CADA DÍA DEL ITINERARIO CON UN PÁRRAFO DESCRIPTIVO**, mencionando las actividades principales, "
         "dando **SUGERENCIAS CORTAS Y ATRACTIVAS** sobre qué hacer y ver en cada lugar. " 
         "Al final, **presentá las opciones de hoteles de forma clara y concisa**, destacando brevemente las características de cada hotel (lujoso y económico)." 
-    ),
+)
+
+
+def _textos_planificacion(coordinador):
+    # Rol, objetivo y backstory del planificador (el modo streaming los usa sin armar un Agent)
+    return (
+        "Planificador de Itinerarios",
+        "Crear un itinerario de viaje con la cantidad de días pedida, **DETALLADO, ATRACTIVO y en ESPAÑOL ARGENTINO con emojis.** **UTILIZANDO LA INFORMACIÓN PROPORCIONADA POR LOS OTROS AGENTES. NO REDUNDAR EN BÚSQUEDAS INNECESARIAS.**",
+        _BACKSTORY_PLANIFICACION.formatear(rol=_ROL_COORDINADOR if coordinador else _ROL_PLANIFICADOR),
+    )
+
+
+def crear_agente_planificacion(coordinador=True):
+    rol, objetivo, backstory = _textos_planificacion(coordinador)
+    return Agent(
+    role=rol,
+    goal=objetivo,
+    backstory=backstory,
     llm=llm,
-    verbose=True,
-    allow_delegation=True,
+    verbose=AGENTES_VERBOSE,
+    step_callback=registrar_paso,
+    allow_delegation=coordinador,
     max_iter=3
     )
 
 
-    task_planificacion_itinerario = Task(
-        description=f"""Tu tarea principal es planificar un itinerario de viaje DETALLADO DÍA POR DÍA de {dias} días, partiendo desde {origen} y yendo a las ciudades {destinos}.
-        Debes delegar en los agentes para recopilar informacion necesaria y luego presentar el itinerario. Debe estar escrito en ESPAÑOL ARGENTINO con EMOJIS. NO PUEDE FALTAR NINGUN DIA.
+_TIPOS_AGENTE = {
+    "actividades": crear_agente_actividades,
+    "vuelos": crear_agente_vuelos,
+    "hoteles": crear_agente_hoteles,
+    "coordinador": partial(crear_agente_planificacion, coordinador=True),
+    "planificador": partial(crear_agente_planificacion, coordinador=False),
+}
 
-        **INSTRUCCIONES DE DELEGACIÓN:**
+# Agentes ya armados y libres, por tipo, compartidos por todo el proceso. Un Agent
+# guarda estado mientras corre su crew, así que cada crew toma uno libre y lo
+# devuelve al terminar: dos crews nunca usan el mismo a la vez.
+_agentes_libres = {}
+_lock_agentes = threading.Lock()
 
-        IMPORTANTE: Solo el agente planificador (Manager) debe ejecutar esta tarea. 
-        Como Manager, debes DELEGAR las siguientes tareas:
-        
-        1. DELEGA la búsqueda de vuelos al agente 'Buscador de Transportes'.
-        2. DELEGA la búsqueda de actividades al agente 'Buscador de Actividades'.
-        3. DELEGA la búsqueda de hoteles al agente 'Buscador de Hoteles'.
-        
-        **CREACION DE ITINERARIO**
-        Una vez que hayas recibido la información de todos los agentes, crea el itinerario detallado.
-        
-        **IMPORTANTE: DESPUÉS DE RECIBIR LA INFORMACIÓN DE TODOS LOS AGENTES, NO REALICES BÚSQUEDAS ADICIONALES.**
-        
-        **ATENCIÓN A LAS FECHAS DE VIAJE:**
+
+@contextmanager
+def _prestar(tipo):
+    with _lock_agentes:
+        libres = _agentes_libres.get(tipo)
+        agente = libres.pop() if libres else None
+    if agente is None:
+        acumular(agentes_creados=1)
+        agente = _TIPOS_AGENTE[tipo]()
+    else:
+        acumular(agentes_reutilizados=1)
+    try:
+        yield agente
+    finally:
+        with _lock_agentes:
+            libres = _agentes_libres.setdefault(tipo, [])
+            if len(libres) < AGENTES_EN_CACHE:
+                libres.append(agente)
+
+
+def precalentar_agentes():
+    """Arma un agente libre de cada tipo para que las primeras solicitudes no los creen."""
+    with ExitStack() as prestados:
+        for tipo in _TIPOS_AGENTE:
+            prestados.enter_context(_prestar(tipo))
+
+
+# Reglas de fechas, tips y formato de salida comunes a todos los modos de planificación
+_INSTRUCCIONES_ITINERARIO = Plantilla("""**ATENCIÓN A LAS FECHAS DE VIAJE:**
         - NO PROGRAMES ACTIVIDADES DURANTE LOS DÍAS DE VIAJE.
         - Las actividades en destino SOLO DEBEN EMPEZAR DESPUÉS de que el viajero haya llegado físicamente.
-        - Si un vuelo llega, por ejemplo, el día {fecha_inicio.strftime('%d/%m')} por la mañana, programa actividades solo a partir de la tarde.
+        - Si un vuelo llega, por ejemplo, el día {inicio_dm} por la mañana, programa actividades solo a partir de la tarde.
         
         Tips: 
             -No olvides que todos los dias deben estar detallados en mañana, tarde y noche.
@@ -115,12 +222,12 @@ def generar_itinerario(origen, destinos, fecha_inicio, fecha_fin, preferencias,
         **Formato de Itinerario Deseado:**
         Itinerario de {dias} Días: [Ciudad 1] y [Ciudad 2]
 
-**Día 1: [{fecha_inicio.strftime('%d/%m/%Y')}] - [Ciudad X]**
+**Día 1: [{inicio_dmy}] - [Ciudad X]**
 # Si este día es un día de viaje (vuelo de ida), indicar claramente que es un día de viaje y NO programar actividades turísticas hasta la llegada.
 
 -Mañana:\n
 Actividad: [viaje/vuelo de ida].\n
-Transporte: [Horario de salida transporte, Horario de llegada en {destinos[0]}, aerolínea, número de vuelo (si está disponible)] [Emoji]\n
+Transporte: [Horario de salida transporte, Horario de llegada en {primero}, aerolínea, número de vuelo (si está disponible)] [Emoji]\n
 -Tarde:\n
 Actividad: [Descripción de la actividad] [Emoji].\n
 Almuerzo: [Sugerencia de almuerzo, especificar restaurante] [Emoji].\n
@@ -128,10 +235,10 @@ Almuerzo: [Sugerencia de almuerzo, especificar restaurante] [Emoji].\n
 Actividad: [Descripción de la actividad] [Emoji].\n
 Cena: [Sugerencia de cena, especificar restaurante] [Emoji].\n
 
-[CONTINÚA PARA CADA DÍA hasta el {fecha_fin.strftime('%d/%m/%Y')}]\n
+[CONTINÚA PARA CADA DÍA hasta el {fin_dmy}]\n
 
 **Opciones de Alojamiento 🏨:**\n
-[Ciudad 1]: {destinos[0]}\n
+[Ciudad 1]: {primero}\n
 [Tipo de Hotel - Lujo/Económico]:\n
 [Nombre del Hotel] ⭐⭐⭐⭐⭐\n
 Dirección: [Dirección]\n
@@ -141,7 +248,7 @@ Enlace: [Enlace]\n
 
 **Opciones de Transporte ✈️:**\n
 
-**IDA ({fecha_inicio.strftime('%d/%m')}):**\n
+**IDA ({inicio_dm}):**\n
 ✈️ **Vuelo [Nombre del vuelo] - [Nombre de la aerolinea]:**\n
 - **Salida:** [Hora de salida] ({origen}) ➔ **Llegada:** [Hora de llegada] ([Ciudad 2])\n
 - **Precio:** **$[Precio del vuelo]**\n
@@ -151,31 +258,330 @@ Enlace: [Enlace]\n
 - **Salida:** [Hora de salida] ([Ciudad 1]) ➔ **Llegada:** [Hora de llegada] ([Ciudad 2])\n
 - **Precio:** **$[Precio del vuelo]**\n
 
-**VUELTA ({fecha_fin.strftime('%d/%m')}):**\n
+**VUELTA ({fin_dm}):**\n
 ✈️ **Vuelo [Nombre del vuelo] - [Nombre de la aerolinea]:**\n
 - **Salida:** [Hora de salida en la última ciudad] ([Ciudad 2]) ➔ **Llegada:** [Hora de llegada] ({origen})\n
 - **Precio:** **$[Precio del vuelo] **\n
-""",
-        agent=agente_planificacion,
-        expected_output=""
+""")
+
+
+def _instrucciones_itinerario(origen, destinos, fecha_inicio, fecha_fin, dias):
+    return _INSTRUCCIONES_ITINERARIO.formatear(
+        origen=origen, primero=destinos[0], dias=dias,
+        inicio_dm=fecha_inicio.strftime('%d/%m'), inicio_dmy=fecha_inicio.strftime('%d/%m/%Y'),
+        fin_dm=fecha_fin.strftime('%d/%m'), fin_dmy=fecha_fin.strftime('%d/%m/%Y'),
     )
 
 
-    crew = Crew(
-        agents=[agente_actividades, agente_vuelos, agente_hoteles],
-        tasks=[task_planificacion_itinerario],
-        manager_agent=agente_planificacion,
-        process=Process.sequential,
-        verbose=True
+_DESCRIPCION_DELEGACION = Plantilla("""Tu tarea principal es planificar un itinerario de viaje DETALLADO DÍA POR DÍA de {dias} días, partiendo desde {origen} y yendo a las ciudades {destinos}.
+        Debes delegar en los agentes para recopilar informacion necesaria y luego presentar el itinerario. Debe estar escrito en ESPAÑOL ARGENTINO con EMOJIS. NO PUEDE FALTAR NINGUN DIA.
+
+        **INSTRUCCIONES DE DELEGACIÓN:**
+
+        IMPORTANTE: Solo el agente planificador (Manager) debe ejecutar esta tarea. 
+        Como Manager, debes DELEGAR las siguientes tareas:
+        
+        1. DELEGA la búsqueda de vuelos al agente 'Buscador de Transportes', pasándole estos datos: {vuelos}
+        2. {actividades}
+        3. DELEGA la búsqueda de hoteles al agente 'Buscador de Hoteles', pasándole estos datos: {hoteles}
+        
+        **CREACION DE ITINERARIO**
+        Una vez que hayas recibido la información de todos los agentes, crea el itinerario detallado.
+        
+        **IMPORTANTE: DESPUÉS DE RECIBIR LA INFORMACIÓN DE TODOS LOS AGENTES, NO REALICES BÚSQUEDAS ADICIONALES.**
+        
+        {instrucciones}""")
+
+
+
+def _paso_actividades(cubiertas, faltantes, preferencias, dias):
+    # Las ciudades de la base local van ya resueltas en la descripción; solo se delega el resto
+    delegar = ("DELEGA la búsqueda de actividades al agente 'Buscador de Actividades', pasándole estos datos: "
+               + _DATOS_ACTIVIDADES.formatear(destinos=faltantes, dias=dias, preferencias=preferencias))
+    if not cubiertas:
+        return delegar
+    texto = "NO busques actividades para estas ciudades, ya están recopiladas:\n" + "\n\n".join(cubiertas.values())
+    if faltantes:
+        texto += "\n        " + delegar
+    return texto
+
+
+# Función para generar el itinerario
+def generar_itinerario(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias, modo=None, usar_cache=True):
+    """Genera el itinerario del viaje como texto markdown.
+
+    Si `usar_cache` es True y ya se generó un itinerario para la misma solicitud,
+    se devuelve ese; con False se regenera y se reemplaza la entrada guardada.
+    """
+    clave = clave_viaje(origen, destinos, fecha_inicio, fecha_fin, preferencias)
+    if usar_cache:
+        en_cache = cache_itinerarios.obtener(clave)
+        if en_cache is not None:
+            registrar(cache="hit")
+            return en_cache
+
+    with span("generar_itinerario", "crew", modo=modo or MODO_PLANIFICACION):
+        resultado, completo = _generar_itinerario(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias, modo)
+        itinerario = str(resultado)
+    _guardar_itinerario(clave, itinerario, completo)
+    return itinerario
+
+
+def _guardar_itinerario(clave, itinerario, completo):
+    # Un itinerario vacío o armado con ramas vencidas o búsquedas con error se
+    # serviría tal cual durante CACHE_ITINERARIOS_TTL: esos se regeneran
+    if completo and itinerario.strip():
+        cache_itinerarios.guardar(clave, itinerario)
+    else:
+        registrar(cache="no_guardado")
+
+
+def _generar_itinerario(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias, modo=None):
+    # Devuelve (resultado, completo): completo es False si faltó alguna información del viaje
+    modo = modo or MODO_PLANIFICACION
+    if modo == "directo":
+        return _generar_itinerario_directo(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias)
+    if modo == "paralelo":
+        return _generar_itinerario_paralelo(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias)
+
+    # Definir agentes. Las ciudades de la base local no necesitan al buscador de actividades
+    cubiertas, faltantes = conocimiento.separar(destinos, preferencias)
+    with ExitStack() as prestados:
+        agentes = [prestados.enter_context(_prestar("actividades"))] if faltantes else []
+        agente_vuelos = prestados.enter_context(_prestar("vuelos"))
+        agente_hoteles = prestados.enter_context(_prestar("hoteles"))
+        agente_planificacion = prestados.enter_context(_prestar("coordinador"))
+
+        task_planificacion_itinerario = Task(
+            description=_DESCRIPCION_DELEGACION.formatear(
+                origen=origen, destinos=destinos, dias=dias,
+                vuelos=_datos_vuelos(origen, destinos, fecha_inicio, fecha_fin),
+                actividades=_paso_actividades(cubiertas, faltantes, preferencias, dias),
+                hoteles=_DATOS_HOTELES.formatear(destinos=destinos),
+                instrucciones=_instrucciones_itinerario(origen, destinos, fecha_inicio, fecha_fin, dias),
+            ),
+            agent=agente_planificacion,
+            expected_output=""
+        )
+
+
+        crew = Crew(
+            agents=agentes + [agente_vuelos, agente_hoteles],
+            tasks=[task_planificacion_itinerario],
+            manager_agent=agente_planificacion,
+            process=Process.sequential,
+            verbose=AGENTES_VERBOSE
+        )
+
+        # Iniciar el proceso con los inputs proporcionados
+        resultado = crew.kickoff(inputs={
+            "origen": origen,
+            "destinos": destinos,
+            "fecha_inicio": fecha_inicio.strftime("%Y-%m-%d"),
+            "fecha_fin": fecha_fin.strftime("%Y-%m-%d"),
+            "preferencias": preferencias
+        })
+
+    return resultado, True
+
+
+def _investigar(tipo, descripcion, salida_esperada):
+    # Cada rama de investigación corre como su propio Crew de una sola tarea. El agente
+    # vuelve a quedar libre recién cuando la rama termina, aunque haya vencido su timeout
+    with _prestar(tipo) as agente, span(agente.role, "crew"):
+        tarea = Task(description=descripcion, agent=agente, expected_output=salida_esperada)
+        crew = Crew(agents=[agente], tasks=[tarea], process=Process.sequential, verbose=AGENTES_VERBOSE)
+        return str(crew.kickoff())
+
+
+def _generar_itinerario_paralelo(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias, timeouts=None):
+    """Corre las búsquedas de actividades, transportes y hoteles en paralelo y después planifica.
+
+    Ninguna de las tres búsquedas depende de otra, así que el tiempo total pasa a ser
+    el de la rama más lenta más el paso de planificación. Cada rama tiene su propio
+    timeout (en segundos, `TIMEOUT_RAMA` por defecto); si vence, el planificador
+    recibe un aviso en lugar de esperar indefinidamente y el itinerario no se guarda en caché.
+    """
+    timeouts = timeouts or {}
+    # Las ciudades de la base local ya tienen sus actividades; la rama solo busca el resto
+    cubiertas, faltantes = conocimiento.separar(destinos, preferencias)
+    ramas = {
+        "transportes": (
+            "vuelos",
+            _datos_vuelos(origen, destinos, fecha_inicio, fecha_fin),
+            "Por cada traslado: aerolínea, número de vuelo, horarios de salida y llegada, escalas y precio.",
+        ),
+        "hoteles": (
+            "hoteles",
+            _DATOS_HOTELES.formatear(destinos=destinos),
+            "Por cada ciudad: un enlace a hoteles lujosos y uno a hoteles económicos.",
+        ),
+    }
+    if faltantes:
+        ramas["actividades"] = (
+            "actividades",
+            _DATOS_ACTIVIDADES.formatear(destinos=faltantes, dias=dias, preferencias=preferencias),
+            "Lista concisa de actividades por ciudad.",
+        )
+
+    executor = ThreadPoolExecutor(max_workers=len(ramas), thread_name_prefix="rama")
+    inicio = time.monotonic()
+    futuros = {nombre: executor.submit(propagar(_investigar), *rama) for nombre, rama in ramas.items()}
+    resultados = {}
+    completo = True
+    try:
+        for nombre, futuro in futuros.items():
+            limite = inicio + timeouts.get(nombre, TIMEOUT_RAMA)
+            try:
+                resultados[nombre] = futuro.result(timeout=max(0, limite - time.monotonic()))
+            except FuturesTimeoutError:
+                resultados[nombre] = f"No se pudo obtener información de {nombre} a tiempo."
+                completo = False
+            except Exception as e:
+                resultados[nombre] = f"Error al buscar {nombre}: {str(e)}"
+                completo = False
+    finally:
+        # No esperar a las ramas colgadas: el planificador sigue con lo que haya
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if cubiertas:
+        resultados["actividades"] = "\n\n".join(list(cubiertas.values()) + (
+            [resultados["actividades"]] if "actividades" in resultados else []))
+    return _planificar(origen, destinos, fecha_inicio, fecha_fin, dias, resultados), completo
+
+
+def _generar_itinerario_directo(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias):
+    # Los tramos de vuelo y las búsquedas de hoteles y actividades se deducen de los datos
+    # del formulario: se ejecutan en bloque y el planificador hace una sola llamada al LLM
+    datos = recopilar_datos(origen, destinos, fecha_inicio, fecha_fin, preferencias)
+    return _planificar(origen, destinos, fecha_inicio, fecha_fin, dias, formatear_datos(datos)), datos["completo"]
+
+
+_DESCRIPCION_PLANIFICACION = Plantilla("""Tu tarea principal es planificar un itinerario de viaje DETALLADO DÍA POR DÍA de {dias} días, partiendo desde {origen} y yendo a las ciudades {destinos}.
+        Usá la información recopilada por los otros agentes para presentar el itinerario. Debe estar escrito en ESPAÑOL ARGENTINO con EMOJIS. NO PUEDE FALTAR NINGUN DIA.
+
+        **INFORMACIÓN RECOPILADA:**
+
+        ACTIVIDADES:
+        {actividades}
+
+        TRANSPORTES:
+        {transportes}
+
+        HOTELES:
+        {hoteles}
+
+        **IMPORTANTE: NO REALICES BÚSQUEDAS ADICIONALES.**
+        
+        {instrucciones}""")
+
+
+def _descripcion_planificacion(origen, destinos, fecha_inicio, fecha_fin, dias, resultados):
+    # Lo que queda del presupuesto después de las partes fijas es para la información recopilada
+    presupuesto = PROMPT_MAX_TOKENS - sum(
+        plantilla.tokens for plantilla in (_DESCRIPCION_PLANIFICACION, _INSTRUCCIONES_ITINERARIO, _BACKSTORY_PLANIFICACION)
     )
+    secciones = ajustar_secciones(
+        {nombre: str(resultados[nombre]) for nombre in ("actividades", "transportes", "hoteles")}, presupuesto
+    )
+    return _DESCRIPCION_PLANIFICACION.formatear(
+        origen=origen, destinos=destinos, dias=dias,
+        instrucciones=_instrucciones_itinerario(origen, destinos, fecha_inicio, fecha_fin, dias),
+        **secciones,
+    )
+
+
+def _planificar(origen, destinos, fecha_inicio, fecha_fin, dias, resultados):
+    # Paso final: el planificador arma el itinerario con la información ya recopilada
+    with _prestar("planificador") as agente_planificacion:
+        with span("armar_prompt", "prompt"):
+            task_planificacion_itinerario = Task(
+                description=_descripcion_planificacion(origen, destinos, fecha_inicio, fecha_fin, dias, resultados),
+                agent=agente_planificacion,
+                expected_output=""
+            )
+
+        crew = Crew(
+            agents=[agente_planificacion],
+            tasks=[task_planificacion_itinerario],
+            process=Process.sequential,
+            verbose=AGENTES_VERBOSE
+        )
+        with span("planificador", "crew"):
+            return crew.kickoff()
+
+
+def generar_itinerario_stream(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias, modo=None, usar_cache=True):
+    """Versión en streaming de `generar_itinerario`.
+
+    Es un generador de eventos (dicts con la clave "tipo"):
+      - {"tipo": "progreso", "mensaje": ...} a medida que terminan las búsquedas.
+      - {"tipo": "texto", "texto": ...} con cada fragmento del itinerario generado por el LLM.
+      - {"tipo": "fin", "itinerario": ...} con el itinerario completo.
+    Solo el modo "directo" transmite el texto del planificador a medida que se genera;
+    los otros modos envían el itinerario completo en un único fragmento al terminar.
+    """
+    clave = clave_viaje(origen, destinos, fecha_inicio, fecha_fin, preferencias)
+    if usar_cache:
+        en_cache = cache_itinerarios.obtener(clave)
+        if en_cache is not None:
+            registrar(cache="hit")
+            yield {"tipo": "progreso", "mensaje": "⚡ Itinerario recuperado de una búsqueda anterior"}
+            yield {"tipo": "texto", "texto": en_cache}
+            yield {"tipo": "fin", "itinerario": en_cache}
+            return
+
+    modo = modo or MODO_PLANIFICACION
+    if modo != "directo":
+        yield {"tipo": "progreso", "mensaje": "🤖 Los agentes están investigando tu viaje..."}
+        itinerario = generar_itinerario(
+            origen, destinos, fecha_inicio, fecha_fin, preferencias, dias, modo=modo, usar_cache=False
+        )
+        yield {"tipo": "texto", "texto": itinerario}
+        yield {"tipo": "fin", "itinerario": itinerario}
+        return
+
+    # Las búsquedas corren en otro hilo y avisan su progreso a través de una cola
+    eventos = queue.Queue()
+    datos = {}
+
+    def recopilar():
+        try:
+            datos.update(recopilar_datos(
+                origen, destinos, fecha_inicio, fecha_fin, preferencias,
+                al_progresar=lambda mensaje: eventos.put({"tipo": "progreso", "mensaje": mensaje}),
+            ))
+        except Exception as e:
+            eventos.put({"tipo": "error", "error": e})
+        finally:
+            eventos.put(None)
 
-    # Iniciar el proceso con los inputs proporcionados
-    resultado = crew.kickoff(inputs={
-        "origen": origen,
-        "destinos": destinos,
-        "fecha_inicio": fecha_inicio.strftime("%Y-%m-%d"),
-        "fecha_fin": fecha_fin.strftime("%Y-%m-%d"),
-        "preferencias": preferencias
-    })
+    threading.Thread(target=propagar(recopilar), name="prefetch-stream", daemon=True).start()
+    while (aviso := eventos.get()) is not None:
+        if aviso["tipo"] == "error":
+            raise aviso["error"]
+        yield aviso
 
-    return resultado
+    yield {"tipo": "progreso", "mensaje": "📝 Armando tu itinerario..."}
+    with span("armar_prompt", "prompt"):
+        mensajes = [
+            {"role": "system", "content": "\n".join(_textos_planificacion(coordinador=False))},
+            {"role": "user", "content": _descripcion_planificacion(
+                origen, destinos, fecha_inicio, fecha_fin, dias, formatear_datos(datos)
+            )},
+        ]
+    partes = []
+    inicio_llm = time.perf_counter()
+    with span("llm", "llm", modelo=llm.model, streaming=True):
+        respuesta, reintentos = completar_en_stream(mensajes)
+        for chunk in respuesta:
+            texto = chunk.choices[0].delta.content
+            if texto:
+                if not partes:
+                    registrar(primer_token_s=round(time.perf_counter() - inicio_llm, 3))
+                partes.append(texto)
+                yield {"tipo": "texto", "texto": texto}
+        registrar(reintentos=reintentos, **contar_tokens(llm.model, mensajes, "".join(partes)))
+    itinerario = "".join(partes)
+    _guardar_itinerario(clave, itinerario, datos["completo"])
+    yield {"tipo": "fin", "itinerario": itinerario}
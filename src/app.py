@@ -1,11 +1,66 @@
+import re
+import time
 import streamlit as st
 from datetime import datetime, timedelta
-from agents import generar_itinerario
+from config import MAX_PREFERENCIAS, PREFERENCIAS, STREAMING
+import aeropuertos
+from trabajos import ColaLlena, obtener_cola
+from arranque import precalentar_en_segundo_plano
+
+# Se ejecuta una sola vez por proceso del servidor (no en cada rerun ni por sesión):
+# carga crewai, los agentes y las herramientas mientras el usuario completa el formulario
+@st.cache_resource(show_spinner=False)
+def precalentar():
+    return precalentar_en_segundo_plano()
+
+precalentar()
+
+# Encabezado de cada día del itinerario (ej: "**Día 3: ...")
+PATRON_DIA = re.compile(r"\n(?=\**\s*D[ií]a \d+)")
 
 # Función para calcular el número de días de un viaje
 def calcular_dias_viaje(fecha_inicio, fecha_fin):
     return str((fecha_fin - fecha_inicio).days + 1)
 
+# Muestra el itinerario a medida que llega, un bloque por día: los días ya
+# completos quedan fijos y solo se vuelve a dibujar el día en curso
+def mostrar_itinerario_en_vivo(eventos):
+    estado = st.status("Generando tu itinerario... ⏳", expanded=True)
+    contenedor = st.container()
+    bloque = contenedor.empty()
+    pendiente = ""
+    ultimo_dibujo = 0.0
+    itinerario = ""
+    resumen = None
+    for evento in eventos:
+        if evento["tipo"] == "progreso":
+            estado.write(evento["mensaje"])
+        elif evento["tipo"] == "texto":
+            pendiente += evento["texto"]
+            # Si empezó un día nuevo, se cierra el bloque del día anterior
+            partes = PATRON_DIA.split(pendiente)
+            for completo in partes[:-1]:
+                bloque.markdown(completo)
+                bloque = contenedor.empty()
+            pendiente = partes[-1]
+            # Limitar los redibujados del día en curso
+            if time.monotonic() - ultimo_dibujo > 0.1:
+                bloque.markdown(pendiente)
+                ultimo_dibujo = time.monotonic()
+        elif evento["tipo"] == "fin":
+            itinerario = evento["itinerario"]
+            resumen = evento.get("resumen")
+    bloque.markdown(pendiente)
+    estado.update(label="✅ ¡Itinerario generado exitosamente!", state="complete", expanded=False)
+    mostrar_tiempos(resumen)
+    return itinerario
+
+# Resumen de tiempos de la ejecución (crews, LLM, herramientas y APIs)
+def mostrar_tiempos(resumen):
+    if resumen:
+        with st.expander("⏱️ Tiempos de esta ejecución"):
+            st.dataframe(resumen, hide_index=True, use_container_width=True)
+
 # Título de la aplicación
 st.title("🌍 Planificador de Viajes con IA ✈️")
 st.markdown("""
@@ -54,9 +109,10 @@ with st.form(key="form_planificacion"):
     
     # Tercera fila: Preferencias de viaje
     preferencias = st.multiselect("🌟 Preferencias de viaje", 
-                                  ["Gastronomía", "Relax", "Naturaleza", "Historia", "Arte", "Compras", "Vida nocturna"],
+                                  list(PREFERENCIAS),
                                   default=[],
-                                  max_selections=3)
+                                  max_selections=MAX_PREFERENCIAS)
+    regenerar = st.checkbox("🔄 Regenerar itinerario (ignorar resultados guardados)", value=False)
     submit_button = st.form_submit_button(label="🚀 Generar Itinerario")
 
 # Actualizamos los valores en el estado de sesión después de enviar el formulario
@@ -82,18 +138,53 @@ if submit_button:
         st.session_state.fecha_fin = fecha_fin
     elif not preferencias:
         st.error("❌ Por favor, selecciona al menos una preferencia de viaje.")
-    elif len(preferencias) > 3:
-        st.error("❌ Por favor, selecciona 3 preferencias como máximo.")
+    elif len(preferencias) > MAX_PREFERENCIAS:
+        st.error(f"❌ Por favor, selecciona {MAX_PREFERENCIAS} preferencias como máximo.")
+    else:
+        # Avisar cuando un nombre de ciudad corresponde a más de un lugar
+        for ciudad in [origen] + destinos:
+            opciones = aeropuertos.buscar(ciudad)
+            if len(opciones) > 1:
+                elegida = opciones[0]
+                st.info(f"ℹ️ Para '{ciudad}' usamos {elegida.ciudad}, {elegida.pais} ({elegida.codigo}). "
+                        f"Si te referís a otra, escribí por ejemplo '{opciones[1].ciudad} ({opciones[1].pais})'.")
+        # Establecer la variable global dias antes de generar el itinerario
+        dias = calcular_dias_viaje(fecha_inicio, fecha_fin)
+        try:
+            # El itinerario se genera en segundo plano: si la página se recarga o se
+            # desconecta, el trabajo sigue y se puede retomar con su id
+            trabajo_id = obtener_cola().enviar(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias,
+                                               usar_cache=not regenerar)
+            st.session_state.trabajo_id = trabajo_id
+            st.query_params["trabajo"] = trabajo_id
+        except ColaLlena as e:
+            st.warning(f"⏳ {str(e)}")
+
+# Seguir el trabajo en curso (o retomarlo después de una recarga)
+trabajo_id = st.session_state.get("trabajo_id") or st.query_params.get("trabajo")
+if trabajo_id:
+    cola = obtener_cola()
+    if cola.obtener(trabajo_id) is None:
+        st.info("ℹ️ El itinerario solicitado ya no está disponible. Generá uno nuevo.")
+    elif STREAMING:
+        try:
+            st.markdown("### Tu itinerario personalizado:")
+            mostrar_itinerario_en_vivo(cola.seguir(trabajo_id))
+        except Exception as e:
+            st.error(f"❌ Ocurrió un error al generar el itinerario: {str(e)}")
     else:
         with st.spinner("Generando tu itinerario... Esto puede tardar algunos minutos ⏳"):
             try:
-                # Establecer la variable global dias antes de generar el itinerario
-                dias = calcular_dias_viaje(fecha_inicio, fecha_fin)
-                
-                itinerario = generar_itinerario(origen, destinos, fecha_inicio, fecha_fin, preferencias, dias)
+                itinerario = ""
+                resumen = None
+                for evento in cola.seguir(trabajo_id, intervalo=1.0):
+                    if evento["tipo"] == "fin":
+                        itinerario = evento["itinerario"]
+                        resumen = evento.get("resumen")
                 
                 st.success("✅ ¡Itinerario generado exitosamente!")
                 st.markdown("### Tu itinerario personalizado:")
                 st.markdown(itinerario)
+                mostrar_tiempos(resumen)
             except Exception as e:
                 st.error(f"❌ Ocurrió un error al generar el itinerario: {str(e)}")
@@ -0,0 +1,116 @@
+"""Precalentamiento del proceso y medición del arranque.
+
+La app importa solo lo liviano (config, aeropuertos, trabajos); crewai, litellm,
+el SDK de Amadeus y los agentes se cargan con el primer itinerario. Para que esa
+primera solicitud no pague el arranque, `precalentar_en_segundo_plano` hace todo
+eso en un hilo apenas arranca el servidor.
+
+    python src/arranque.py    # tiempos de importación y de preparación por solicitud
+"""
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Lo que importa la app al cargar la página y lo que recién hace falta al generar un itinerario
+MODULOS_APP = ("config", "aeropuertos", "trabajos")
+MODULOS_ITINERARIO = ("agents",)
+
+
+@contextmanager
+def _medir(tiempos, nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos[nombre] = round(time.perf_counter() - inicio, 4)
+
+
+def precalentar():
+    """Importa los módulos pesados y crea los objetos de larga vida del proceso.
+
+    Devuelve los segundos que llevó cada paso.
+    """
+    tiempos = {}
+    with _medir(tiempos, "importar_agents"):
+        import agents
+    with _medir(tiempos, "herramientas"):
+        from tools import obtener_buscador_vuelos, obtener_buscador_web
+        obtener_buscador_web()
+        obtener_buscador_vuelos()
+    with _medir(tiempos, "tokenizador"):
+        # Medir las plantillas carga el tokenizador y deja sus tokens calculados
+        for plantilla in (agents._INSTRUCCIONES_ITINERARIO, agents._DESCRIPCION_PLANIFICACION,
+                          agents._BACKSTORY_PLANIFICACION):
+            plantilla.ahorro
+    with _medir(tiempos, "agentes"):
+        agents.precalentar_agentes()
+    with _medir(tiempos, "aeropuertos"):
+        import aeropuertos
+        aeropuertos.resolver("Madrid")
+    with _medir(tiempos, "conocimiento"):
+        import conocimiento
+        conocimiento.buscar("Madrid", "Arte")
+    with _medir(tiempos, "cola"):
+        from trabajos import obtener_cola
+        obtener_cola()
+    logger.info("Proceso precalentado: %s", tiempos)
+    return tiempos
+
+
+def precalentar_en_segundo_plano():
+    """Corre `precalentar` en un hilo para no demorar la primera página."""
+    hilo = threading.Thread(target=_precalentar_sin_errores, name="precalentar", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def _precalentar_sin_errores():
+    try:
+        precalentar()
+    except Exception as e:
+        # Si algo falla acá, la primera solicitud lo vuelve a intentar y muestra el error
+        logger.warning("No se pudo precalentar el proceso: %s", e)
+
+
+def medir_importacion(modulos):
+    """Segundos que tarda un intérprete nuevo en importar `modulos`."""
+    codigo = (
+        "import sys, time; sys.path.insert(0, {src!r}); inicio = time.perf_counter()\n"
+        "for modulo in {modulos!r}: __import__(modulo)\n"
+        "print(time.perf_counter() - inicio)"
+    ).format(src=os.path.dirname(os.path.abspath(__file__)), modulos=tuple(modulos))
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True)
+    return round(float(salida.stdout.strip().splitlines()[-1]), 4)
+
+
+def medir_preparacion(repeticiones=20):
+    """Segundos por solicitud para armar los agentes desde cero y para reutilizar el planificador."""
+    import agents
+
+    tiempos = {}
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for crear in agents._TIPOS_AGENTE.values():
+            crear()
+    tiempos["armar_agentes"] = round((time.perf_counter() - inicio) / repeticiones, 5)
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        with agents._prestar("planificador"):
+            pass
+    tiempos["reutilizar_planificador"] = round((time.perf_counter() - inicio) / repeticiones, 5)
+    return tiempos
+
+
+if __name__ == "__main__":
+    print(f"Importar la app: {medir_importacion(MODULOS_APP)} s")
+    print(f"Importar lo necesario para un itinerario: {medir_importacion(MODULOS_APP + MODULOS_ITINERARIO)} s")
+    for paso, segundos in precalentar().items():
+        print(f"Precalentar {paso}: {segundos} s")
+    for paso, segundos in medir_preparacion().items():
+        print(f"Preparación {paso}: {segundos} s")
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import CACHE_DIR, CACHE_DESACTIVADA
+from trazas import registrar
+
+
+class CacheDisco:
+    """Caché clave-valor con TTL persistida en SQLite.
+
+    Al vivir en disco se comparte entre sesiones de Streamlit y entre procesos.
+    Cuando se supera `max_entradas` se descartan las entradas usadas hace más tiempo.
+    """
+
+    def __init__(self, nombre, ttl, max_entradas, directorio=None, desactivada=None):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.desactivada = CACHE_DESACTIVADA if desactivada is None else desactivada
+        directorio = directorio or CACHE_DIR
+        os.makedirs(directorio, exist_ok=True)
+        self.ruta = os.path.join(directorio, f"{nombre}.sqlite3")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._escrituras = 0
+        self._conectar().execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                clave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                expira REAL NOT NULL,
+                accedido REAL NOT NULL
+            )"""
+        )
+        self._conectar().execute("CREATE INDEX IF NOT EXISTS idx_accedido ON cache (accedido)")
+
+    def _conectar(self):
+        # sqlite3 no permite compartir conexiones entre hilos: una por hilo
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def _contar(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def obtener(self, clave, contar=True):
+        """Devuelve el valor guardado para `clave` o None si no existe o expiró.
+
+        Con `contar=False` la consulta no suma a hits/misses (para volver a mirar
+        una clave cuyo miss ya se contó).
+        """
+        if self.desactivada:
+            return None
+        ahora = time.time()
+        conexion = self._conectar()
+        fila = conexion.execute("SELECT valor, expira FROM cache WHERE clave = ?", (clave,)).fetchone()
+        if fila is None:
+            if contar:
+                self._contar(False)
+            return None
+        valor, expira = fila
+        if expira < ahora:
+            conexion.execute("DELETE FROM cache WHERE clave = ?", (clave,))
+            if contar:
+                self._contar(False)
+            return None
+        conexion.execute("UPDATE cache SET accedido = ? WHERE clave = ?", (ahora, clave))
+        if contar:
+            self._contar(True)
+        return json.loads(valor)
+
+    def guardar(self, clave, valor, ttl=None):
+        if self.desactivada:
+            return
+        ahora = time.time()
+        expira = ahora + (self.ttl if ttl is None else ttl)
+        conexion = self._conectar()
+        conexion.execute(
+            "INSERT OR REPLACE INTO cache (clave, valor, expira, accedido) VALUES (?, ?, ?, ?)",
+            (clave, json.dumps(valor, ensure_ascii=False), expira, ahora),
+        )
+        with self._lock:
+            self._escrituras += 1
+            desalojar = self._escrituras % 50 == 0
+        if desalojar:
+            self.desalojar()
+
+    def desalojar(self):
+        """Elimina entradas vencidas y, si hace falta, las menos usadas recientemente."""
+        conexion = self._conectar()
+        conexion.execute("DELETE FROM cache WHERE expira < ?", (time.time(),))
+        (total,) = conexion.execute("SELECT COUNT(*) FROM cache").fetchone()
+        sobrantes = total - self.max_entradas
+        if sobrantes > 0:
+            conexion.execute(
+                "DELETE FROM cache WHERE clave IN (SELECT clave FROM cache ORDER BY accedido ASC LIMIT ?)",
+                (sobrantes,),
+            )
+
+    def invalidar(self, clave):
+        self._conectar().execute("DELETE FROM cache WHERE clave = ?", (clave,))
+
+    def limpiar(self):
+        self._conectar().execute("DELETE FROM cache")
+
+    def estadisticas(self):
+        (total,) = self._conectar().execute("SELECT COUNT(*) FROM cache").fetchone()
+        return {"nombre": self.nombre, "hits": self.hits, "misses": self.misses, "entradas": total}
+
+
+class MemoLRU:
+    """Memo en memoria con TTL y desalojo LRU, compartido por las sesiones del proceso.
+
+    A diferencia de CacheDisco guarda los objetos tal cual, sin serializarlos,
+    así que sirve para resultados intermedios que no tienen forma JSON.
+    """
+
+    def __init__(self, max_entradas, desactivada=None):
+        self.max_entradas = max_entradas
+        self.desactivada = CACHE_DESACTIVADA if desactivada is None else desactivada
+        self.hits = 0
+        self.misses = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado para `clave` o None si no existe o expiró."""
+        if self.desactivada:
+            return None
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[1] < time.time():
+                if entrada is not None:
+                    del self._datos[clave]
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor, ttl):
+        if self.desactivada:
+            return
+        with self._lock:
+            self._datos[clave] = (valor, time.time() + ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        return {"hits": self.hits, "misses": self.misses, "entradas": len(self._datos)}
+
+
+class _Llamada:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class _LlamadaAsync:
+    def __init__(self, tarea):
+        self.tarea = tarea
+        self.esperando = 0
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes idénticas en una sola.
+
+    Mientras una llamada para `clave` está en curso, el resto de los hilos que
+    pidan la misma clave esperan su resultado en lugar de repetir la consulta.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo = {}
+        self._en_vuelo_async = {}
+        self.agrupadas = 0
+
+    def ejecutar(self, clave, funcion):
+        with self._lock:
+            llamada = self._en_vuelo.get(clave)
+            lider = llamada is None
+            if lider:
+                llamada = _Llamada()
+                self._en_vuelo[clave] = llamada
+            else:
+                self.agrupadas += 1
+
+        if not lider:
+            registrar(agrupada=True)
+            llamada.evento.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado
+
+        try:
+            llamada.resultado = funcion()
+        except BaseException as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave]
+            llamada.evento.set()
+        return llamada.resultado
+
+    async def ejecutar_async(self, clave, funcion):
+        """Versión para corrutinas: `funcion()` devuelve la corrutina que hace la consulta.
+
+        La consulta corre en una tarea propia del event loop y cada llamada la
+        espera con `asyncio.shield`, así que cancelar una de ellas no cancela la
+        de las demás; la consulta se cancela cuando ya no queda nadie esperándola.
+        """
+        clave = (asyncio.get_running_loop(), clave)
+        llamada = self._en_vuelo_async.get(clave)
+        if llamada is None:
+            llamada = _LlamadaAsync(asyncio.ensure_future(funcion()))
+            self._en_vuelo_async[clave] = llamada
+            llamada.tarea.add_done_callback(lambda _: self._soltar_async(clave, llamada))
+        else:
+            with self._lock:
+                self.agrupadas += 1
+            registrar(agrupada=True)
+
+        llamada.esperando += 1
+        try:
+            return await asyncio.shield(llamada.tarea)
+        finally:
+            llamada.esperando -= 1
+            if not llamada.esperando and not llamada.tarea.done():
+                llamada.tarea.cancel()
+
+    def _soltar_async(self, clave, llamada):
+        if self._en_vuelo_async.get(clave) is llamada:
+            del self._en_vuelo_async[clave]
+
+
+def normalizar_consulta(query):
+    """Normaliza una consulta web: minúsculas y espacios colapsados."""
+    return " ".join(query.casefold().split())
+
+
+def clave_vuelo(origen, destino, fecha, adultos=1):
+    """Clave normalizada para una búsqueda de vuelos."""
+    return f"{origen.strip().upper()},{destino.strip().upper()},{fecha.strip()},{int(adultos)}"
+
+
+def clave_viaje(origen, destinos, fecha_inicio, fecha_fin, preferencias):
+    """Clave canónica de una solicitud de itinerario.
+
+    Ciudades sin espacios extra y en minúsculas (el orden de los destinos se
+    respeta porque define la ruta), preferencias ordenadas y fechas en ISO.
+    """
+    return json.dumps(
+        {
+            "origen": normalizar_consulta(origen),
+            "destinos": [normalizar_consulta(d) for d in destinos],
+            "fecha_inicio": fecha_inicio.isoformat(),
+            "fecha_fin": fecha_fin.isoformat(),
+            "preferencias": sorted(normalizar_consulta(p) for p in preferencias),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
@@ -0,0 +1,295 @@
+import asyncio
+import atexit
+import contextvars
+import threading
+import time
+import weakref
+from urllib.error import URLError
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import SingleFlight
+from config import (
+    AMADEUS_API_KEY,
+    AMADEUS_API_SECRET,
+    AMADEUS_HOST,
+    AMADEUS_HOSTNAME,
+    AMADEUS_SSL,
+    HTTP_POOL_HOSTS,
+    HTTP_POOL_POR_HOST,
+    HTTP_TIMEOUT_CONEXION,
+    HTTP_TIMEOUT_LECTURA,
+)
+
+# Timeout (conexión, lectura) para todas las llamadas HTTP salientes
+TIMEOUT = (HTTP_TIMEOUT_CONEXION, HTTP_TIMEOUT_LECTURA)
+
+_lock = threading.Lock()
+_sesion = None
+_cliente_amadeus = None
+_amadeus_async = None
+# Una sesión aiohttp por event loop: sus conexiones quedan atadas al loop que las abrió
+_clientes_async = weakref.WeakKeyDictionary()
+# Event loop del proceso para las búsquedas async, en un hilo propio
+_loop = None
+
+
+def obtener_sesion():
+    """Devuelve la sesión HTTP del proceso, con keep-alive y pool de conexiones por host.
+
+    Reutilizar la sesión evita pagar el handshake TCP+TLS en cada búsqueda.
+    `pool_block=True` hace que, al llegar al límite de conexiones por host,
+    los hilos esperen una conexión libre en lugar de abrir conexiones extra.
+    """
+    global _sesion
+    if _sesion is None:
+        with _lock:
+            if _sesion is None:
+                sesion = requests.Session()
+                adaptador = HTTPAdapter(
+                    pool_connections=HTTP_POOL_HOSTS,
+                    pool_maxsize=HTTP_POOL_POR_HOST,
+                    pool_block=True,
+                )
+                sesion.mount("https://", adaptador)
+                sesion.mount("http://", adaptador)
+                _sesion = sesion
+    return _sesion
+
+
+class _RespuestaUrlopen:
+    """Respuesta de requests con la interfaz de `urlopen` que lee el SDK de Amadeus."""
+
+    def __init__(self, respuesta):
+        self.status = self.code = respuesta.status_code
+        self._respuesta = respuesta
+
+    def getheaders(self):
+        return list(self._respuesta.headers.items())
+
+    def read(self):
+        return self._respuesta.content
+
+
+def _http_amadeus(solicitud):
+    # Reemplazo de urlopen para el SDK: usa la sesión compartida, con su pool y TIMEOUT
+    try:
+        respuesta = obtener_sesion().request(
+            solicitud.get_method(),
+            solicitud.full_url,
+            data=solicitud.data,
+            headers=dict(solicitud.header_items()),
+            timeout=TIMEOUT,
+        )
+    except requests.RequestException as e:
+        # El SDK convierte URLError en NetworkError, igual que con urlopen
+        raise URLError(e) from e
+    return _RespuestaUrlopen(respuesta)
+
+
+def obtener_cliente_amadeus():
+    """Devuelve el cliente de Amadeus del proceso.
+
+    El cliente guarda el token OAuth y lo renueva solo cuando vence, así que
+    compartirlo evita pedir un token nuevo en cada búsqueda. Sus llamadas HTTP
+    pasan por la sesión compartida (`obtener_sesion`), con el mismo pool y timeouts.
+    """
+    global _cliente_amadeus
+    if _cliente_amadeus is None:
+        with _lock:
+            if _cliente_amadeus is None:
+                api_key = AMADEUS_API_KEY
+                api_secret = AMADEUS_API_SECRET
+                if not api_key or not api_secret:
+                    raise ValueError("Error: Amadeus API credentials not found in environment variables")
+
+                opciones = {"hostname": AMADEUS_HOSTNAME}
+                if AMADEUS_HOST:
+                    host, _, puerto = AMADEUS_HOST.partition(":")
+                    opciones.update(host=host, ssl=AMADEUS_SSL)
+                    if puerto:
+                        opciones["port"] = int(puerto)
+                # Import diferido: el SDK de Amadeus solo hace falta al buscar vuelos
+                from amadeus import Client
+
+                _cliente_amadeus = Client(
+                    client_id=api_key,
+                    client_secret=api_secret,
+                    http=_http_amadeus,
+                    **opciones
+                )
+    return _cliente_amadeus
+
+
+def obtener_cliente_http_async():
+    """Devuelve la sesión HTTP async del event loop en curso, con keep-alive y pool de conexiones por host.
+
+    Es el equivalente de `obtener_sesion` para las herramientas async: todas las
+    corrutinas del mismo loop comparten las conexiones abiertas. Al llegar al
+    límite por host, las corrutinas esperan una conexión libre sin ocupar un hilo.
+    La sesión se cierra sola cuando el loop termina con `asyncio.run` (o cualquier
+    loop que llame a `shutdown_asyncgens` antes de cerrarse).
+    """
+    loop = asyncio.get_running_loop()
+    cliente, _ = _clientes_async.get(loop, (None, None))
+    if cliente is None:
+        # Import diferido: aiohttp solo hace falta en las herramientas async
+        import aiohttp
+
+        cliente = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_POOL_HOSTS * HTTP_POOL_POR_HOST,
+                limit_per_host=HTTP_POOL_POR_HOST,
+            ),
+            timeout=aiohttp.ClientTimeout(sock_connect=HTTP_TIMEOUT_CONEXION, sock_read=HTTP_TIMEOUT_LECTURA),
+        )
+        # El loop registra el generador al arrancarlo y lo finaliza en
+        # shutdown_asyncgens; se guarda junto a la sesión para que no se recolecte antes
+        guardia = _cerrar_al_terminar(cliente)
+        asyncio.ensure_future(guardia.__anext__())
+        _clientes_async[loop] = (cliente, guardia)
+    return cliente
+
+
+async def _cerrar_al_terminar(cliente):
+    try:
+        yield
+    finally:
+        await cliente.close()
+
+
+async def cerrar_cliente_http_async():
+    """Cierra las conexiones de la sesión async del loop en curso antes de que termine."""
+    cliente, _ = _clientes_async.pop(asyncio.get_running_loop(), (None, None))
+    if cliente is not None:
+        await cliente.close()
+
+
+def _obtener_loop():
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="loop-busquedas", daemon=True).start()
+                atexit.register(_cerrar_loop, loop)
+                _loop = loop
+    return _loop
+
+
+def _cerrar_loop(loop):
+    # Al salir del proceso: cerrar la sesión aiohttp del loop compartido y detenerlo
+    try:
+        asyncio.run_coroutine_threadsafe(cerrar_cliente_http_async(), loop).result(timeout=5)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+
+
+async def _en_contexto(contexto, corrutina):
+    return await contexto.run(asyncio.ensure_future, corrutina)
+
+
+def ejecutar_en_loop(corrutina):
+    """Corre `corrutina` en el event loop compartido del proceso y devuelve su resultado.
+
+    Todas las búsquedas async del proceso (de cualquier hilo o solicitud)
+    comparten ese loop, su sesión aiohttp y sus consultas agrupadas, sin ocupar
+    un hilo por consulta. Quien llama queda bloqueado hasta que termina; la
+    corrutina ve la traza y el span en curso de quien llama. No se puede llamar
+    desde el propio loop.
+    """
+    loop = _obtener_loop()
+    try:
+        en_el_loop = asyncio.get_running_loop() is loop
+    except RuntimeError:
+        en_el_loop = False
+    if en_el_loop:
+        corrutina.close()
+        raise RuntimeError("ejecutar_en_loop no se puede llamar desde el loop compartido: usar await")
+    contexto = contextvars.copy_context()
+    return asyncio.run_coroutine_threadsafe(_en_contexto(contexto, corrutina), loop).result()
+
+
+class ErrorAmadeus(Exception):
+    """Respuesta con error de la API de Amadeus, con el código, el cuerpo y los encabezados."""
+
+    def __init__(self, status_code, body, headers=None):
+        super().__init__(f"[{status_code}] {body}")
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+
+class AmadeusAsync:
+    """Cliente mínimo de la API REST de Amadeus sobre aiohttp, para las herramientas async.
+
+    El SDK oficial solo es sincrónico. Este cliente usa el mismo servidor y las
+    mismas credenciales, y guarda el token OAuth hasta que vence.
+    """
+
+    def __init__(self, client_id, client_secret, url_base):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.url_base = url_base
+        self._token = None
+        self._vence = 0.0
+        self._pedidos_token = SingleFlight()
+
+    async def _obtener_token(self):
+        if self._token is None or time.monotonic() >= self._vence:
+            # Las búsquedas concurrentes que arrancan sin token esperan un único pedido
+            await self._pedidos_token.ejecutar_async("token", self._pedir_token)
+        return self._token
+
+    async def _pedir_token(self):
+        datos = await self._solicitar(
+            "POST",
+            "/v1/security/oauth2/token",
+            data={
+                "grant_type": "client_credentials",
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+            },
+        )
+        self._token = datos["access_token"]
+        # Renovar un poco antes del vencimiento para no usar un token a punto de caducar
+        self._vence = time.monotonic() + max(0, int(datos.get("expires_in", 0)) - 10)
+
+    async def _solicitar(self, metodo, ruta, **opciones):
+        async with obtener_cliente_http_async().request(metodo, f"{self.url_base}{ruta}", **opciones) as respuesta:
+            if respuesta.status != 200:
+                raise ErrorAmadeus(respuesta.status, await respuesta.text(), dict(respuesta.headers))
+            # Amadeus responde con application/vnd.amadeus+json
+            return await respuesta.json(content_type=None)
+
+    async def get(self, ruta, **parametros):
+        """GET a `ruta` (ej: "/v2/shopping/flight-offers"). Devuelve el JSON de la respuesta."""
+        for intento in range(2):
+            token = await self._obtener_token()
+            try:
+                return await self._solicitar("GET", ruta, params=parametros,
+                                             headers={"Authorization": f"Bearer {token}"})
+            except ErrorAmadeus as error:
+                if error.status_code != 401 or intento:
+                    raise
+                # Token revocado o vencido antes de tiempo: pedir otro y repetir una vez
+                self._token = None
+
+
+def obtener_amadeus_async():
+    """Devuelve el cliente async de Amadeus del proceso, apuntado al mismo servidor que el SDK."""
+    global _amadeus_async
+    if _amadeus_async is None:
+        with _lock:
+            if _amadeus_async is None:
+                if not AMADEUS_API_KEY or not AMADEUS_API_SECRET:
+                    raise ValueError("Error: Amadeus API credentials not found in environment variables")
+                if AMADEUS_HOST:
+                    url_base = f"{'https' if AMADEUS_SSL else 'http'}://{AMADEUS_HOST}"
+                elif AMADEUS_HOSTNAME == "production":
+                    url_base = "https://api.amadeus.com"
+                else:
+                    url_base = "https://test.api.amadeus.com"
+                _amadeus_async = AmadeusAsync(AMADEUS_API_KEY, AMADEUS_API_SECRET, url_base)
+    return _amadeus_async
@@ -1,5 +1,5 @@
-from crewai import LLM
 from dotenv import load_dotenv
+import logging
 import os
 
 # Cargar variables de entorno
@@ -11,11 +11,98 @@ SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY")
 AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET")
 
+# Modelo y endpoint del LLM (LLM_API_BASE permite apuntar a un servidor compatible con OpenAI, por ejemplo el falso de bench/)
+LLM_MODELO = os.getenv("LLM_MODELO", "groq/qwen-2.5-32b")
+LLM_API_BASE = os.getenv("LLM_API_BASE")
 
-# Configurar LLM
-llm = LLM(
-    model="groq/qwen-2.5-32b",
-    temperature=0.2,
-    api_key=GROQ_API_KEY,
-    request_timeout=120
+# Configuración de la caché en disco (compartida entre sesiones y procesos)
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"))
+CACHE_DESACTIVADA = os.getenv("CACHE_DESACTIVADA", "0").lower() in ("1", "true", "si", "sí")
+CACHE_VUELOS_TTL = int(os.getenv("CACHE_VUELOS_TTL", "1800"))  # segundos
+CACHE_VUELOS_MAX_ENTRADAS = int(os.getenv("CACHE_VUELOS_MAX_ENTRADAS", "5000"))
+CACHE_WEB_TTL = int(os.getenv("CACHE_WEB_TTL", "86400"))  # segundos
+CACHE_WEB_MAX_ENTRADAS = int(os.getenv("CACHE_WEB_MAX_ENTRADAS", "20000"))
+CACHE_ITINERARIOS_TTL = int(os.getenv("CACHE_ITINERARIOS_TTL", "21600"))  # segundos
+CACHE_ITINERARIOS_MAX_ENTRADAS = int(os.getenv("CACHE_ITINERARIOS_MAX_ENTRADAS", "2000"))
+
+# Pool de conexiones HTTP compartido por todas las herramientas
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "10"))  # hosts distintos con pool propio
+HTTP_POOL_POR_HOST = int(os.getenv("HTTP_POOL_POR_HOST", "20"))  # conexiones máximas por host
+HTTP_TIMEOUT_CONEXION = float(os.getenv("HTTP_TIMEOUT_CONEXION", "5"))  # segundos
+HTTP_TIMEOUT_LECTURA = float(os.getenv("HTTP_TIMEOUT_LECTURA", "30"))  # segundos
+
+# Endpoint de Serper (configurable para poder apuntar a un servidor falso local)
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
+# Servidor de Amadeus: "test" o "production", o bien AMADEUS_HOST=host:puerto para un servidor propio
+AMADEUS_HOSTNAME = os.getenv("AMADEUS_HOSTNAME", "test")
+AMADEUS_HOST = os.getenv("AMADEUS_HOST")
+AMADEUS_SSL = os.getenv("AMADEUS_SSL", "1").lower() in ("1", "true", "si", "sí")
+
+# Modo de planificación:
+#   "directo": las búsquedas se calculan y ejecutan sin LLM y el planificador hace una sola llamada
+#   "paralelo": los agentes de búsqueda corren en paralelo y luego planifica el planificador
+#   "secuencial": el planificador delega en los agentes de a uno (el esquema original, por defecto)
+MODO_PLANIFICACION = os.getenv("MODO_PLANIFICACION", "secuencial")
+MODOS_PLANIFICACION = ("directo", "paralelo", "secuencial")
+
+# Preferencias de viaje que se pueden elegir en el formulario (hasta MAX_PREFERENCIAS)
+PREFERENCIAS = ("Gastronomía", "Relax", "Naturaleza", "Historia", "Arte", "Compras", "Vida nocturna")
+MAX_PREFERENCIAS = 3
+TIMEOUT_RAMA = float(os.getenv("TIMEOUT_RAMA", "180"))  # segundos por rama de investigación
+PREFETCH_MAX_PARALELO = int(os.getenv("PREFETCH_MAX_PARALELO", "8"))  # búsquedas simultáneas en modo directo
+PIEZAS_MAX_ENTRADAS = int(os.getenv("PIEZAS_MAX_ENTRADAS", "2000"))  # tramos y datos por ciudad que se reutilizan al editar un viaje
+
+# Base local de actividades y restaurantes precalculados por ciudad y preferencia (ver src/conocimiento.py)
+CONOCIMIENTO_ACTIVO = os.getenv("CONOCIMIENTO_ACTIVO", "1").lower() in ("1", "true", "si", "sí")
+CONOCIMIENTO_RUTA = os.getenv(
+    "CONOCIMIENTO_RUTA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "actividades.tsv")
 )
+CONOCIMIENTO_VIGENCIA_DIAS = int(os.getenv("CONOCIMIENTO_VIGENCIA_DIAS", "180"))  # después se vuelve a buscar en vivo
+CONOCIMIENTO_MAX_ITEMS = int(os.getenv("CONOCIMIENTO_MAX_ITEMS", "8"))  # actividades y restaurantes por lista
+
+# Cola de trabajos para generar itinerarios en segundo plano
+TRABAJOS_ALMACEN = os.getenv("TRABAJOS_ALMACEN", "memoria")  # memoria | sqlite
+TRABAJOS_MAX_WORKERS = int(os.getenv("TRABAJOS_MAX_WORKERS", "4"))  # itinerarios generándose a la vez
+TRABAJOS_MAX_PENDIENTES = int(os.getenv("TRABAJOS_MAX_PENDIENTES", "20"))  # itinerarios en espera
+TRABAJOS_RETENCION = int(os.getenv("TRABAJOS_RETENCION", "3600"))  # segundos que se conserva un trabajo
+TRABAJOS_TIMEOUT = int(os.getenv("TRABAJOS_TIMEOUT", "900"))  # segundos tras los que un trabajo sin terminar se da por perdido
+
+# Búsqueda de rutas multi-ciudad con fechas y aeropuertos alternativos
+RUTAS_MAX_PARALELO = int(os.getenv("RUTAS_MAX_PARALELO", "6"))  # búsquedas de vuelos simultáneas
+RUTAS_ANCHO = int(os.getenv("RUTAS_ANCHO", "50"))  # rutas parciales que se conservan en cada tramo
+RUTAS_OFERTAS_POR_TRAMO = int(os.getenv("RUTAS_OFERTAS_POR_TRAMO", "10"))  # ofertas consideradas por tramo
+VUELOS_DIAS_FLEXIBLES = int(os.getenv("VUELOS_DIAS_FLEXIBLES", "0"))  # días de flexibilidad en cada traslado
+RUTAS_CRITERIO = os.getenv("RUTAS_CRITERIO", "precio")  # ruta recomendada: "precio" (más barata) | "duracion" (más rápida)
+
+# Trazas de cada ejecución (spans de crews, agentes, LLM y herramientas)
+TRAZAS_ACTIVAS = os.getenv("TRAZAS_ACTIVAS", "1").lower() in ("1", "true", "si", "sí")
+TRAZAS_DIR = os.getenv("TRAZAS_DIR")  # si se define, cada traza se exporta como JSONL y Chrome trace
+AGENTES_VERBOSE = os.getenv("AGENTES_VERBOSE", "0").lower() in ("1", "true", "si", "sí")
+AGENTES_EN_CACHE = int(os.getenv("AGENTES_EN_CACHE", "16"))  # agentes libres que se conservan por tipo para reutilizar
+
+# Presupuesto de tokens de los prompts: las partes fijas se compactan y, si un prompt
+# supera el máximo, se recortan las salidas de las herramientas y los turnos más viejos
+PROMPT_COMPACTAR = os.getenv("PROMPT_COMPACTAR", "1").lower() in ("1", "true", "si", "sí")
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "6000"))
+PROMPT_TOKENS_TURNO = int(os.getenv("PROMPT_TOKENS_TURNO", "400"))  # tokens que se conservan de cada turno recortado
+
+# Mostrar el progreso y el itinerario a medida que se generan
+STREAMING = os.getenv("STREAMING", "1").lower() in ("1", "true", "si", "sí")
+
+# Límites de tasa por proveedor: "solicitudes_por_segundo,ráfaga"
+def _limite(variable, defecto):
+    tasa, capacidad = os.getenv(variable, defecto).split(",")
+    return float(tasa), float(capacidad)
+
+LIMITES = {
+    "amadeus": _limite("LIMITE_AMADEUS", "8,8"),
+    "serper": _limite("LIMITE_SERPER", "5,10"),
+    "groq": _limite("LIMITE_GROQ", "0.5,3"),
+}
+# Compartir los límites entre procesos mediante un archivo SQLite en CACHE_DIR
+LIMITES_COMPARTIDOS = os.getenv("LIMITES_COMPARTIDOS", "0").lower() in ("1", "true", "si", "sí")
+MAX_REINTENTOS = int(os.getenv("MAX_REINTENTOS", "3"))
+
+
+# Los mensajes de depuración de las herramientas van por logging en lugar de print
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
@@ -0,0 +1,337 @@
+"""Base local de actividades y restaurantes precalculados por ciudad y preferencia.
+
+Para las ciudades más visitadas, la búsqueda de "actividades turísticas más
+populares" devuelve casi siempre lo mismo. El job `generar` arma, para cada
+ciudad y cada una de PREFERENCIAS, una lista ordenada de actividades y otra de
+restaurantes (búsquedas web más una llamada al LLM por ciudad). Las guarda en
+CONOCIMIENTO_RUTA, una línea por ciudad y preferencia:
+
+    código_ciudad<TAB>clave_preferencia<TAB>actualizado<TAB>ciudad<TAB>preferencia<TAB>actividades<TAB>restaurantes
+
+La ciudad se identifica por su código IATA (ver aeropuertos.py), así "Roma",
+"Rome" y "Roma, Italia" comparten entrada. La clave de la preferencia es su
+nombre normalizado y las listas van separadas por " | ", de la más popular a la
+menos popular. Como aeropuertos.tsv, el archivo está ordenado y se consulta con
+mmap y bisección.
+
+Las solicitudes usan estas listas en lugar de buscar actividades en vivo para
+las ciudades cubiertas en todas sus preferencias. Las demás se buscan como siempre.
+
+    python src/conocimiento.py generar                   # ciudades de CIUDADES_POPULARES
+    python src/conocimiento.py generar Roma "Buenos Aires"
+    python src/conocimiento.py mostrar Roma Arte
+"""
+import json
+import logging
+import mmap
+import os
+import sys
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import aeropuertos
+from config import (
+    CONOCIMIENTO_ACTIVO,
+    CONOCIMIENTO_MAX_ITEMS,
+    CONOCIMIENTO_RUTA,
+    CONOCIMIENTO_VIGENCIA_DIAS,
+    PREFERENCIAS,
+    PREFETCH_MAX_PARALELO,
+)
+from prompts import Plantilla
+
+logger = logging.getLogger(__name__)
+
+SEPARADOR = " | "
+
+# Ciudades que genera el job si no se le pasan otras
+CIUDADES_POPULARES = (
+    "París", "Londres", "Roma", "Barcelona", "Madrid", "Ámsterdam", "Berlín", "Praga", "Viena", "Lisboa",
+    "Florencia", "Venecia", "Milán", "Atenas", "Estambul", "Budapest", "Dublín", "Edimburgo", "Bruselas",
+    "Múnich", "Nueva York", "Miami", "Los Ángeles", "San Francisco", "Las Vegas", "Cancún", "Ciudad de México",
+    "Buenos Aires", "Río de Janeiro", "San Pablo", "Santiago", "Lima", "Cusco", "Bogotá", "Cartagena",
+    "Montevideo", "Tokio", "Kioto", "Bangkok", "Singapur", "Dubái", "Sídney", "Marrakech", "El Cairo",
+)
+
+
+@dataclass(slots=True, frozen=True)
+class Entrada:
+    ciudad: str
+    preferencia: str
+    actualizado: date
+    actividades: tuple
+    restaurantes: tuple
+
+
+def _clave_entrada(codigo, preferencia):
+    return f"{codigo}\t{aeropuertos.normalizar(preferencia)}"
+
+
+def _firma(info):
+    # Cambia cuando el archivo se reemplaza (os.replace) o se modifica
+    return info.st_ino, info.st_size, info.st_mtime_ns
+
+
+class IndiceActividades:
+    """Búsqueda exacta por (código de ciudad, preferencia) sobre el archivo de la base.
+
+    El archivo se abre recién en la primera búsqueda y se vuelve a abrir cuando
+    cambia (ej: lo regeneró el job desde otro proceso). Si no existe, ninguna
+    ciudad está cubierta.
+    """
+
+    def __init__(self, ruta=CONOCIMIENTO_RUTA):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        # (firma, mmap o None, inicios de línea): se reemplaza entero, nunca se modifica,
+        # así cada búsqueda trabaja con una versión del archivo aunque otra la recargue
+        self._estado = None
+
+    def _abrir(self):
+        inicios = array("L")
+        try:
+            archivo = open(self.ruta, "rb")
+        except FileNotFoundError:
+            return None, None, inicios
+        with archivo:
+            firma = _firma(os.fstat(archivo.fileno()))
+            if not firma[1]:
+                return firma, None, inicios
+            datos = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        # Posición de inicio de cada línea, para poder bisecar
+        inicios.append(0)
+        fin = datos.find(b"\n")
+        while fin != -1 and fin + 1 < len(datos):
+            inicios.append(fin + 1)
+            fin = datos.find(b"\n", fin + 1)
+        return firma, datos, inicios
+
+    def _cargar(self):
+        # (mmap o None, inicios) de la versión actual del archivo
+        try:
+            firma = _firma(os.stat(self.ruta))
+        except FileNotFoundError:
+            firma = None
+        estado = self._estado
+        if estado is None or estado[0] != firma:
+            with self._lock:
+                estado = self._estado
+                if estado is None or estado[0] != firma:
+                    estado = self._estado = self._abrir()
+        return estado[1], estado[2]
+
+    def recargar(self):
+        """Vuelve a abrir el archivo en la próxima búsqueda (ej: después de regenerarlo).
+
+        Las búsquedas en curso terminan con el mapeo anterior, que se cierra
+        cuando la última deja de usarlo.
+        """
+        with self._lock:
+            self._estado = None
+
+    def _clave(self, datos, inicios, i):
+        inicio = inicios[i]
+        return datos[inicio:datos.find(b"\t", datos.find(b"\t", inicio) + 1)]
+
+    def _fila(self, datos, inicios, i):
+        inicio = inicios[i]
+        fin = datos.find(b"\n", inicio)
+        _, _, actualizado, ciudad, preferencia, actividades, restaurantes = (
+            datos[inicio:fin if fin != -1 else len(datos)].decode("utf-8").split("\t")
+        )
+        return Entrada(
+            ciudad, preferencia, date.fromisoformat(actualizado),
+            tuple(actividades.split(SEPARADOR)) if actividades else (),
+            tuple(restaurantes.split(SEPARADOR)) if restaurantes else (),
+        )
+
+    def buscar(self, codigo, preferencia):
+        """La entrada de la ciudad `codigo` para `preferencia`, o None si no está."""
+        datos, inicios = self._cargar()
+        if datos is None:
+            return None
+        clave = _clave_entrada(codigo, preferencia).encode("utf-8")
+        bajo, alto = 0, len(inicios)
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._clave(datos, inicios, medio) < clave:
+                bajo = medio + 1
+            else:
+                alto = medio
+        if bajo < len(inicios) and self._clave(datos, inicios, bajo) == clave:
+            return self._fila(datos, inicios, bajo)
+        return None
+
+
+indice = IndiceActividades()
+
+
+def buscar(ciudad, preferencia):
+    """Las listas precalculadas de `ciudad` para `preferencia`, o None si no están o están vencidas."""
+    if not CONOCIMIENTO_ACTIVO:
+        return None
+    ubicacion = aeropuertos.resolver(ciudad)
+    if ubicacion is None:
+        return None
+    entrada = indice.buscar(ubicacion.codigo, preferencia)
+    if entrada is None or entrada.actualizado < date.today() - timedelta(days=CONOCIMIENTO_VIGENCIA_DIAS):
+        return None
+    return entrada
+
+
+def actividades_para(ciudad, preferencias):
+    """Texto con las actividades y restaurantes de `ciudad` para el planificador.
+
+    Devuelve None si falta alguna de las preferencias: en ese caso la ciudad se
+    busca en vivo como siempre.
+    """
+    entradas = [buscar(ciudad, preferencia) for preferencia in preferencias]
+    if not entradas or any(entrada is None for entrada in entradas):
+        return None
+    lineas = [f"Actividades más populares en {ciudad}:"]
+    for entrada in entradas:
+        lineas.append(f"{entrada.preferencia}: {'; '.join(entrada.actividades)}")
+        if entrada.restaurantes:
+            lineas.append(f"Restaurantes ({entrada.preferencia}): {'; '.join(entrada.restaurantes)}")
+    return "\n".join(lineas)
+
+
+def separar(destinos, preferencias):
+    """Divide los destinos en ({ciudad: texto} cubiertos por la base, [ciudades a buscar en vivo])."""
+    cubiertas, faltantes = {}, []
+    for ciudad in destinos:
+        texto = actividades_para(ciudad, preferencias)
+        if texto is None:
+            faltantes.append(ciudad)
+        else:
+            cubiertas[ciudad] = texto
+    return cubiertas, faltantes
+
+
+_PROMPT_GENERAR = Plantilla("""Sos un experto en turismo. Para la ciudad de {ciudad} ({pais}), armá listas ordenadas de la MÁS POPULAR a la menos popular para cada una de estas preferencias de viaje: {preferencias}.
+    Para cada preferencia devolvé hasta {maximo} actividades o atracciones concretas y hasta {maximo} restaurantes o bares, siempre con su NOMBRE REAL.
+    **No inventes lugares**: usá los resultados de búsqueda y lo que sepas con certeza. Si no conocés suficientes, devolvé menos.
+    **NO incluyas horarios, precios ni descripciones**, solo los nombres.
+    Respondé SOLO con un JSON, sin texto adicional, con esta forma:
+    {{"<preferencia>": {{"actividades": ["..."], "restaurantes": ["..."]}}}}
+
+    RESULTADOS DE BÚSQUEDA:
+    {busquedas}""")
+
+
+def _consultas(ciudad):
+    # Misma forma que las consultas de prefetch, así se aprovecha la caché web
+    return {
+        preferencia: (f"actividades turísticas más populares en {ciudad} {preferencia}",
+                      f"mejores restaurantes en {ciudad} {preferencia}")
+        for preferencia in PREFERENCIAS
+    }
+
+
+def _leer_json(texto):
+    inicio, fin = texto.find("{"), texto.rfind("}")
+    if inicio == -1 or fin < inicio:
+        raise ValueError("La respuesta del LLM no contiene un JSON")
+    return json.loads(texto[inicio:fin + 1])
+
+
+def _limpiar(nombres):
+    # Nombres únicos, sin los caracteres que usa el formato del archivo
+    limpios = []
+    for nombre in nombres if isinstance(nombres, list) else []:
+        if not isinstance(nombre, str):
+            continue
+        nombre = " ".join(nombre.replace("|", " ").split())
+        if nombre and nombre not in limpios:
+            limpios.append(nombre)
+    return limpios[:CONOCIMIENTO_MAX_ITEMS]
+
+
+def generar_ciudad(ciudad):
+    """Busca y ordena las actividades y restaurantes de `ciudad` para todas las preferencias.
+
+    Devuelve las líneas del archivo para esa ciudad (vacío si no se pudo resolver la ciudad).
+    """
+    # Import diferido: las herramientas y el LLM solo hacen falta en el job
+    from modelo_llm import llm
+    from tools import obtener_buscador_web
+
+    ubicacion = aeropuertos.resolver(ciudad)
+    if ubicacion is None:
+        logger.warning("No se encontró la ciudad %s en el índice de aeropuertos", ciudad)
+        return []
+    buscador = obtener_buscador_web()
+    busquedas = "\n\n".join(
+        buscador._run(consulta) for consultas in _consultas(ubicacion.ciudad).values() for consulta in consultas
+    )
+    prompt = _PROMPT_GENERAR.formatear(
+        ciudad=ubicacion.ciudad, pais=ubicacion.pais, preferencias=", ".join(PREFERENCIAS),
+        maximo=CONOCIMIENTO_MAX_ITEMS, busquedas=busquedas,
+    )
+    respuesta = _leer_json(str(llm.call([{"role": "user", "content": prompt}])))
+    por_preferencia = {aeropuertos.normalizar(k): v for k, v in respuesta.items() if isinstance(v, dict)}
+
+    lineas = []
+    hoy = date.today().isoformat()
+    for preferencia in PREFERENCIAS:
+        listas = por_preferencia.get(aeropuertos.normalizar(preferencia), {})
+        actividades = _limpiar(listas.get("actividades"))
+        if not actividades:
+            continue
+        restaurantes = _limpiar(listas.get("restaurantes"))
+        lineas.append("\t".join((_clave_entrada(ubicacion.codigo, preferencia), hoy, ubicacion.ciudad, preferencia,
+                                 SEPARADOR.join(actividades), SEPARADOR.join(restaurantes))) + "\n")
+    return lineas
+
+
+def generar(ciudades, ruta=CONOCIMIENTO_RUTA):
+    """Regenera las entradas de `ciudades` y las combina con las que ya tenía el archivo.
+
+    Si no se pudo generar ninguna ciudad, el archivo queda como estaba.
+    Devuelve {ciudad: cantidad de preferencias guardadas}.
+    """
+    with ThreadPoolExecutor(max_workers=PREFETCH_MAX_PARALELO, thread_name_prefix="conocimiento") as executor:
+        futuros = {ciudad: executor.submit(generar_ciudad, ciudad) for ciudad in ciudades}
+    nuevas, guardadas = {}, {}
+    for ciudad, futuro in futuros.items():
+        try:
+            lineas = futuro.result()
+        except Exception as e:
+            logger.warning("No se pudieron generar las actividades de %s: %s", ciudad, e)
+            lineas = []
+        guardadas[ciudad] = len(lineas)
+        for linea in lineas:
+            nuevas["\t".join(linea.split("\t", 2)[:2])] = linea
+    if not nuevas:
+        logger.warning("No se generó ninguna ciudad: %s queda sin cambios", ruta)
+        return guardadas
+
+    # Las ciudades regeneradas reemplazan todas sus preferencias anteriores
+    regeneradas = {clave.split("\t")[0] for clave in nuevas}
+    lineas = list(nuevas.values())
+    if os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as archivo:
+            lineas += [linea for linea in archivo if linea.strip() and linea.split("\t", 1)[0] not in regeneradas]
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        archivo.writelines(sorted(lineas))
+    os.replace(temporal, ruta)
+    if ruta == indice.ruta:
+        indice.recargar()
+    return guardadas
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s", force=True)
+    comando, argumentos = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("", [])
+    if comando == "generar":
+        for ciudad, cantidad in generar(argumentos or CIUDADES_POPULARES).items():
+            print(f"{ciudad}: {cantidad} de {len(PREFERENCIAS)} preferencias")
+    elif comando == "mostrar" and len(argumentos) == 2:
+        print(actividades_para(argumentos[0], [argumentos[1]]) or f"{argumentos[0]} no está cubierta para {argumentos[1]}")
+    else:
+        print(__doc__)
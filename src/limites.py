@@ -0,0 +1,177 @@
+import asyncio
+import email.utils
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from config import CACHE_DIR, LIMITES, LIMITES_COMPARTIDOS
+from trazas import registrar
+
+
+class LimitadorTasa:
+    """Token bucket: permite `tasa` solicitudes por segundo con ráfagas de hasta `capacidad`.
+
+    Si se indica `ruta`, el balde vive en un archivo SQLite y lo comparten todos
+    los procesos que usen la misma ruta; si no, se comparte dentro del proceso.
+    También lleva métricas del tiempo que esperan las solicitudes en la cola.
+    """
+
+    def __init__(self, nombre, tasa, capacidad, ruta=None):
+        self.nombre = nombre
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._tokens = capacidad
+        self._ultimo = time.monotonic()
+        self._local = threading.local()
+        self.solicitudes = 0
+        self.esperas = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        if ruta:
+            self._conectar().execute(
+                "CREATE TABLE IF NOT EXISTS baldes (nombre TEXT PRIMARY KEY, tokens REAL NOT NULL, ultimo REAL NOT NULL)"
+            )
+
+    def _conectar(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            self._local.conexion = conexion
+        return conexion
+
+    def _tomar_local(self):
+        # Devuelve 0 si se obtuvo un token, o los segundos a esperar hasta el próximo
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+            self._ultimo = ahora
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.tasa
+
+    def _tomar_compartido(self):
+        # Igual que _tomar_local, pero con el balde en SQLite y bloqueo entre procesos
+        conexion = self._conectar()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            ahora = time.time()
+            fila = conexion.execute("SELECT tokens, ultimo FROM baldes WHERE nombre = ?", (self.nombre,)).fetchone()
+            tokens, ultimo = fila if fila else (self.capacidad, ahora)
+            tokens = min(self.capacidad, tokens + max(0.0, ahora - ultimo) * self.tasa)
+            espera = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                espera = (1 - tokens) / self.tasa
+            conexion.execute(
+                "INSERT OR REPLACE INTO baldes (nombre, tokens, ultimo) VALUES (?, ?, ?)",
+                (self.nombre, tokens, ahora),
+            )
+        finally:
+            conexion.execute("COMMIT")
+        return espera
+
+    def adquirir(self):
+        """Bloquea hasta obtener un token. Devuelve los segundos esperados."""
+        inicio = time.monotonic()
+        tomar = self._tomar_compartido if self.ruta else self._tomar_local
+        while (espera := tomar()) > 0:
+            time.sleep(espera)
+        return self._contabilizar(time.monotonic() - inicio)
+
+    async def adquirir_async(self):
+        """Igual que `adquirir`, pero espera con asyncio.sleep sin bloquear el event loop."""
+        inicio = time.monotonic()
+        while (espera := await self._tomar_async()) > 0:
+            await asyncio.sleep(espera)
+        return self._contabilizar(time.monotonic() - inicio)
+
+    async def _tomar_async(self):
+        if self.ruta:
+            # BEGIN IMMEDIATE puede esperar el bloqueo de otro proceso: se hace fuera del loop
+            return await asyncio.to_thread(self._tomar_compartido)
+        return self._tomar_local()
+
+    def _contabilizar(self, esperado):
+        if esperado > 0.001:
+            registrar(espera_limite=round(esperado, 3))
+        with self._lock:
+            self.solicitudes += 1
+            if esperado > 0.001:
+                self.esperas += 1
+            self.espera_total += esperado
+            self.espera_maxima = max(self.espera_maxima, esperado)
+        return esperado
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "nombre": self.nombre,
+                "solicitudes": self.solicitudes,
+                "esperas": self.esperas,
+                "espera_promedio": self.espera_total / self.solicitudes if self.solicitudes else 0.0,
+                "espera_maxima": self.espera_maxima,
+            }
+
+
+def segundos_retry_after(valor):
+    """Interpreta el encabezado Retry-After (segundos o fecha HTTP). Devuelve None si no es válido."""
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, fecha.timestamp() - time.time())
+
+
+def calcular_espera(intento, retry_after=None, base=1.0, maximo=30.0):
+    """Backoff exponencial con jitter completo; si el proveedor indicó Retry-After, se respeta."""
+    espera = random.uniform(0, min(maximo, base * 2 ** intento))
+    segundos = segundos_retry_after(retry_after) if isinstance(retry_after, str) else retry_after
+    if segundos is not None:
+        espera = max(espera, min(segundos, maximo))
+    return espera
+
+
+def esperar_reintento(intento, retry_after=None, base=1.0, maximo=30.0):
+    time.sleep(calcular_espera(intento, retry_after, base, maximo))
+
+
+async def esperar_reintento_async(intento, retry_after=None, base=1.0, maximo=30.0):
+    await asyncio.sleep(calcular_espera(intento, retry_after, base, maximo))
+
+
+_lock = threading.Lock()
+_limitadores = {}
+
+
+def obtener_limitador(nombre):
+    """Devuelve el limitador del proveedor `nombre` ("amadeus", "serper" o "groq")."""
+    limitador = _limitadores.get(nombre)
+    if limitador is None:
+        with _lock:
+            limitador = _limitadores.get(nombre)
+            if limitador is None:
+                tasa, capacidad = LIMITES[nombre]
+                ruta = None
+                if LIMITES_COMPARTIDOS:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    ruta = os.path.join(CACHE_DIR, "limites.sqlite3")
+                limitador = LimitadorTasa(nombre, tasa, capacidad, ruta)
+                _limitadores[nombre] = limitador
+    return limitador
+
+
+def metricas():
+    """Solicitudes y esperas en la cola de cada limitador creado en el proceso."""
+    return [limitador.metricas() for limitador in list(_limitadores.values())]
@@ -0,0 +1,89 @@
+"""LLM del proceso, con límite de tasa, reintentos y registro en la traza.
+
+Vive aparte de config para que importar la configuración no cargue crewai ni
+litellm: la app los necesita recién al generar el primer itinerario.
+"""
+from functools import partial
+from itertools import chain
+
+from crewai import LLM
+import litellm
+
+from config import GROQ_API_KEY, LLM_API_BASE, LLM_MODELO, MAX_REINTENTOS
+from limites import obtener_limitador, esperar_reintento
+from prompts import ajustar_mensajes
+from trazas import registrar, span
+
+
+class LLMLimitado(LLM):
+    """LLM que respeta el límite de tasa de Groq, reintenta con backoff ante un 429 y registra cada llamada en la traza."""
+
+    def call(self, messages, *args, **kwargs):
+        with span("llm", "llm", modelo=self.model) as registro:
+            messages = ajustar_mensajes(messages)
+            respuesta, reintentos = con_reintentos(partial(super().call, messages, *args, **kwargs))
+            if registro is not None:
+                registrar(reintentos=reintentos, **contar_tokens(self.model, messages, respuesta))
+            return respuesta
+
+
+def con_reintentos(llamar):
+    """Llama a `llamar()` respetando el límite de tasa de Groq y reintenta con backoff ante un 429.
+
+    Devuelve (resultado, reintentos).
+    """
+    for intento in range(MAX_REINTENTOS):
+        obtener_limitador("groq").adquirir()
+        try:
+            return llamar(), intento
+        except litellm.RateLimitError as e:
+            if intento == MAX_REINTENTOS - 1:
+                raise
+            respuesta_http = getattr(e, "response", None)
+            retry_after = respuesta_http.headers.get("retry-after") if respuesta_http is not None else None
+            esperar_reintento(intento, retry_after)
+
+
+def completar_en_stream(mensajes):
+    """Completion en streaming con el LLM del proceso, con el límite de tasa y los reintentos de `con_reintentos`.
+
+    Solo se reintenta hasta recibir el primer fragmento; después el texto ya se
+    le está mostrando al usuario. Devuelve (iterador de chunks, reintentos).
+    """
+    def abrir():
+        respuesta = iter(litellm.completion(
+            model=llm.model,
+            messages=mensajes,
+            temperature=llm.temperature,
+            api_key=llm.api_key,
+            api_base=llm.base_url,
+            timeout=120,
+            stream=True,
+        ))
+        primero = next(respuesta, None)
+        return respuesta if primero is None else chain([primero], respuesta)
+
+    return con_reintentos(abrir)
+
+
+def contar_tokens(modelo, mensajes, respuesta):
+    """Tokens de prompt y de respuesta de una llamada al LLM (estimados con el tokenizador de litellm)."""
+    try:
+        if isinstance(mensajes, str):
+            prompt = litellm.token_counter(model=modelo, text=mensajes)
+        else:
+            prompt = litellm.token_counter(model=modelo, messages=mensajes)
+        completado = litellm.token_counter(model=modelo, text=str(respuesta or ""))
+    except Exception:
+        return {}
+    return {"tokens_prompt": prompt, "tokens_respuesta": completado}
+
+
+# LLM compartido por todos los agentes y solicitudes del proceso
+llm = LLMLimitado(
+    model=LLM_MODELO,
+    temperature=0.2,
+    api_key=GROQ_API_KEY,
+    base_url=LLM_API_BASE,
+    request_timeout=120
+)
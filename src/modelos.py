@@ -0,0 +1,143 @@
+import json
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class Segmento:
+    aerolinea: str
+    numero: str
+    origen: str
+    destino: str
+    salida: str  # hora local, "YYYY-MM-DDTHH:MM"
+    llegada: str
+
+    @property
+    def vuelo(self):
+        return f"{self.aerolinea}{self.numero}"
+
+
+@dataclass(slots=True, frozen=True)
+class Itinerario:
+    duracion: str
+    segmentos: tuple
+
+    @property
+    def escalas(self):
+        return len(self.segmentos) - 1
+
+    @property
+    def salida(self):
+        return self.segmentos[0].salida
+
+    @property
+    def llegada(self):
+        return self.segmentos[-1].llegada
+
+
+@dataclass(slots=True, frozen=True)
+class OfertaVuelo:
+    precio: float
+    moneda: str
+    itinerarios: tuple  # ida y, si la oferta la incluye, vuelta
+
+    @property
+    def escalas(self):
+        return self.itinerarios[0].escalas
+
+    @property
+    def aerolineas(self):
+        return tuple(dict.fromkeys(s.aerolinea for i in self.itinerarios for s in i.segmentos))
+
+    def a_dict(self):
+        return {
+            "precio": self.precio,
+            "moneda": self.moneda,
+            "itinerarios": [
+                {
+                    "duracion": itinerario.duracion,
+                    "segmentos": [
+                        {"vuelo": s.vuelo, "aerolinea": s.aerolinea, "de": s.origen, "a": s.destino,
+                         "sale": s.salida, "llega": s.llegada}
+                        for s in itinerario.segmentos
+                    ],
+                }
+                for itinerario in self.itinerarios
+            ],
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(
+            precio=datos["precio"],
+            moneda=datos["moneda"],
+            itinerarios=tuple(
+                Itinerario(
+                    duracion=i["duracion"],
+                    segmentos=tuple(_segmento_desde_dict(s) for s in i["segmentos"]),
+                )
+                for i in datos["itinerarios"]
+            ),
+        )
+
+
+def _segmento_desde_dict(datos):
+    # Los resultados guardados antes de que existiera "aerolinea" solo tienen el vuelo:
+    # en esos el código de la aerolínea son los dos primeros caracteres (IATA)
+    aerolinea = datos.get("aerolinea") or datos["vuelo"][:2]
+    return Segmento(aerolinea, datos["vuelo"][len(aerolinea):], datos["de"], datos["a"], datos["sale"], datos["llega"])
+
+
+def _parsear_segmento(segmento):
+    salida = segmento["departure"]
+    llegada = segmento["arrival"]
+    return Segmento(
+        segmento["carrierCode"],
+        segmento["number"],
+        salida["iataCode"],
+        llegada["iataCode"],
+        salida["at"][:16],
+        llegada["at"][:16],
+    )
+
+
+def parsear_ofertas(data):
+    """Convierte la respuesta cruda de flight_offers_search en una lista de OfertaVuelo.
+
+    Las ofertas mal formadas se descartan de a una, sin afectar al resto.
+    """
+    ofertas = []
+    for oferta in data:
+        try:
+            precio = oferta["price"]
+            ofertas.append(OfertaVuelo(
+                precio=float(precio["total"]),
+                moneda=precio["currency"],
+                itinerarios=tuple(
+                    Itinerario(i.get("duration", ""), tuple(_parsear_segmento(s) for s in i["segments"]))
+                    for i in oferta["itineraries"]
+                ),
+            ))
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            logger.debug("Oferta de vuelo descartada: %s", e)
+    return ofertas
+
+
+def resultado_a_json(origen, destino, fecha, ofertas):
+    """Forma compacta del resultado de una búsqueda, pensada para cachés, planificadores y tests."""
+    return json.dumps(
+        {"origen": origen, "destino": destino, "fecha": fecha, "ofertas": [o.a_dict() for o in ofertas]},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def resultado_desde_json(texto):
+    """Devuelve (origen, destino, fecha, ofertas) o None si `texto` es un mensaje de error."""
+    if not texto.startswith("{"):
+        return None
+    datos = json.loads(texto)
+    return datos["origen"], datos["destino"], datos["fecha"], [OfertaVuelo.desde_dict(o) for o in datos["ofertas"]]
+
@@ -0,0 +1,357 @@
+import asyncio
+import json
+import logging
+import unicodedata
+from datetime import timedelta
+
+import aeropuertos
+import conocimiento
+from cache import CacheDisco, MemoLRU
+from conexiones import ejecutar_en_loop, obtener_cliente_amadeus
+from config import (CACHE_VUELOS_TTL, CACHE_WEB_TTL, PIEZAS_MAX_ENTRADAS, PREFETCH_MAX_PARALELO, RUTAS_CRITERIO,
+                    VUELOS_DIAS_FLEXIBLES)
+from limites import obtener_limitador
+from modelos import resultado_a_json
+from rutas import TramoFlexible, buscar_tramos_async, consultas_tramos, optimizar_ruta, ventana_fechas
+from tools import obtener_buscador_web
+from trazas import acumular, span
+
+logger = logging.getLogger(__name__)
+
+# Los códigos IATA de una ciudad prácticamente no cambian: se guardan por un mes
+cache_iata = CacheDisco("iata", ttl=30 * 24 * 3600, max_entradas=5000)
+
+# Piezas de los viajes ya planificados: cada tramo de vuelo, los hoteles y las
+# actividades de cada ciudad. Cuando el usuario edita el formulario solo se
+# recalculan las piezas cuyos datos cambiaron: mover las fechas no vuelve a buscar
+# hoteles ni actividades y agregar una ciudad no repite las de las otras.
+piezas = MemoLRU(max_entradas=PIEZAS_MAX_ENTRADAS)
+
+
+def _sin_acentos(texto):
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+
+def resolver_codigo_iata(ciudad):
+    """Devuelve el código IATA de `ciudad` sin pasar por el LLM.
+
+    Primero se busca el nombre exacto en el índice local de aeropuertos; si no
+    está y ya es un código de 3 letras se usa tal cual; después se prueba el
+    índice por prefijo o con tolerancia a errores de tipeo, y como último
+    recurso el buscador de ubicaciones de Amadeus. Devuelve None si no hay
+    coincidencias.
+    """
+    ciudad = ciudad.strip()
+    exactas = aeropuertos.indice.exacto(ciudad)
+    if exactas:
+        return exactas[0].codigo
+    if len(ciudad) == 3 and ciudad.isalpha():
+        return ciudad.upper()
+    ubicacion = aeropuertos.resolver(ciudad)
+    if ubicacion is not None:
+        return ubicacion.codigo
+
+    clave = _sin_acentos(ciudad).casefold()
+    en_cache = cache_iata.obtener(clave)
+    if en_cache is not None:
+        return en_cache or None
+
+    try:
+        obtener_limitador("amadeus").adquirir()
+        respuesta = obtener_cliente_amadeus().reference_data.locations.get(
+            keyword=_sin_acentos(ciudad).upper(), subType="CITY,AIRPORT"
+        )
+        codigo = respuesta.data[0]["iataCode"] if respuesta.data else ""
+    except Exception as e:
+        logger.warning("No se pudo resolver el código IATA de %s: %s", ciudad, e)
+        return None
+    cache_iata.guardar(clave, codigo)
+    return codigo or None
+
+
+def resolver_aeropuertos(ciudad):
+    """Aeropuertos candidatos para `ciudad`, como {código IATA del aeropuerto: código de su ciudad}.
+
+    Incluye todos los aeropuertos de la ciudad (ej: Londres → LHR, LGW, ...) y, si
+    el nombre es ambiguo, los de todas las ciudades que lo comparten (ej: Córdoba →
+    COR en Argentina y ODB en España; "Córdoba, España" desambigua). Si la ciudad
+    no está en el índice local se usa el código de `resolver_codigo_iata`.
+    Devuelve un dict vacío si no hay coincidencias.
+    """
+    ciudad = ciudad.strip()
+    ubicaciones = aeropuertos.indice.exacto(ciudad)
+    if not ubicaciones and not (len(ciudad) == 3 and ciudad.isalpha()):
+        ubicaciones = aeropuertos.buscar(ciudad, limite=1)
+    if ubicaciones:
+        return {aeropuerto: u.codigo for u in ubicaciones for aeropuerto in u.aeropuertos}
+    codigo = resolver_codigo_iata(ciudad)
+    return {codigo: codigo} if codigo else {}
+
+
+def describir_codigos(ciudades):
+    """Texto con los códigos IATA ya resueltos, para incluir en los prompts."""
+    codigos = [(ciudad, resolver_codigo_iata(ciudad)) for ciudad in ciudades]
+    return ", ".join(f"{ciudad}={codigo}" for ciudad, codigo in codigos if codigo)
+
+
+def repartir_dias(destinos, fecha_inicio, fecha_fin):
+    """Reparte los días del viaje entre los destinos.
+
+    Devuelve una lista de (ciudad, fecha_llegada) en orden. Los días que sobran
+    de la división se asignan a los primeros destinos. Si hay más destinos que
+    días, los últimos se visitan en el mismo día que el anterior: ninguna
+    llegada queda después de `fecha_fin`, así la vuelta nunca es anterior al
+    último traslado.
+    """
+    total = max((fecha_fin - fecha_inicio).days, 0)
+    base, resto = divmod(total, len(destinos))
+    estadias = []
+    fecha = fecha_inicio
+    for i, ciudad in enumerate(destinos):
+        estadias.append((ciudad, fecha))
+        fecha = fecha + timedelta(days=base + (1 if i < resto else 0))
+    return estadias
+
+
+def calcular_tramos(origen, destinos, fecha_inicio, fecha_fin):
+    """Calcula los traslados del viaje: ida, cada salto entre destinos y vuelta."""
+    estadias = repartir_dias(destinos, fecha_inicio, fecha_fin)
+    tramos = [{"origen": origen, "destino": destinos[0], "fecha": fecha_inicio}]
+    for (ciudad, _), (siguiente, llegada) in zip(estadias, estadias[1:]):
+        tramos.append({"origen": ciudad, "destino": siguiente, "fecha": llegada})
+    tramos.append({"origen": destinos[-1], "destino": origen, "fecha": fecha_fin})
+    return tramos
+
+
+def calcular_consultas_hoteles(destinos):
+    return {
+        ciudad: {
+            "lujo": f"hoteles lujosos en {ciudad}",
+            "economico": f"hoteles económicos en {ciudad}",
+        }
+        for ciudad in destinos
+    }
+
+
+def calcular_consultas_actividades(destinos, preferencias):
+    gustos = ", ".join(preferencias)
+    return {ciudad: f"actividades turísticas más populares en {ciudad} {gustos}" for ciudad in destinos}
+
+
+def _tramo_flexible(tramo, dias_flexibles=VUELOS_DIAS_FLEXIBLES):
+    # (TramoFlexible, {aeropuerto: ciudad}) con todos los aeropuertos candidatos de
+    # cada extremo, o None si no se pudo resolver alguno de los dos
+    origenes = resolver_aeropuertos(tramo["origen"])
+    destinos = resolver_aeropuertos(tramo["destino"])
+    if not origenes or not destinos:
+        return None
+    flexible = TramoFlexible(tuple(origenes), tuple(destinos), ventana_fechas(tramo["fecha"], dias_flexibles))
+    return flexible, origenes | destinos
+
+
+async def _buscar_tramos(tramos):
+    # Todos los traslados en una sola búsqueda en bloque: las consultas que se repiten
+    # entre tramos se hacen una vez, con hasta RUTAS_MAX_PARALELO en curso a la vez.
+    # Devuelve, por tramo, (TramoFlexible, {consulta: ofertas}, {aeropuerto: ciudad}) o None
+    # Resolver los códigos puede consultar la caché en disco o Amadeus (sincrónicos)
+    resueltos = await asyncio.gather(*(asyncio.to_thread(_tramo_flexible, tramo) for tramo in tramos))
+    resultados = await buscar_tramos_async([resuelto[0] for resuelto in resueltos if resuelto is not None])
+    return [
+        None if resuelto is None
+        else (resuelto[0], {c: resultados[c] for c in consultas_tramos([resuelto[0]])}, resuelto[1])
+        for resuelto in resueltos
+    ]
+
+
+def _resultado_tramo(tramo, busqueda):
+    if busqueda is None:
+        return f"Error: no se encontró el código IATA para {tramo['origen']} o {tramo['destino']}."
+    _, resultados, _ = busqueda
+    return "\n".join(
+        resultado_a_json(origen, destino, fecha, sorted(ofertas, key=lambda o: o.escalas)[:3])
+        for (origen, destino, fecha), ofertas in resultados.items()
+    )
+
+
+def _ruta_optima(busquedas):
+    # La ruta más barata y consistente entre todos los tramos, si se pudieron buscar todos
+    if any(busqueda is None for busqueda in busquedas):
+        return None
+    resultados, ciudades = {}, {}
+    for _, encontrados, aeropuertos_tramo in busquedas:
+        resultados.update(encontrados)
+        ciudades.update(aeropuertos_tramo)
+    return optimizar_ruta([flexible for flexible, _, _ in busquedas], resultados, RUTAS_CRITERIO,
+                          ciudades=ciudades)
+
+
+async def _avisar(pieza, al_progresar, mensaje):
+    valor = await pieza
+    if al_progresar is not None:
+        al_progresar(mensaje)
+    return valor
+
+
+def _ciudad(nombre):
+    return " ".join(nombre.casefold().split())
+
+
+async def _resuelto(valor):
+    return valor
+
+
+async def _pieza(clave, ttl, funcion, argumento, es_valido):
+    # La pieza guardada en `piezas` o, si no está, el resultado de `await funcion(argumento)`
+    # (que se guarda si salió bien)
+    en_memo = piezas.obtener(clave)
+    if en_memo is not None:
+        acumular(piezas_reutilizadas=1)
+        return en_memo
+    acumular(piezas_calculadas=1)
+    valor = await funcion(argumento)
+    if es_valido(valor):
+        piezas.guardar(clave, valor, ttl)
+    return valor
+
+
+def _piezas_en_bloque(claves, ttl, funcion, argumentos, es_valido):
+    # Como _pieza para varias piezas a la vez: las que no están en `piezas` se
+    # calculan juntas con un solo `await funcion(lista de argumentos)`, que
+    # devuelve un valor por cada uno. Devuelve una corrutina por clave
+    en_memo = [piezas.obtener(clave) for clave in claves]
+    faltantes = [i for i, valor in enumerate(en_memo) if valor is None]
+    for valor in en_memo:
+        if valor is not None:
+            acumular(piezas_reutilizadas=1)
+    bloque = None
+    if faltantes:
+        acumular(piezas_calculadas=len(faltantes))
+
+        async def calcular():
+            valores = dict(zip(faltantes, await funcion([argumentos[i] for i in faltantes])))
+            for i, valor in valores.items():
+                if es_valido(valor):
+                    piezas.guardar(claves[i], valor, ttl)
+            return valores
+
+        bloque = asyncio.ensure_future(calcular())
+
+    async def pieza(i):
+        return en_memo[i] if en_memo[i] is not None else (await bloque)[i]
+
+    return [pieza(i) for i in range(len(claves))]
+
+
+def _tramo_valido(busqueda):
+    # Un tramo sin ofertas (código sin resolver o búsquedas fallidas) se vuelve a intentar
+    return busqueda is not None and any(busqueda[1].values())
+
+
+def _web_valido(resultado):
+    return not resultado.startswith("Error")
+
+
+def recopilar_datos(origen, destinos, fecha_inicio, fecha_fin, preferencias, al_progresar=None):
+    """Calcula todas las búsquedas del viaje y las ejecuta en bloque, sin LLM.
+
+    Devuelve un dict con los resultados de vuelos por tramo, hoteles por ciudad
+    y actividades por ciudad, listo para pasarle al planificador, y "completo"
+    en False si alguna búsqueda falló. Si se pasa
+    `al_progresar`, se llama con un mensaje cada vez que termina una búsqueda.
+    Las piezas que ya se calcularon para un viaje anterior se reutilizan de `piezas`.
+
+    Las búsquedas corren con las herramientas async en el event loop compartido
+    del proceso (ver conexiones.ejecutar_en_loop): los viajes que se generan a la
+    vez comparten ese loop y no ocupan un hilo por búsqueda. `al_progresar` se
+    llama desde el hilo del loop.
+    """
+    with span("recopilar_datos", "prefetch", destinos=len(destinos)):
+        return ejecutar_en_loop(
+            _recopilar_datos(origen, destinos, fecha_inicio, fecha_fin, preferencias, al_progresar)
+        )
+
+
+async def _recopilar_datos(origen, destinos, fecha_inicio, fecha_fin, preferencias, al_progresar):
+    tramos = calcular_tramos(origen, destinos, fecha_inicio, fecha_fin)
+    consultas_hoteles = calcular_consultas_hoteles(destinos)
+    consultas_actividades = calcular_consultas_actividades(destinos, preferencias)
+    buscador_web = obtener_buscador_web()
+    limite_web = asyncio.Semaphore(PREFETCH_MAX_PARALELO)
+
+    async def buscar_web(consulta):
+        async with limite_web:
+            return await buscador_web._arun(consulta)
+
+    # Todas las piezas se lanzan como tareas del loop antes de esperar la primera
+    claves_tramos = [
+        ("tramo", _ciudad(tramo["origen"]), _ciudad(tramo["destino"]), tramo["fecha"].isoformat(),
+         VUELOS_DIAS_FLEXIBLES)
+        for tramo in tramos
+    ]
+    tareas_vuelos = [
+        asyncio.ensure_future(
+            _avisar(pieza, al_progresar, f"✈️ Vuelos {tramo['origen']} → {tramo['destino']} listos")
+        )
+        for tramo, pieza in zip(tramos, _piezas_en_bloque(
+            claves_tramos, CACHE_VUELOS_TTL, _buscar_tramos, tramos, _tramo_valido
+        ))
+    ]
+    tareas_hoteles = {
+        ciudad: {
+            tipo: asyncio.ensure_future(_avisar(
+                _pieza(("hoteles", _ciudad(ciudad), tipo), CACHE_WEB_TTL, buscar_web, consulta, _web_valido),
+                al_progresar, f"🏨 Hoteles {'lujosos' if tipo == 'lujo' else 'económicos'} en {ciudad} listos",
+            ))
+            for tipo, consulta in consultas.items()
+        }
+        for ciudad, consultas in consultas_hoteles.items()
+    }
+    # Las actividades dependen de la ciudad y las preferencias, no de las fechas. Las
+    # ciudades de la base local no se buscan: se usan sus listas precalculadas
+    gustos = tuple(sorted(preferencias))
+    precalculadas, _ = conocimiento.separar(destinos, preferencias)
+    acumular(actividades_precalculadas=len(precalculadas))
+    tareas_actividades = {
+        ciudad: asyncio.ensure_future(_avisar(
+            _resuelto(precalculadas[ciudad]) if ciudad in precalculadas else
+            _pieza(("actividades", _ciudad(ciudad), gustos), CACHE_WEB_TTL, buscar_web, consulta, _web_valido),
+            al_progresar, f"🎯 Actividades en {ciudad} listas",
+        ))
+        for ciudad, consulta in consultas_actividades.items()
+    }
+
+    busquedas = [await tarea for tarea in tareas_vuelos]
+    hoteles = {
+        ciudad: {tipo: await tarea for tipo, tarea in tareas.items()}
+        for ciudad, tareas in tareas_hoteles.items()
+    }
+    actividades = {ciudad: await tarea for ciudad, tarea in tareas_actividades.items()}
+    web = [resultado for h in hoteles.values() for resultado in h.values()] + list(actividades.values())
+    return {
+        "vuelos": [dict(tramo, resultado=_resultado_tramo(tramo, b)) for tramo, b in zip(tramos, busquedas)],
+        "ruta_optima": _ruta_optima(busquedas),
+        "hoteles": hoteles,
+        "actividades": actividades,
+        # Con las mismas reglas que `piezas`: si algo falló, el itinerario no se guarda en caché
+        "completo": all(map(_tramo_valido, busquedas)) and all(map(_web_valido, web)),
+    }
+
+
+def formatear_datos(datos):
+    """Convierte los datos recopilados en las secciones de texto que recibe el planificador."""
+    vuelos = "\n\n".join(
+        f"{t['origen']} → {t['destino']} ({t['fecha'].strftime('%Y-%m-%d')}):\n{t['resultado']}"
+        for t in datos["vuelos"]
+    )
+    ruta = datos.get("ruta_optima")
+    if ruta is not None:
+        cual = "la más rápida" if RUTAS_CRITERIO == "duracion" else "la más barata"
+        vuelos += f"\n\nRUTA RECOMENDADA ({cual} con conexiones consistentes, " \
+                  f"total {ruta.precio:.2f} {ruta.ofertas[0].moneda}, " \
+                  f"{ruta.minutos // 60}h{ruta.minutos % 60:02d} de vuelo):\n" + \
+                  json.dumps([o.a_dict() for o in ruta.ofertas], ensure_ascii=False, separators=(",", ":"))
+    hoteles = "\n\n".join(
+        f"{ciudad}:\nLujo: {h['lujo']}\nEconómico: {h['economico']}" for ciudad, h in datos["hoteles"].items()
+    )
+    actividades = "\n\n".join(f"{ciudad}:\n{a}" for ciudad, a in datos["actividades"].items())
+    return {"actividades": actividades, "transportes": vuelos, "hoteles": hoteles}
@@ -0,0 +1,142 @@
+"""Construcción de prompts con presupuesto de tokens.
+
+Las partes fijas de los prompts (backstories, reglas y formato de salida) se
+declaran como `Plantilla`: se compactan una sola vez al importar el módulo y en
+cada ejecución solo se rellenan los campos variables. Si un prompt supera
+PROMPT_MAX_TOKENS, se recortan primero las salidas de las herramientas y, en
+las conversaciones de CrewAI, los turnos intermedios más viejos.
+
+Los tokens ahorrados frente al texto sin compactar se suman en la traza como
+`tokens_ahorrados` del span en curso.
+"""
+import re
+
+import litellm
+
+from config import LLM_MODELO, PROMPT_COMPACTAR, PROMPT_MAX_TOKENS, PROMPT_TOKENS_TURNO
+from trazas import acumular
+
+MARCA_RECORTE = "[…]"
+_ESPACIOS = re.compile(r"[ \t]+")
+
+
+def contar(texto):
+    """Tokens de `texto` con el tokenizador del modelo configurado."""
+    try:
+        return litellm.token_counter(model=LLM_MODELO, text=texto)
+    except Exception:
+        return len(texto) // 4
+
+
+def compactar(texto, lineas_vacias=True):
+    """Quita sangrías, espacios repetidos y líneas repetidas seguidas.
+
+    Con `lineas_vacias=False` también se eliminan las líneas en blanco; si no, se
+    deja como máximo una entre párrafos.
+    """
+    lineas = []
+    for linea in texto.splitlines():
+        linea = _ESPACIOS.sub(" ", linea).strip()
+        if not linea:
+            if lineas_vacias and lineas and lineas[-1]:
+                lineas.append("")
+            continue
+        if lineas and linea == lineas[-1]:
+            continue
+        lineas.append(linea)
+    return "\n".join(lineas).strip()
+
+
+def recortar(texto, cupo, tokens=None):
+    """Acorta `texto` a unos `cupo` tokens, cortando en un fin de línea y marcando el recorte."""
+    tokens = tokens if tokens is not None else contar(texto)
+    if tokens <= cupo:
+        return texto
+    limite = max(0, len(texto) * cupo // max(tokens, 1) - len(MARCA_RECORTE))
+    corte = texto.rfind("\n", 0, limite)
+    return texto[:corte if corte > 0 else limite].rstrip() + "\n" + MARCA_RECORTE
+
+
+class Plantilla:
+    """Parte fija de un prompt con campos `{nombre}`, compactada una sola vez al crearla."""
+
+    def __init__(self, texto):
+        self.original = texto
+        self.texto = compactar(texto, lineas_vacias=False) if PROMPT_COMPACTAR else texto
+        self._tokens = None
+        self._ahorro = None
+
+    @property
+    def tokens(self):
+        # Se mide en el primer uso para no cargar el tokenizador al importar
+        if self._tokens is None:
+            self._tokens = contar(self.texto)
+        return self._tokens
+
+    @property
+    def ahorro(self):
+        if self._ahorro is None:
+            self._ahorro = contar(self.original) - self.tokens
+        return self._ahorro
+
+    def formatear(self, **campos):
+        acumular(tokens_ahorrados=self.ahorro)
+        return self.texto.format(**campos)
+
+
+def _repartir(tokens, presupuesto):
+    # Reparto equitativo: las secciones chicas se quedan enteras y lo que sobra
+    # se divide entre las más largas
+    cupos = {}
+    restante = max(presupuesto, 0)
+    pendientes = sorted(tokens, key=tokens.get)
+    while pendientes:
+        clave = pendientes.pop(0)
+        cupos[clave] = min(tokens[clave], restante // (len(pendientes) + 1))
+        restante -= cupos[clave]
+    return cupos
+
+
+def ajustar_secciones(secciones, presupuesto):
+    """Compacta las salidas de herramientas de `secciones` ({nombre: texto}) para que entren en `presupuesto` tokens.
+
+    Las secciones que no superan su parte del presupuesto quedan enteras; las
+    más largas se recortan al final.
+    """
+    if not PROMPT_COMPACTAR:
+        return secciones
+    originales = sum(contar(texto) for texto in secciones.values())
+    ajustadas = {nombre: compactar(texto) for nombre, texto in secciones.items()}
+    tokens = {nombre: contar(texto) for nombre, texto in ajustadas.items()}
+    if sum(tokens.values()) > presupuesto:
+        cupos = _repartir(tokens, presupuesto)
+        ajustadas = {nombre: recortar(texto, cupos[nombre], tokens[nombre]) for nombre, texto in ajustadas.items()}
+        tokens = {nombre: contar(texto) for nombre, texto in ajustadas.items()}
+    acumular(tokens_ahorrados=originales - sum(tokens.values()))
+    return ajustadas
+
+
+def ajustar_mensajes(mensajes, presupuesto=None):
+    """Recorta los turnos intermedios más viejos de una conversación hasta que entre en `presupuesto` tokens.
+
+    Se conservan enteros los dos primeros mensajes (sistema y tarea) y los dos
+    últimos, que son los que el modelo necesita para decidir el próximo paso.
+    """
+    presupuesto = presupuesto or PROMPT_MAX_TOKENS
+    if not PROMPT_COMPACTAR or isinstance(mensajes, str):
+        return mensajes
+    tokens = [contar(m["content"]) if isinstance(m.get("content"), str) else 0 for m in mensajes]
+    total = sum(tokens)
+    if total <= presupuesto:
+        return mensajes
+    ajustados = list(mensajes)
+    for i in range(2, len(mensajes) - 2):
+        if total <= presupuesto:
+            break
+        if tokens[i] <= PROMPT_TOKENS_TURNO:
+            continue
+        contenido = recortar(compactar(mensajes[i]["content"]), PROMPT_TOKENS_TURNO)
+        total -= tokens[i] - contar(contenido)
+        ajustados[i] = dict(mensajes[i], content=contenido)
+    acumular(tokens_ahorrados=sum(tokens) - total)
+    return ajustados
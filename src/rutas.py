@@ -0,0 +1,160 @@
+import asyncio
+import re
+from dataclasses import dataclass
+from datetime import timedelta
+
+from conexiones import ejecutar_en_loop
+from config import RUTAS_MAX_PARALELO, RUTAS_ANCHO, RUTAS_OFERTAS_POR_TRAMO
+from modelos import resultado_desde_json
+from tools import obtener_buscador_vuelos
+
+PATRON_DURACION = re.compile(r"PT(?:(\d+)H)?(?:(\d+)M)?")
+
+
+@dataclass(slots=True, frozen=True)
+class TramoFlexible:
+    """Un traslado con aeropuertos candidatos en cada extremo y una ventana de fechas."""
+    origenes: tuple
+    destinos: tuple
+    fechas: tuple
+
+
+@dataclass(slots=True, frozen=True)
+class RutaOptima:
+    ofertas: tuple  # una OfertaVuelo por tramo, en orden
+    precio: float
+    minutos: int
+
+
+def ventana_fechas(fecha, dias_flexibles):
+    """Fechas desde `dias_flexibles` antes hasta `dias_flexibles` después de `fecha`."""
+    return tuple(fecha + timedelta(days=d) for d in range(-dias_flexibles, dias_flexibles + 1))
+
+
+def minutos_vuelo(oferta):
+    """Duración total del primer itinerario de la oferta en minutos (ISO 8601, ej: PT13H5M)."""
+    coincidencia = PATRON_DURACION.fullmatch(oferta.itinerarios[0].duracion or "")
+    if not coincidencia:
+        return 0
+    horas, minutos = coincidencia.groups()
+    return int(horas or 0) * 60 + int(minutos or 0)
+
+
+def consultas_tramos(tramos):
+    """Consultas únicas (origen, destino, "YYYY-MM-DD") de los tramos: la misma puede aparecer en varios."""
+    return list(dict.fromkeys(
+        (origen, destino, fecha.strftime("%Y-%m-%d"))
+        for tramo in tramos
+        for origen in tramo.origenes
+        for destino in tramo.destinos
+        for fecha in tramo.fechas
+        if origen != destino
+    ))
+
+
+async def _buscar(consulta, adultos, limite):
+    origen, destino, fecha = consulta
+    async with limite:
+        leido = resultado_desde_json(await obtener_buscador_vuelos()._arun(f"{origen},{destino},{fecha},{adultos}"))
+    return leido[3] if leido else []
+
+
+async def buscar_tramos_async(tramos, adultos=1, max_paralelo=None):
+    """Busca todas las combinaciones de aeropuertos y fechas de los tramos en paralelo.
+
+    Usa `BuscadorVuelos._arun`, con hasta `max_paralelo` consultas en curso a la
+    vez. Devuelve un dict {(origen, destino, "YYYY-MM-DD"): [OfertaVuelo, ...]};
+    las búsquedas fallidas quedan como lista vacía.
+    """
+    consultas = consultas_tramos(tramos)
+    limite = asyncio.Semaphore(max_paralelo or RUTAS_MAX_PARALELO)
+    resultados = await asyncio.gather(*(_buscar(consulta, adultos, limite) for consulta in consultas))
+    return dict(zip(consultas, resultados))
+
+
+def buscar_tramos(tramos, adultos=1, max_paralelo=None):
+    """Como `buscar_tramos_async`, para código sincrónico: corre en el event loop compartido."""
+    return ejecutar_en_loop(buscar_tramos_async(tramos, adultos, max_paralelo))
+
+
+def _candidatas(tramo, resultados, costo, por_tramo):
+    ofertas = [
+        oferta
+        for (origen, destino, fecha), encontradas in resultados.items()
+        if origen in tramo.origenes and destino in tramo.destinos
+        and fecha in {f.strftime("%Y-%m-%d") for f in tramo.fechas}
+        for oferta in encontradas
+    ]
+    return sorted(ofertas, key=costo)[:por_tramo]
+
+
+def _conecta(elegidas, oferta, ciudades):
+    # El vuelo sale de la ciudad donde terminó el anterior (cualquiera de sus
+    # aeropuertos) y después de que aterrizó. Las dos horas son locales de esa misma
+    # ciudad, así que se pueden comparar como texto aunque el viaje cruce husos
+    if not elegidas:
+        return True
+    llegada, salida = elegidas[-1].itinerarios[0].segmentos[-1], oferta.itinerarios[0].segmentos[0]
+    if ciudades and llegada.destino in ciudades and salida.origen in ciudades \
+            and ciudades[llegada.destino] != ciudades[salida.origen]:
+        return False
+    return salida.salida > llegada.llegada
+
+
+def _ciudad_llegada(oferta, ciudades):
+    # Sin el mapa de aeropuertos todas las llegadas de un tramo cuentan como una sola ciudad
+    destino = oferta.itinerarios[0].segmentos[-1].destino
+    return ciudades.get(destino, destino) if ciudades else None
+
+
+def optimizar_ruta(tramos, resultados, criterio="precio", ancho=None, por_tramo=None, ciudades=None):
+    """Combina las ofertas de cada tramo en la ruta más barata ("precio") o más rápida ("duracion").
+
+    Una ruta es consistente si cada vuelo sale de la ciudad donde aterrizó el
+    anterior y después de que llegó. `ciudades` ({aeropuerto: código de ciudad})
+    permite cambiar de aeropuerto dentro de una ciudad (llegar a LHR y salir de
+    LGW) y descarta las rutas que, con un nombre ambiguo, llegan a una ciudad y
+    salen de otra (COR y ODB para Córdoba).
+    Para que las combinaciones no exploten se poda en dos niveles: solo se
+    consideran las `por_tramo` mejores ofertas de cada tramo, y en cada paso se
+    descartan las rutas parciales dominadas (otra que llega a la misma ciudad
+    cuesta lo mismo o menos y llega antes o a la misma hora) y se conservan como
+    mucho `ancho`.
+    Las horas de Amadeus son locales y sin huso: solo se comparan horas de una
+    misma ciudad, nunca la salida de un tramo contra la llegada a otra ciudad.
+    Devuelve una RutaOptima o None si no hay una combinación consistente.
+    """
+    ancho = ancho or RUTAS_ANCHO
+    por_tramo = por_tramo or RUTAS_OFERTAS_POR_TRAMO
+    costo = (lambda o: o.precio) if criterio == "precio" else minutos_vuelo
+
+    # Cada ruta parcial: (costo acumulado, hora de llegada, ofertas elegidas)
+    parciales = [(0.0, "", ())]
+    for tramo in tramos:
+        candidatas = _candidatas(tramo, resultados, costo, por_tramo)
+        extendidas = [
+            (acumulado + costo(oferta), oferta.itinerarios[0].llegada, elegidas + (oferta,))
+            for acumulado, _, elegidas in parciales
+            for oferta in candidatas
+            if _conecta(elegidas, oferta, ciudades)
+        ]
+        if not extendidas:
+            return None
+        # Frente de Pareto sobre (costo, llegada) por ciudad de llegada, y recorte al ancho del haz
+        extendidas.sort(key=lambda r: (r[0], r[1]))
+        parciales = []
+        llegada_minima = {}
+        for ruta in extendidas:
+            ciudad = _ciudad_llegada(ruta[2][-1], ciudades)
+            if ciudad not in llegada_minima or ruta[1] < llegada_minima[ciudad]:
+                parciales.append(ruta)
+                llegada_minima[ciudad] = ruta[1]
+                if len(parciales) == ancho:
+                    break
+
+    _, _, ofertas = parciales[0]
+    return RutaOptima(
+        ofertas=ofertas,
+        precio=sum(o.precio for o in ofertas),
+        minutos=sum(minutos_vuelo(o) for o in ofertas),
+    )
@@ -0,0 +1,372 @@
+"""Punto de entrada sin interfaz: API HTTP y procesamiento en lote de itinerarios.
+
+Recibe viajes en JSON, con los mismos campos y validaciones que el formulario
+de la app:
+
+    {"origen": "Madrid", "destinos": ["Roma", "París"], "fecha_inicio": "2027-05-10",
+     "fecha_fin": "2027-05-16", "preferencias": ["Arte", "Gastronomía"],
+     "modo": "directo", "regenerar": false}
+
+Cada viaje se genera en una cola de trabajos propia (ver trabajos.py), así que
+como máximo corren `concurrencia` a la vez. El resultado es un JSON con el
+itinerario en markdown, dividido también por día, y el resumen de tiempos:
+
+    python src/servicio.py servir --puerto 8080 --concurrencia 8
+    python src/servicio.py lote viajes.json --concurrencia 8 --salida resultados.json --markdown itinerarios/
+
+La API HTTP responde:
+    POST /itinerarios        un viaje o una lista; espera y devuelve los resultados
+                             (con "Accept: text/markdown" y un solo viaje, solo el markdown)
+    POST /trabajos           un viaje o una lista; devuelve enseguida los ids (202)
+    GET  /trabajos/<id>      estado y, si terminó, el resultado
+    GET  /salud              estado del proceso y esperas de los límites de tasa por proveedor
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import aeropuertos
+import limites
+from config import (
+    MAX_PREFERENCIAS,
+    MODOS_PLANIFICACION,
+    PREFERENCIAS,
+    TRABAJOS_MAX_PENDIENTES,
+    TRABAJOS_MAX_WORKERS,
+    TRABAJOS_TIMEOUT,
+)
+from trabajos import EN_CURSO, ERROR, PENDIENTE, TERMINADO, ColaLlena, ColaTrabajos, crear_almacen
+
+logger = logging.getLogger(__name__)
+
+# Encabezado de cada día del itinerario (ej: "**Día 3: ..."), igual que en la app
+PATRON_DIA = re.compile(r"\n(?=\**\s*D[ií]a \d+)")
+PATRON_NUMERO_DIA = re.compile(r"^\W*D[ií]a (\d+)")
+
+
+class SolicitudInvalida(ValueError):
+    """El viaje recibido no tiene los campos o valores que pide el formulario."""
+
+
+def validar_solicitud(datos):
+    """Convierte un viaje en JSON en los argumentos de `ColaTrabajos.enviar`.
+
+    Lanza SolicitudInvalida con el mismo mensaje que mostraría el formulario.
+    """
+    if not isinstance(datos, dict):
+        raise SolicitudInvalida("Cada viaje debe ser un objeto JSON.")
+    origen = str(datos.get("origen") or "").strip()
+    destinos = datos.get("destinos") or []
+    if isinstance(destinos, str):
+        destinos = destinos.split(",")
+    if not isinstance(destinos, list) or not all(isinstance(d, str) for d in destinos):
+        raise SolicitudInvalida("Los destinos deben ser una lista de ciudades (ej: [\"Roma\", \"París\"]).")
+    destinos = [d.strip() for d in destinos if d.strip()]
+    preferencias = datos.get("preferencias") or []
+    if not isinstance(preferencias, list):
+        raise SolicitudInvalida("Las preferencias deben ser una lista (ej: [\"Arte\", \"Gastronomía\"]).")
+    if not origen:
+        raise SolicitudInvalida("Falta la ciudad de origen.")
+    if not destinos:
+        raise SolicitudInvalida("Falta al menos un destino.")
+    try:
+        fecha_inicio = date.fromisoformat(str(datos.get("fecha_inicio")))
+        fecha_fin = date.fromisoformat(str(datos.get("fecha_fin")))
+    except ValueError:
+        raise SolicitudInvalida("Las fechas deben estar en formato YYYY-MM-DD.") from None
+    if fecha_inicio < date.today():
+        raise SolicitudInvalida("La fecha de inicio ya pasó.")
+    if fecha_fin <= fecha_inicio:
+        raise SolicitudInvalida("La fecha de regreso debe ser posterior a la fecha de inicio.")
+    if not preferencias:
+        raise SolicitudInvalida("Falta al menos una preferencia de viaje.")
+    if len(preferencias) > MAX_PREFERENCIAS:
+        raise SolicitudInvalida(f"Se admiten {MAX_PREFERENCIAS} preferencias como máximo.")
+    desconocidas = [p for p in preferencias if p not in PREFERENCIAS]
+    if desconocidas:
+        raise SolicitudInvalida(f"Preferencias desconocidas: {', '.join(map(str, desconocidas))}. "
+                                f"Opciones: {', '.join(PREFERENCIAS)}.")
+    modo = datos.get("modo")
+    if modo is not None and modo not in MODOS_PLANIFICACION:
+        raise SolicitudInvalida(f"Modo desconocido: {modo}. Opciones: {', '.join(MODOS_PLANIFICACION)}.")
+    return {
+        "origen": origen,
+        "destinos": destinos,
+        "fecha_inicio": fecha_inicio,
+        "fecha_fin": fecha_fin,
+        "preferencias": list(preferencias),
+        "dias": str((fecha_fin - fecha_inicio).days + 1),
+        "usar_cache": not datos.get("regenerar", False),
+        "modo": modo,
+    }
+
+
+def avisos_ciudades(solicitud):
+    """Ciudades con más de un lugar posible y cuál se eligió (lo que la app muestra como aviso)."""
+    avisos = []
+    for ciudad in [solicitud["origen"]] + solicitud["destinos"]:
+        opciones = aeropuertos.buscar(ciudad)
+        if len(opciones) > 1:
+            avisos.append(f"Para '{ciudad}' se usó {opciones[0].ciudad}, {opciones[0].pais} ({opciones[0].codigo}).")
+    return avisos
+
+
+def dividir_dias(itinerario):
+    """Secciones del itinerario que empiezan con "Día N", como [{"dia": N, "markdown": ...}]."""
+    dias = []
+    for parte in PATRON_DIA.split("\n" + (itinerario or "")):
+        coincidencia = PATRON_NUMERO_DIA.match(parte.strip())
+        if coincidencia:
+            dias.append({"dia": int(coincidencia.group(1)), "markdown": parte.strip()})
+    return dias
+
+
+def resultado_trabajo(trabajo):
+    """Resultado en JSON de un trabajo de la cola."""
+    solicitud = dict(trabajo["solicitud"])
+    for campo in ("fecha_inicio", "fecha_fin"):
+        solicitud[campo] = str(solicitud[campo])
+    resultado = {
+        "id": trabajo["id"],
+        "estado": trabajo["estado"],
+        "solicitud": solicitud,
+        "progreso": trabajo["progreso"],
+    }
+    if trabajo["estado"] == TERMINADO:
+        resultado.update(
+            itinerario=trabajo["resultado"],
+            dias=dividir_dias(trabajo["resultado"]),
+            duracion_s=round(trabajo["actualizado"] - trabajo["creado"], 3),
+            resumen=trabajo["resumen"],
+        )
+    elif trabajo["estado"] == ERROR:
+        resultado.update(error=trabajo["error"], resumen=trabajo["resumen"])
+    return resultado
+
+
+class Servicio:
+    """Valida viajes, los encola y espera sus resultados.
+
+    Usa una cola de trabajos propia con `concurrencia` workers y hasta
+    `max_pendientes` viajes en espera; pasado ese límite los viajes se rechazan
+    (ColaLlena), igual que en la app. Cada viaje se espera como mucho `timeout`
+    segundos.
+    """
+
+    def __init__(self, concurrencia=TRABAJOS_MAX_WORKERS, max_pendientes=TRABAJOS_MAX_PENDIENTES,
+                 timeout=TRABAJOS_TIMEOUT):
+        self.concurrencia = concurrencia
+        self.timeout = timeout
+        self.cola = ColaTrabajos(crear_almacen(), concurrencia, max_pendientes)
+
+    def enviar(self, datos):
+        """Encola un viaje. Devuelve {"id", "estado", "avisos"} o {"estado": "error", "error"} si no es válido."""
+        try:
+            solicitud = validar_solicitud(datos)
+            trabajo_id = self.cola.enviar(**solicitud)
+        except (SolicitudInvalida, ColaLlena) as e:
+            return {"estado": "rechazado" if isinstance(e, ColaLlena) else ERROR, "error": str(e)}
+        return {"id": trabajo_id, "estado": PENDIENTE, "avisos": avisos_ciudades(solicitud)}
+
+    def esperar(self, trabajo_id, intervalo=0.1):
+        """Resultado del trabajo cuando termina.
+
+        Si no termina en `self.timeout` segundos devuelve su estado actual
+        (pendiente o en curso) con un error; el trabajo sigue y se puede
+        consultar después en /trabajos/<id>.
+        """
+        limite = time.monotonic() + self.timeout
+        while True:
+            trabajo = self.cola.obtener(trabajo_id)
+            if trabajo is None:
+                raise KeyError(f"No existe el trabajo {trabajo_id}")
+            if trabajo["estado"] not in (PENDIENTE, EN_CURSO):
+                return resultado_trabajo(trabajo)
+            if time.monotonic() >= limite:
+                return dict(resultado_trabajo(trabajo), error=f"El itinerario no terminó en {self.timeout} segundos.")
+            time.sleep(intervalo)
+
+    def procesar(self, viajes):
+        """Encola todos los viajes y devuelve sus resultados en el mismo orden."""
+        enviados = [self.enviar(datos) for datos in viajes]
+        resultados = []
+        for enviado in enviados:
+            if "id" not in enviado:
+                resultados.append(enviado)
+                continue
+            resultados.append(dict(self.esperar(enviado["id"]), avisos=enviado["avisos"]))
+        return resultados
+
+    def consultar(self, trabajo_id):
+        trabajo = self.cola.obtener(trabajo_id)
+        return resultado_trabajo(trabajo) if trabajo else None
+
+
+def _crear_manejador(servicio):
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            ruta = urlparse(self.path).path.rstrip("/")
+            if ruta == "/salud":
+                self._responder(200, {"estado": "ok", "concurrencia": servicio.concurrencia,
+                                      "limites": limites.metricas()})
+            elif ruta.startswith("/trabajos/"):
+                resultado = servicio.consultar(ruta.rsplit("/", 1)[1])
+                if resultado is None:
+                    self._responder(404, {"error": "No existe el trabajo."})
+                else:
+                    self._responder(200, resultado)
+            else:
+                self._responder(404, {"error": f"Ruta desconocida: {ruta}"})
+
+        def do_POST(self):
+            ruta = urlparse(self.path).path.rstrip("/")
+            if ruta not in ("/itinerarios", "/trabajos"):
+                self._responder(404, {"error": f"Ruta desconocida: {ruta}"})
+                return
+            try:
+                largo = int(self.headers.get("Content-Length") or 0)
+                datos = json.loads(self.rfile.read(largo) or b"null")
+            except ValueError:
+                self._responder(400, {"error": "El cuerpo debe ser JSON."})
+                return
+            viajes = datos if isinstance(datos, list) else [datos]
+            if not viajes:
+                self._responder(400, {"error": "La lista de viajes está vacía."})
+                return
+
+            if ruta == "/trabajos":
+                enviados = [servicio.enviar(viaje) for viaje in viajes]
+                estado = 202 if any("id" in e for e in enviados) else self._estado_error(enviados[0])
+                self._responder(estado, enviados if isinstance(datos, list) else enviados[0])
+                return
+
+            resultados = servicio.procesar(viajes)
+            if isinstance(datos, list):
+                self._responder(200, resultados)
+                return
+            resultado = resultados[0]
+            if resultado["estado"] == TERMINADO and "text/markdown" in (self.headers.get("Accept") or ""):
+                self._responder(200, resultado["itinerario"], tipo="text/markdown; charset=utf-8")
+                return
+            self._responder(200 if resultado["estado"] == TERMINADO else self._estado_error(resultado), resultado)
+
+        def _estado_error(self, resultado):
+            # Cola llena: 429 para que el gateway reintente; viaje inválido: 400; no terminó
+            # a tiempo: 504; falla al generar: 500
+            if resultado["estado"] == "rechazado":
+                return 429
+            if resultado["estado"] in (PENDIENTE, EN_CURSO):
+                return 504
+            return 500 if "id" in resultado else 400
+
+        def _responder(self, estado, datos, tipo="application/json; charset=utf-8"):
+            if isinstance(datos, str):
+                contenido = datos.encode("utf-8")
+            else:
+                contenido = json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(estado)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(contenido)))
+            if estado == 429:
+                self.send_header("Retry-After", "30")
+            self.end_headers()
+            self.wfile.write(contenido)
+
+        def log_message(self, formato, *args):
+            logger.info("%s - %s", self.address_string(), formato % args)
+
+    return Manejador
+
+
+def servir(host, puerto, concurrencia, max_pendientes):
+    from arranque import precalentar_en_segundo_plano
+
+    servicio = Servicio(concurrencia, max_pendientes)
+    servidor = ThreadingHTTPServer((host, puerto), _crear_manejador(servicio))
+    servidor.daemon_threads = True
+    # Los módulos pesados se cargan mientras llegan las primeras solicitudes
+    precalentar_en_segundo_plano()
+    logger.info("Sirviendo en http://%s:%d con %d itinerarios a la vez", host, servidor.server_address[1], concurrencia)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+def leer_viajes(ruta):
+    """Lee un JSON con un viaje o una lista de viajes, o un JSONL con un viaje por línea ("-" es stdin)."""
+    if ruta == "-":
+        contenido = sys.stdin.read()
+    else:
+        with open(ruta, encoding="utf-8") as f:
+            contenido = f.read()
+    try:
+        datos = json.loads(contenido)
+    except ValueError:
+        return [json.loads(linea) for linea in contenido.splitlines() if linea.strip()]
+    return datos if isinstance(datos, list) else [datos]
+
+
+def guardar_markdown(resultados, directorio):
+    os.makedirs(directorio, exist_ok=True)
+    for i, resultado in enumerate(resultados, 1):
+        if resultado["estado"] != TERMINADO:
+            continue
+        nombre = "-".join(aeropuertos.normalizar(c).replace(" ", "_") for c in resultado["solicitud"]["destinos"])
+        with open(os.path.join(directorio, f"{i:03d}-{nombre}.md"), "w", encoding="utf-8") as f:
+            f.write(resultado["itinerario"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    for nombre in ("servir", "lote"):
+        sub = subcomandos.add_parser(nombre)
+        sub.add_argument("--concurrencia", type=int, default=TRABAJOS_MAX_WORKERS,
+                         help="itinerarios generándose a la vez")
+        if nombre == "servir":
+            sub.add_argument("--host", default="127.0.0.1")
+            sub.add_argument("--puerto", type=int, default=8080)
+            sub.add_argument("--max-pendientes", type=int, default=TRABAJOS_MAX_PENDIENTES,
+                             help="itinerarios en espera antes de responder 429")
+        else:
+            sub.add_argument("entrada", help="JSON o JSONL con los viajes ('-' para leer de stdin)")
+            sub.add_argument("--salida", default="-", help="archivo JSON con los resultados ('-' para stdout)")
+            sub.add_argument("--markdown", help="directorio donde guardar un .md por itinerario")
+    args = parser.parse_args()
+    # force: config ya configuró el logger raíz en LOG_LEVEL (WARNING) al importarse
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s", force=True)
+
+    if args.comando == "servir":
+        servir(args.host, args.puerto, args.concurrencia, args.max_pendientes)
+        return
+
+    viajes = leer_viajes(args.entrada)
+    inicio = time.perf_counter()
+    # En lote todos los viajes quedan en espera: no se rechaza ninguno
+    resultados = Servicio(args.concurrencia, max_pendientes=len(viajes)).procesar(viajes)
+    contenido = json.dumps(resultados, ensure_ascii=False, indent=1, default=str)
+    if args.salida == "-":
+        print(contenido)
+    else:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(contenido)
+    if args.markdown:
+        guardar_markdown(resultados, args.markdown)
+    terminados = sum(1 for r in resultados if r["estado"] == TERMINADO)
+    logger.info("%d de %d itinerarios generados en %.1f s", terminados, len(resultados), time.perf_counter() - inicio)
+    if terminados < len(resultados):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,202 +1,336 @@
+import asyncio
 import json
-import requests
-import time
+import logging
+from functools import lru_cache
 from crewai.tools import BaseTool
-from src.config import SERPER_API_KEY, AMADEUS_API_KEY, AMADEUS_API_SECRET
-from amadeus import Client, ResponseError
 from typing import Optional
+from conexiones import (TIMEOUT, ErrorAmadeus, obtener_amadeus_async, obtener_cliente_amadeus,
+                        obtener_cliente_http_async, obtener_sesion)
+from cache import CacheDisco, SingleFlight, clave_vuelo, normalizar_consulta
+from config import (CACHE_VUELOS_TTL, CACHE_VUELOS_MAX_ENTRADAS, CACHE_WEB_TTL, CACHE_WEB_MAX_ENTRADAS, MAX_REINTENTOS,
+                    SERPER_API_KEY, SERPER_URL)
+from limites import obtener_limitador, esperar_reintento, esperar_reintento_async
+from modelos import parsear_ofertas, resultado_a_json
+from trazas import registrar, span, trazado
+
+logger = logging.getLogger(__name__)
+
+# Cachés compartidas por todas las sesiones y procesos
+cache_vuelos = CacheDisco("ofertas_vuelos", ttl=CACHE_VUELOS_TTL, max_entradas=CACHE_VUELOS_MAX_ENTRADAS)
+cache_web = CacheDisco("web", ttl=CACHE_WEB_TTL, max_entradas=CACHE_WEB_MAX_ENTRADAS)
+
+# Búsquedas web idénticas en curso se resuelven con una sola consulta a Serper
+busquedas_en_vuelo = SingleFlight()
+
+
+def _solicitud_serper(query):
+    # Encabezados y cuerpo de la consulta a Serper, iguales en la versión sync y la async
+    headers = {
+        'X-API-KEY': SERPER_API_KEY,
+        'Content-Type': 'application/json'
+    }
+    return headers, json.dumps({"q": query, "num": 3})
+
+
+def formatear_busqueda(query, data):
+    resultado = f"Búsqueda: '{query}'\n\n"
+    if 'organic' in data and data['organic']:
+        resultado += "RESULTADOS:\n"
+        for i, item in enumerate(data['organic'][:2], 1):
+            title = item.get('title', 'Sin título')
+            link = item.get('link', 'Sin enlace')
+            resultado += f"{i}. {title} - {link}\n"
+    else:
+        resultado += "Sin resultados."
+    return resultado
+
 
 class BuscadorWeb(BaseTool):
     name: str = "buscar_en_web"
     description: str = "Busca información sobre vuelos, hoteles o atracciones turísticas."
     
+    usar_cache: bool = True
+    
+    @trazado("buscar_en_web", "herramienta")
     def _run(self, query: str) -> str:
         try:
             if not query:
                 return "Error: Proporciona una consulta válida."
             
-            url = "https://google.serper.dev/search"
-            payload = json.dumps({"q": query, "num": 3})
-            headers = {
-                'X-API-KEY': SERPER_API_KEY,
-                'Content-Type': 'application/json'
-            }
-            response = requests.post(url, headers=headers, data=payload)
+            clave = normalizar_consulta(query)
+            registrar(consulta=clave)
+            if self.usar_cache:
+                en_cache = cache_web.obtener(clave)
+                if en_cache is not None:
+                    registrar(cache="hit")
+                    return en_cache
+                registrar(cache="miss")
+            
+            # Si otra sesión ya está buscando lo mismo, esperar su resultado
+            return busquedas_en_vuelo.ejecutar(clave, lambda: self._buscar(query, clave))
+        except Exception as e:
+            return f"Error de búsqueda: {str(e)}"
+    
+    @trazado("buscar_en_web", "herramienta")
+    async def _arun(self, query: str) -> str:
+        # Igual que _run, sin bloquear el hilo: la espera del límite de tasa, la
+        # consulta y el backoff ceden el event loop, y la caché en disco (SQLite)
+        # se lee y escribe en un hilo aparte. Si se cancela la tarea, la
+        # cancelación se propaga (CancelledError no es una Exception)
+        try:
+            if not query:
+                return "Error: Proporciona una consulta válida."
+            
+            clave = normalizar_consulta(query)
+            registrar(consulta=clave)
+            if self.usar_cache:
+                en_cache = await asyncio.to_thread(cache_web.obtener, clave)
+                if en_cache is not None:
+                    registrar(cache="hit")
+                    return en_cache
+                registrar(cache="miss")
             
-            if response.status_code == 200:
-                data = response.json()
-                resultado = f"Búsqueda: '{query}'\n\n"
-                if 'organic' in data and data['organic']:
-                    resultado += "RESULTADOS:\n"
-                    for i, item in enumerate(data['organic'][:2], 1):
-                        title = item.get('title', 'Sin título')
-                        link = item.get('link', 'Sin enlace')
-                        resultado += f"{i}. {title} - {link}\n"
-                else:
-                    resultado += "Sin resultados."
-                return resultado
-            else:
-                return f"Error {response.status_code}"
+            return await busquedas_en_vuelo.ejecutar_async(clave, lambda: self._buscar_async(query, clave))
         except Exception as e:
             return f"Error de búsqueda: {str(e)}"
+    
+    def _buscar(self, query: str, clave: str) -> str:
+        # Otra llamada pudo haber completado la búsqueda mientras esperábamos
+        if self.usar_cache:
+            # El miss ya se contó en _run/_arun
+            en_cache = cache_web.obtener(clave, contar=False)
+            if en_cache is not None:
+                return en_cache
+        
+        headers, payload = _solicitud_serper(query)
+        for intento in range(MAX_REINTENTOS):
+            obtener_limitador("serper").adquirir()
+            with span("serper", "http", intento=intento + 1):
+                response = obtener_sesion().post(SERPER_URL, headers=headers, data=payload, timeout=TIMEOUT)
+                registrar(status=response.status_code)
+            if response.status_code not in (429, 503) or intento == MAX_REINTENTOS - 1:
+                break
+            esperar_reintento(intento, response.headers.get("Retry-After"))
+        registrar(reintentos=intento)
+        
+        if response.status_code == 200:
+            resultado = formatear_busqueda(query, response.json())
+            if self.usar_cache:
+                cache_web.guardar(clave, resultado)
+            return resultado
+        else:
+            return f"Error {response.status_code}"
+    
+    async def _buscar_async(self, query: str, clave: str) -> str:
+        if self.usar_cache:
+            # El miss ya se contó en _run/_arun
+            en_cache = await asyncio.to_thread(cache_web.obtener, clave, contar=False)
+            if en_cache is not None:
+                return en_cache
+        
+        headers, payload = _solicitud_serper(query)
+        for intento in range(MAX_REINTENTOS):
+            await obtener_limitador("serper").adquirir_async()
+            with span("serper", "http", intento=intento + 1):
+                async with obtener_cliente_http_async().post(SERPER_URL, headers=headers, data=payload) as response:
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+                    data = await response.json(content_type=None) if status == 200 else None
+                registrar(status=status)
+            if status not in (429, 503) or intento == MAX_REINTENTOS - 1:
+                break
+            await esperar_reintento_async(intento, retry_after)
+        registrar(reintentos=intento)
+        
+        if status == 200:
+            resultado = formatear_busqueda(query, data)
+            if self.usar_cache:
+                await asyncio.to_thread(cache_web.guardar, clave, resultado)
+            return resultado
+        else:
+            return f"Error {status}"
+
+
+def interpretar_consulta_vuelo(consulta):
+    """Valida 'ORIGEN,DESTINO,FECHA_SALIDA[,ADULTOS]' y devuelve (origen, destino, fecha, adultos).
+
+    Si la consulta no es válida lanza ValueError con el mensaje para el agente.
+    """
+    # Parsear la consulta
+    if not consulta or "," not in consulta:
+        raise ValueError("Error: La consulta debe tener formato 'ORIGEN,DESTINO,FECHA_SALIDA' (ej: 'MAD,JFK,2023-12-24')")
+
+    partes = consulta.split(',')
+    if len(partes) < 3:
+        raise ValueError("Error: La consulta debe incluir origen, destino y fecha separados por comas.")
+
+    origen = partes[0].strip().upper()
+    destino = partes[1].strip().upper()
+    fecha = partes[2].strip()
+
+    registrar(origen=origen, destino=destino, fecha=fecha)
+
+    # Validar el formato de los códigos IATA
+    if len(origen) != 3 or len(destino) != 3:
+        raise ValueError("Error: Los códigos de aeropuerto deben ser códigos IATA de 3 letras (ej: MAD, JFK, BCN)")
+
+    # Validar formato de fecha
+    try:
+        # Verificar formato yyyy-mm-dd
+        año, mes, dia = fecha.split('-')
+        if len(año) != 4 or len(mes) != 2 or len(dia) != 2:
+            raise ValueError("Formato de fecha incorrecto")
+    except ValueError:
+        raise ValueError("Error: La fecha debe estar en formato YYYY-MM-DD (ej: 2023-12-24)") from None
+
+    # Número de adultos (opcional, por defecto 1)
+    adultos = 1
+    if len(partes) > 3 and partes[3].strip().isdigit():
+        adultos = int(partes[3].strip())
+
+    return origen, destino, fecha, adultos
+
+
+def _parametros_vuelo(origen, destino, fecha, adultos):
+    return {
+        "originLocationCode": origen,
+        "destinationLocationCode": destino,
+        "departureDate": fecha,
+        "adults": adultos,
+        "max": 5  # Limitar a 5 resultados para ahorrar tokens
+    }
+
 
 class BuscadorVuelos(BaseTool):
     name: str = "buscar_vuelos"
-    description: str = "Busca vuelos reales utilizando la API de Amadeus. Usa el formato: 'ORIGEN,DESTINO,FECHA_SALIDA' (ej: 'MAD,JFK,2023-12-24'). IMPORTANTE: Usa códigos IATA para aeropuertos (3 letras)."
+    description: str = "Busca vuelos reales utilizando la API de Amadeus. Usa el formato: 'ORIGEN,DESTINO,FECHA_SALIDA' (ej: 'MAD,JFK,2023-12-24'). IMPORTANTE: Usa códigos IATA para aeropuertos (3 letras). Devuelve JSON con hasta 3 ofertas (precio, moneda y segmentos con vuelo, aerolínea, horarios y aeropuertos); una lista de ofertas vacía significa que no hay vuelos."
+    usar_cache: bool = True
     
-    # No inicializar el cliente en __init__ para evitar problemas con pydantic
+    # No inicializar el cliente en __init__ para evitar problemas con pydantic;
+    # se usa el cliente compartido del proceso para reutilizar el token OAuth
     def _get_amadeus_client(self):
-        # Debug: Print API credentials (masked for security)
-        api_key = AMADEUS_API_KEY
-        api_secret = AMADEUS_API_SECRET
-        key_masked = api_key[:4] + "****" if api_key and len(api_key) > 4 else "None"
-        secret_masked = "****" + api_secret[-4:] if api_secret and len(api_secret) > 4 else "None"
-        
-        print(f"Debug - API Key: {key_masked}, API Secret: {secret_masked}")
-        
-        if not api_key or not api_secret:
-            raise ValueError("Error: Amadeus API credentials not found in environment variables")
-            
-        return Client(
-            client_id=api_key,
-            client_secret=api_secret
-        )
+        return obtener_cliente_amadeus()
     
+    @trazado("buscar_vuelos", "herramienta")
     def _run(self, consulta: str) -> str:
         try:
-            # Parsear la consulta
-            if not consulta or "," not in consulta:
-                return "Error: La consulta debe tener formato 'ORIGEN,DESTINO,FECHA_SALIDA' (ej: 'MAD,JFK,2023-12-24')"
-            
-            partes = consulta.split(',')
-            if len(partes) < 3:
-                return "Error: La consulta debe incluir origen, destino y fecha separados por comas."
-            
-            origen = partes[0].strip().upper()
-            destino = partes[1].strip().upper()
-            fecha = partes[2].strip()
-            
-            # Log the search parameters
-            print(f"Debug - Buscando vuelos: Origen={origen}, Destino={destino}, Fecha={fecha}")
-            
-            # Validar el formato de los códigos IATA
-            if len(origen) != 3 or len(destino) != 3:
-                return "Error: Los códigos de aeropuerto deben ser códigos IATA de 3 letras (ej: MAD, JFK, BCN)"
-            
-            # Validar formato de fecha
             try:
-                # Verificar formato yyyy-mm-dd
-                año, mes, dia = fecha.split('-')
-                if len(año) != 4 or len(mes) != 2 or len(dia) != 2:
-                    raise ValueError("Formato de fecha incorrecto")
-            except:
-                return "Error: La fecha debe estar en formato YYYY-MM-DD (ej: 2023-12-24)"
+                origen, destino, fecha, adultos = interpretar_consulta_vuelo(consulta)
+            except ValueError as e:
+                return str(e)
             
-            # Número de adultos (opcional, por defecto 1)
-            adultos = 1
-            if len(partes) > 3 and partes[3].strip().isdigit():
-                adultos = int(partes[3].strip())
+            # Consultar la caché antes de ir a Amadeus
+            clave = clave_vuelo(origen, destino, fecha, adultos)
+            if self.usar_cache:
+                en_cache = cache_vuelos.obtener(clave)
+                if en_cache is not None:
+                    registrar(cache="hit")
+                    return en_cache
+                registrar(cache="miss")
             
             # Inicializar el cliente de Amadeus
             try:
                 amadeus = self._get_amadeus_client()
-                print("Debug - Cliente Amadeus inicializado correctamente")
+                # El SDK se importa recién con el primer cliente (ver conexiones)
+                from amadeus import ResponseError
             except Exception as e:
                 return f"Error al inicializar el cliente Amadeus: {str(e)}"
             
             # Búsqueda con reintentos
-            max_reintentos = 3
+            max_reintentos = MAX_REINTENTOS
             for intento in range(max_reintentos):
                 try:
-                    print(f"Debug - Intento {intento+1}/{max_reintentos} de búsqueda")
+                    registrar(reintentos=intento)
                     
                     # Construir los parámetros de la solicitud
-                    params = {
-                        "originLocationCode": origen,
-                        "destinationLocationCode": destino,
-                        "departureDate": fecha,
-                        "adults": adultos,
-                        "max": 5  # Limitar a 5 resultados para ahorrar tokens
-                    }
-                    print(f"Debug - Parámetros de búsqueda: {params}")
-                    
-                    # Realizar la solicitud
-                    response = amadeus.shopping.flight_offers_search.get(**params)
+                    params = _parametros_vuelo(origen, destino, fecha, adultos)
+                    logger.debug("Parámetros de búsqueda: %s", params)
                     
-                    print(f"Debug - Respuesta recibida, contiene {len(response.data)} resultados")
-                    
-                    if not response.data:
-                        return f"❌ No se encontraron vuelos para la ruta {origen} → {destino} en la fecha {fecha}."
-                    
-                    # Ordenar resultados por número de escalas (priorizar vuelos directos)
-                    vuelos_ordenados = sorted(response.data, 
-                                             key=lambda oferta: len(oferta['itineraries'][0]['segments']) - 1)
-                    
-                    # Formatear resultados
-                    resultado = f"✈️ Vuelos de {origen} a {destino} para el {fecha}:\n\n"
-                    
-                    # Limitar a 3 opciones para optimizar tokens
-                    for i, oferta in enumerate(vuelos_ordenados[:3], 1):
-                        try:
-                            precio = oferta['price']['total']
-                            moneda = oferta['price']['currency']
-                            itinerario = oferta['itineraries'][0]
-                            segmentos = itinerario['segments']
-                            duracion = itinerario.get('duration', 'No disponible')
-                            
-                            # Info del primer segmento (salida)
-                            primer_segmento = segmentos[0]
-                            aerolinea_codigo = primer_segmento['carrierCode']
-                            numero_vuelo = primer_segmento['number']
-                            hora_salida = primer_segmento['departure']['at'].replace('T', ' ').split('+')[0]
-                            aeropuerto_salida = primer_segmento['departure']['iataCode']
-                            
-                            # Info del último segmento (llegada final)
-                            ultimo_segmento = segmentos[-1]
-                            hora_llegada = ultimo_segmento['arrival']['at'].replace('T', ' ').split('+')[0]
-                            aeropuerto_llegada = ultimo_segmento['arrival']['iataCode']
-                            
-                            # Número de escalas
-                            escalas = len(segmentos) - 1
-                            texto_escalas = "Directo" if escalas == 0 else f"{escalas} escala{'s' if escalas > 1 else ''}"
-                            
-                            # Formato de salida - Estructurado para evitar duplicaciones
-                            resultado += f"OPCIÓN {i}:\n"
-                            resultado += f"🛫 Aerolínea: {aerolinea_codigo}\n"
-                            resultado += f"🔢 Vuelo: {aerolinea_codigo}{numero_vuelo}\n"
-                            resultado += f"🕒 Salida: {hora_salida} ({aeropuerto_salida})\n"
-                            resultado += f"🕞 Llegada: {hora_llegada} ({aeropuerto_llegada})\n"
-                            resultado += f"⏱️ Duración: {duracion}\n"
-                            resultado += f"🛑 Escalas: {texto_escalas}\n"
-                            resultado += f"💰 Precio: {precio} {moneda}\n\n"
-                        except Exception as e:
-                            print(f"Error al procesar el vuelo {i}: {str(e)}")
-                            continue
+                    # Realizar la solicitud respetando el límite de tasa de Amadeus
+                    obtener_limitador("amadeus").adquirir()
+                    with span("amadeus", "http", intento=intento + 1):
+                        response = amadeus.shopping.flight_offers_search.get(**params)
                     
-                    # Limpiar la respuesta para evitar duplicaciones extrañas
-                    return resultado.strip()
+                    return self._procesar_respuesta(clave, origen, destino, fecha, response.data)
                 
                 except ResponseError as error:
                     error_str = str(error)
                     error_code = error.response.status_code if hasattr(error, 'response') else "Unknown"
                     error_body = error.response.body if hasattr(error, 'response') else "No details"
                     
-                    print(f"Debug - Amadeus API Error: Code={error_code}, Body={error_body}")
+                    logger.warning("Error de la API de Amadeus: código=%s, cuerpo=%s", error_code, error_body)
                     
                     if intento < max_reintentos - 1:
                         # Si es un error de límite de tasa, esperar y reintentar
-                        if "429" in error_str or "rate" in error_str.lower():
-                            tiempo_espera = (intento + 1) * 2  # Backoff exponencial
-                            print(f"Debug - Rate limit detectado, esperando {tiempo_espera} segundos")
-                            time.sleep(tiempo_espera)
+                        if error_code == 429 or "429" in error_str or "rate" in error_str.lower():
+                            headers = getattr(error.response, "headers", None) or {}
+                            logger.info("Límite de tasa de Amadeus alcanzado, reintentando con backoff")
+                            esperar_reintento(intento, headers.get("Retry-After"))
                             continue
                     
                     return f"Error al buscar vuelos: [{error_code}] {error_body}"
                 except Exception as e:
-                    print(f"Debug - Error inesperado: {str(e)}")
+                    logger.warning("Error inesperado al buscar vuelos: %s", e)
+                    if intento < max_reintentos - 1:
+                        esperar_reintento(intento)
+                        continue
+                    
+                    return f"Error inesperado: {str(e)}"
+            
+            return "Error: Se alcanzó el número máximo de reintentos sin éxito."
+            
+        except Exception as e:
+            logger.exception("Error general en BuscadorVuelos")
+            return f"Error en la búsqueda de vuelos: {str(e)}"
+    
+    @trazado("buscar_vuelos", "herramienta")
+    async def _arun(self, consulta: str) -> str:
+        # Igual que _run, pero contra la API REST de Amadeus con aiohttp (el SDK es
+        # solo sincrónico) y con esperas que no bloquean el event loop. La caché en
+        # disco se usa desde un hilo aparte
+        try:
+            try:
+                origen, destino, fecha, adultos = interpretar_consulta_vuelo(consulta)
+            except ValueError as e:
+                return str(e)
+            
+            clave = clave_vuelo(origen, destino, fecha, adultos)
+            if self.usar_cache:
+                en_cache = await asyncio.to_thread(cache_vuelos.obtener, clave)
+                if en_cache is not None:
+                    registrar(cache="hit")
+                    return en_cache
+                registrar(cache="miss")
+            
+            try:
+                amadeus = obtener_amadeus_async()
+            except Exception as e:
+                return f"Error al inicializar el cliente Amadeus: {str(e)}"
+            
+            max_reintentos = MAX_REINTENTOS
+            for intento in range(max_reintentos):
+                try:
+                    registrar(reintentos=intento)
+                    params = _parametros_vuelo(origen, destino, fecha, adultos)
+                    await obtener_limitador("amadeus").adquirir_async()
+                    with span("amadeus", "http", intento=intento + 1):
+                        respuesta = await amadeus.get("/v2/shopping/flight-offers", **params)
+                    return await asyncio.to_thread(
+                        self._procesar_respuesta, clave, origen, destino, fecha, respuesta.get("data", [])
+                    )
+                
+                except ErrorAmadeus as error:
+                    logger.warning("Error de la API de Amadeus: código=%s, cuerpo=%s", error.status_code, error.body)
+                    if intento < max_reintentos - 1 and error.status_code == 429:
+                        logger.info("Límite de tasa de Amadeus alcanzado, reintentando con backoff")
+                        await esperar_reintento_async(intento, error.headers.get("Retry-After"))
+                        continue
+                    
+                    return f"Error al buscar vuelos: [{error.status_code}] {error.body}"
+                except Exception as e:
+                    logger.warning("Error inesperado al buscar vuelos: %s", e)
                     if intento < max_reintentos - 1:
-                        tiempo_espera = (intento + 1) * 2
-                        time.sleep(tiempo_espera)
+                        await esperar_reintento_async(intento)
                         continue
                     
                     return f"Error inesperado: {str(e)}"
@@ -204,5 +338,28 @@ class BuscadorVuelos(BaseTool):
             return "Error: Se alcanzó el número máximo de reintentos sin éxito."
             
         except Exception as e:
-            print(f"Debug - Error general en BuscadorVuelos: {str(e)}")
+            logger.exception("Error general en BuscadorVuelos")
             return f"Error en la búsqueda de vuelos: {str(e)}"
+    
+    def _procesar_respuesta(self, clave, origen, destino, fecha, data):
+        logger.debug("Respuesta recibida, contiene %d resultados", len(data))
+        
+        # Ordenar resultados por número de escalas (priorizar vuelos directos)
+        # y limitar a 3 opciones para optimizar tokens
+        ofertas = sorted(parsear_ofertas(data), key=lambda oferta: oferta.escalas)[:3]
+        resultado = resultado_a_json(origen, destino, fecha, ofertas)
+        if self.usar_cache:
+            cache_vuelos.guardar(clave, resultado)
+        return resultado
+
+
+# Las herramientas no guardan estado por solicitud: una instancia de cada una
+# alcanza para todos los agentes y sesiones del proceso
+@lru_cache(maxsize=None)
+def obtener_buscador_web():
+    return BuscadorWeb()
+
+
+@lru_cache(maxsize=None)
+def obtener_buscador_vuelos():
+    return BuscadorVuelos()
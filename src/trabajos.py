@@ -0,0 +1,276 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import trazas
+from config import (CACHE_DIR, TRABAJOS_ALMACEN, TRABAJOS_MAX_WORKERS, TRABAJOS_MAX_PENDIENTES, TRABAJOS_RETENCION,
+                    TRABAJOS_TIMEOUT)
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+TERMINADO = "terminado"
+ERROR = "error"
+
+INTERRUMPIDO = "El proceso que generaba el itinerario se detuvo antes de terminar. Probá de nuevo."
+
+
+class ColaLlena(Exception):
+    """Se lanza cuando se alcanzó el máximo de trabajos en espera."""
+
+
+class AlmacenMemoria:
+    """Guarda el estado de los trabajos en memoria (solo visible dentro del proceso)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trabajos = {}
+
+    def crear(self, trabajo_id, solicitud):
+        ahora = time.time()
+        with self._lock:
+            # Descartar trabajos viejos para no crecer sin límite
+            for viejo in [i for i, t in self._trabajos.items() if t["actualizado"] < ahora - TRABAJOS_RETENCION]:
+                del self._trabajos[viejo]
+            self._trabajos[trabajo_id] = {
+                "id": trabajo_id,
+                "estado": PENDIENTE,
+                "solicitud": solicitud,
+                "progreso": [],
+                "texto": "",
+                "resultado": None,
+                "error": None,
+                "resumen": [],
+                "creado": ahora,
+                "actualizado": ahora,
+            }
+
+    def actualizar(self, trabajo_id, **campos):
+        with self._lock:
+            trabajo = self._trabajos[trabajo_id]
+            trabajo.update(campos)
+            trabajo["actualizado"] = time.time()
+
+    def agregar_progreso(self, trabajo_id, mensaje):
+        with self._lock:
+            trabajo = self._trabajos[trabajo_id]
+            trabajo["progreso"] = trabajo["progreso"] + [mensaje]
+            trabajo["actualizado"] = time.time()
+
+    def obtener(self, trabajo_id):
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            return dict(trabajo) if trabajo else None
+
+
+class AlmacenSQLite:
+    """Guarda el estado de los trabajos en SQLite, visible desde otros procesos."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._conectar().execute(
+            """CREATE TABLE IF NOT EXISTS trabajos (
+                id TEXT PRIMARY KEY,
+                estado TEXT NOT NULL,
+                solicitud TEXT NOT NULL,
+                progreso TEXT NOT NULL,
+                texto TEXT NOT NULL,
+                resultado TEXT,
+                error TEXT,
+                resumen TEXT NOT NULL DEFAULT '[]',
+                creado REAL NOT NULL,
+                actualizado REAL NOT NULL
+            )"""
+        )
+        try:
+            # Bases creadas antes de que existiera el resumen de tiempos
+            self._conectar().execute("ALTER TABLE trabajos ADD COLUMN resumen TEXT NOT NULL DEFAULT '[]'")
+        except sqlite3.OperationalError:
+            pass
+        self.marcar_interrumpidos(time.time() - TRABAJOS_TIMEOUT)
+
+    def marcar_interrumpidos(self, antes_de):
+        """Pasa a error los trabajos sin terminar que no se actualizan desde `antes_de`.
+
+        Son los que dejó un proceso que se cayó o se reinició: nadie los va a
+        terminar y quien los siga esperaría para siempre.
+        """
+        cursor = self._conectar().execute(
+            "UPDATE trabajos SET estado = ?, error = ?, actualizado = ? WHERE estado IN (?, ?) AND actualizado < ?",
+            (ERROR, INTERRUMPIDO, time.time(), PENDIENTE, EN_CURSO, antes_de),
+        )
+        return cursor.rowcount
+
+    def _conectar(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.row_factory = sqlite3.Row
+            self._local.conexion = conexion
+        return conexion
+
+    def crear(self, trabajo_id, solicitud):
+        ahora = time.time()
+        conexion = self._conectar()
+        conexion.execute("DELETE FROM trabajos WHERE actualizado < ?", (ahora - TRABAJOS_RETENCION,))
+        conexion.execute(
+            "INSERT INTO trabajos (id, estado, solicitud, progreso, texto, creado, actualizado) "
+            "VALUES (?, ?, ?, '[]', '', ?, ?)",
+            (trabajo_id, PENDIENTE, json.dumps(solicitud, default=str, ensure_ascii=False), ahora, ahora),
+        )
+
+    def actualizar(self, trabajo_id, **campos):
+        if "resumen" in campos:
+            campos["resumen"] = json.dumps(campos["resumen"], ensure_ascii=False)
+        campos["actualizado"] = time.time()
+        columnas = ", ".join(f"{nombre} = ?" for nombre in campos)
+        self._conectar().execute(
+            f"UPDATE trabajos SET {columnas} WHERE id = ?", (*campos.values(), trabajo_id)
+        )
+
+    def agregar_progreso(self, trabajo_id, mensaje):
+        conexion = self._conectar()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            (progreso,) = conexion.execute("SELECT progreso FROM trabajos WHERE id = ?", (trabajo_id,)).fetchone()
+            conexion.execute(
+                "UPDATE trabajos SET progreso = ?, actualizado = ? WHERE id = ?",
+                (json.dumps(json.loads(progreso) + [mensaje], ensure_ascii=False), time.time(), trabajo_id),
+            )
+        finally:
+            conexion.execute("COMMIT")
+
+    def obtener(self, trabajo_id):
+        fila = self._conectar().execute("SELECT * FROM trabajos WHERE id = ?", (trabajo_id,)).fetchone()
+        if fila is None:
+            return None
+        trabajo = dict(fila)
+        trabajo["solicitud"] = json.loads(trabajo["solicitud"])
+        trabajo["progreso"] = json.loads(trabajo["progreso"])
+        trabajo["resumen"] = json.loads(trabajo["resumen"])
+        return trabajo
+
+
+class ColaTrabajos:
+    """Ejecuta la generación de itinerarios en un pool acotado de hilos.
+
+    `enviar` devuelve enseguida un id de trabajo; el estado, el progreso y el
+    texto parcial se consultan con `obtener` o se siguen con `seguir`. Como
+    máximo corren `max_workers` trabajos a la vez y esperan `max_pendientes`;
+    pasado ese límite `enviar` lanza `ColaLlena`, para no superar los límites
+    de los proveedores bajo carga.
+    """
+
+    def __init__(self, almacen, max_workers, max_pendientes):
+        self.almacen = almacen
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trabajo")
+        self._cupos = threading.BoundedSemaphore(max_workers + max_pendientes)
+
+    def enviar(self, origen, destinos, fecha_inicio, fecha_fin, preferencias, dias, usar_cache=True, modo=None):
+        if not self._cupos.acquire(blocking=False):
+            raise ColaLlena("Hay demasiados itinerarios en preparación. Probá de nuevo en unos minutos.")
+        trabajo_id = uuid.uuid4().hex
+        solicitud = {
+            "origen": origen,
+            "destinos": destinos,
+            "fecha_inicio": fecha_inicio,
+            "fecha_fin": fecha_fin,
+            "preferencias": preferencias,
+            "dias": dias,
+            "usar_cache": usar_cache,
+            "modo": modo,
+        }
+        try:
+            self.almacen.crear(trabajo_id, solicitud)
+            self._executor.submit(self._ejecutar, trabajo_id, solicitud)
+        except Exception:
+            self._cupos.release()
+            raise
+        return trabajo_id
+
+    def _ejecutar(self, trabajo_id, solicitud):
+        try:
+            with trazas.nueva_traza("itinerario") as traza:
+                try:
+                    # Import diferido: agents importa crewai y las herramientas. Si falla,
+                    # el trabajo termina en error como cualquier otra falla
+                    from agents import generar_itinerario_stream
+
+                    self.almacen.actualizar(trabajo_id, estado=EN_CURSO)
+                    texto = ""
+                    ultimo_guardado = 0.0
+                    for evento in generar_itinerario_stream(**solicitud):
+                        if evento["tipo"] == "progreso":
+                            self.almacen.agregar_progreso(trabajo_id, evento["mensaje"])
+                        elif evento["tipo"] == "texto":
+                            texto += evento["texto"]
+                            # Guardar el texto parcial como mucho cada 200 ms
+                            if time.monotonic() - ultimo_guardado > 0.2:
+                                self.almacen.actualizar(trabajo_id, texto=texto)
+                                ultimo_guardado = time.monotonic()
+                        elif evento["tipo"] == "fin":
+                            self.almacen.actualizar(trabajo_id, estado=TERMINADO, texto=texto,
+                                                    resultado=evento["itinerario"], resumen=trazas.resumen(traza))
+                except Exception as e:
+                    self.almacen.actualizar(trabajo_id, estado=ERROR, error=str(e), resumen=trazas.resumen(traza))
+        finally:
+            # Siempre se libera el cupo, aunque falle hasta el registro del error
+            self._cupos.release()
+
+    def obtener(self, trabajo_id):
+        return self.almacen.obtener(trabajo_id)
+
+    def seguir(self, trabajo_id, intervalo=0.3, timeout=TRABAJOS_TIMEOUT):
+        """Consulta el trabajo periódicamente y genera los mismos eventos que `generar_itinerario_stream`.
+
+        Si el trabajo no termina en `timeout` segundos lanza TimeoutError (el
+        trabajo puede seguir corriendo y consultarse después con `obtener`).
+        """
+        limite = time.monotonic() + timeout
+        vistos = 0
+        largo_texto = 0
+        while True:
+            trabajo = self.almacen.obtener(trabajo_id)
+            if trabajo is None:
+                raise KeyError(f"No existe el trabajo {trabajo_id}")
+            for mensaje in trabajo["progreso"][vistos:]:
+                yield {"tipo": "progreso", "mensaje": mensaje}
+            vistos = len(trabajo["progreso"])
+            if len(trabajo["texto"]) > largo_texto:
+                yield {"tipo": "texto", "texto": trabajo["texto"][largo_texto:]}
+                largo_texto = len(trabajo["texto"])
+            if trabajo["estado"] == TERMINADO:
+                yield {"tipo": "fin", "itinerario": trabajo["resultado"], "resumen": trabajo["resumen"]}
+                return
+            if trabajo["estado"] == ERROR:
+                raise RuntimeError(trabajo["error"])
+            if time.monotonic() >= limite:
+                raise TimeoutError(f"El itinerario no terminó en {timeout} segundos.")
+            time.sleep(intervalo)
+
+
+_lock = threading.Lock()
+_cola = None
+
+
+def crear_almacen():
+    """Almacén de trabajos configurado en TRABAJOS_ALMACEN."""
+    if TRABAJOS_ALMACEN == "sqlite":
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        return AlmacenSQLite(os.path.join(CACHE_DIR, "trabajos.sqlite3"))
+    return AlmacenMemoria()
+
+
+def obtener_cola():
+    """Devuelve la cola de trabajos del proceso, compartida por todas las sesiones."""
+    global _cola
+    if _cola is None:
+        with _lock:
+            if _cola is None:
+                _cola = ColaTrabajos(crear_almacen(), TRABAJOS_MAX_WORKERS, TRABAJOS_MAX_PENDIENTES)
+    return _cola
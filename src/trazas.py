@@ -0,0 +1,220 @@
+"""Trazas por ejecución: spans de crews, agentes, llamadas al LLM y herramientas.
+
+Uso:
+
+    with nueva_traza("itinerario") as traza:
+        with span("buscar_en_web", "herramienta", consulta=q):
+            ...
+            registrar(cache="hit")
+    resumen(traza)
+
+Fuera de una traza activa `span`, `registrar` y `evento` no hacen nada, así que
+dejar la instrumentación siempre encendida cuesta muy poco. Los hilos no heredan
+el contexto: para que los spans de un pool queden en la traza correcta, las
+funciones se envían envueltas con `propagar`.
+"""
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import TRAZAS_ACTIVAS, TRAZAS_DIR
+
+_traza_actual = contextvars.ContextVar("traza_actual", default=None)
+_span_actual = contextvars.ContextVar("span_actual", default=None)
+
+
+class Traza:
+    def __init__(self, nombre):
+        self.id = uuid.uuid4().hex[:12]
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.inicio_epoch = time.time()
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _nuevo(self, nombre, tipo, atributos):
+        padre = _span_actual.get()
+        return {
+            "id": next(self._ids),
+            "padre": padre["id"] if padre else None,
+            "nombre": nombre,
+            "tipo": tipo,
+            "hilo": threading.current_thread().name,
+            "inicio": time.perf_counter() - self.inicio,
+            "duracion": 0.0,
+            "atributos": atributos,
+        }
+
+    def _agregar(self, registro):
+        with self._lock:
+            self.spans.append(registro)
+
+
+def traza_actual():
+    return _traza_actual.get()
+
+
+@contextmanager
+def nueva_traza(nombre):
+    """Abre una traza para la ejecución actual y, si hay TRAZAS_DIR, la exporta al terminar."""
+    if not TRAZAS_ACTIVAS:
+        yield None
+        return
+    traza = Traza(nombre)
+    token = _traza_actual.set(traza)
+    try:
+        with span(nombre, "ejecucion"):
+            yield traza
+    finally:
+        _traza_actual.reset(token)
+        if TRAZAS_DIR:
+            exportar(traza, TRAZAS_DIR)
+
+
+@contextmanager
+def span(nombre, tipo, **atributos):
+    traza = _traza_actual.get()
+    if traza is None:
+        yield None
+        return
+    registro = traza._nuevo(nombre, tipo, atributos)
+    token = _span_actual.set(registro)
+    try:
+        yield registro
+    except BaseException as e:
+        atributos["error"] = str(e)
+        raise
+    finally:
+        _span_actual.reset(token)
+        registro["duracion"] = time.perf_counter() - traza.inicio - registro["inicio"]
+        traza._agregar(registro)
+
+
+def registrar(**atributos):
+    """Agrega atributos al span en curso (ej: cache="hit", reintentos=2)."""
+    actual = _span_actual.get()
+    if actual is not None:
+        actual["atributos"].update(atributos)
+
+
+def acumular(**atributos):
+    """Suma valores numéricos a los atributos del span en curso (ej: tokens_ahorrados=120)."""
+    actual = _span_actual.get()
+    if actual is not None:
+        for nombre, valor in atributos.items():
+            actual["atributos"][nombre] = actual["atributos"].get(nombre, 0) + valor
+
+
+def evento(nombre, tipo, **atributos):
+    """Registra un evento instantáneo (ej: un paso de un agente)."""
+    traza = _traza_actual.get()
+    if traza is not None:
+        traza._agregar(traza._nuevo(nombre, tipo, atributos))
+
+
+def trazado(nombre, tipo):
+    """Decorador que envuelve cada llamada a la función en un span."""
+    def decorador(funcion):
+        if inspect.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envuelta_async(*args, **kwargs):
+                with span(nombre, tipo):
+                    return await funcion(*args, **kwargs)
+            return envuelta_async
+
+        @functools.wraps(funcion)
+        def envuelta(*args, **kwargs):
+            with span(nombre, tipo):
+                return funcion(*args, **kwargs)
+        return envuelta
+    return decorador
+
+
+def propagar(funcion):
+    """Envuelve `funcion` para que corra con la traza y el span padre del contexto actual."""
+    contexto = contextvars.copy_context()
+    return lambda *args, **kwargs: contexto.copy().run(funcion, *args, **kwargs)
+
+
+def a_jsonl(traza):
+    return "".join(
+        json.dumps({"traza": traza.id, **registro}, ensure_ascii=False, default=str) + "\n"
+        for registro in sorted(traza.spans, key=lambda r: r["inicio"])
+    )
+
+
+def a_chrome(traza):
+    """Formato Chrome trace (chrome://tracing o https://ui.perfetto.dev)."""
+    hilos = {}
+    eventos = []
+    for registro in traza.spans:
+        tid = hilos.setdefault(registro["hilo"], len(hilos) + 1)
+        eventos.append({
+            "name": registro["nombre"],
+            "cat": registro["tipo"],
+            "ph": "X" if registro["duracion"] else "i",
+            "ts": registro["inicio"] * 1e6,
+            "dur": registro["duracion"] * 1e6,
+            "pid": 1,
+            "tid": tid,
+            "args": registro["atributos"],
+        })
+    eventos += [
+        {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": hilo}}
+        for hilo, tid in hilos.items()
+    ]
+    return json.dumps({"traceEvents": eventos, "displayTimeUnit": "ms"}, ensure_ascii=False, default=str)
+
+
+def exportar(traza, directorio):
+    os.makedirs(directorio, exist_ok=True)
+    base = os.path.join(directorio, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(traza.inicio_epoch))}-{traza.id}")
+    with open(base + ".jsonl", "w", encoding="utf-8") as archivo:
+        archivo.write(a_jsonl(traza))
+    with open(base + ".trace.json", "w", encoding="utf-8") as archivo:
+        archivo.write(a_chrome(traza))
+
+
+def resumen(traza):
+    """Tiempos agregados por tipo y nombre de span, de mayor a menor tiempo total."""
+    if traza is None:
+        return []
+    filas = {}
+    for registro in traza.spans:
+        if registro["tipo"] == "ejecucion":
+            continue
+        fila = filas.setdefault((registro["tipo"], registro["nombre"]), {
+            "tipo": registro["tipo"],
+            "nombre": registro["nombre"],
+            "llamadas": 0,
+            "total_s": 0.0,
+            "max_s": 0.0,
+            "tokens": 0,
+            "tokens_ahorrados": 0,
+            "cache_hits": 0,
+        })
+        atributos = registro["atributos"]
+        fila["llamadas"] += 1
+        fila["total_s"] += registro["duracion"]
+        fila["max_s"] = max(fila["max_s"], registro["duracion"])
+        fila["tokens"] += atributos.get("tokens_prompt", 0) + atributos.get("tokens_respuesta", 0)
+        fila["tokens_ahorrados"] += atributos.get("tokens_ahorrados", 0)
+        fila["cache_hits"] += 1 if atributos.get("cache") == "hit" else 0
+    total = time.perf_counter() - traza.inicio
+    duracion = max((r["duracion"] for r in traza.spans if r["tipo"] == "ejecucion"), default=total)
+    filas = sorted(filas.values(), key=lambda f: f["total_s"], reverse=True)
+    for fila in filas:
+        fila["total_s"] = round(fila["total_s"], 3)
+        fila["max_s"] = round(fila["max_s"], 3)
+    return [{"tipo": "ejecucion", "nombre": traza.nombre, "llamadas": 1, "total_s": round(duracion, 3),
+             "max_s": round(duracion, 3), "tokens": sum(f["tokens"] for f in filas),
+             "tokens_ahorrados": sum(f["tokens_ahorrados"] for f in filas),
+             "cache_hits": sum(f["cache_hits"] for f in filas)}] + filas
@@ -0,0 +1,70 @@
+import threading
+from datetime import date
+
+import agents
+
+
+def _tipos_falsos(monkeypatch):
+    # Agentes baratos para probar el conjunto de libres sin armar Agents de crewai
+    creados = []
+
+    def crear():
+        creados.append(object())
+        return creados[-1]
+
+    monkeypatch.setattr(agents, "_TIPOS_AGENTE", {"vuelos": crear, "hoteles": crear})
+    monkeypatch.setattr(agents, "_agentes_libres", {})
+    return creados
+
+
+def test_agente_libre_se_reutiliza_entre_hilos(monkeypatch):
+    creados = _tipos_falsos(monkeypatch)
+    with agents._prestar("vuelos") as primero:
+        pass
+    prestados = []
+
+    def prestar():
+        with agents._prestar("vuelos") as agente:
+            prestados.append(agente)
+
+    hilo = threading.Thread(target=prestar)
+    hilo.start()
+    hilo.join()
+    assert prestados == [primero]
+    assert len(creados) == 1
+
+
+def test_crews_simultaneos_no_comparten_agente(monkeypatch):
+    creados = _tipos_falsos(monkeypatch)
+    with agents._prestar("vuelos") as uno, agents._prestar("vuelos") as otro, agents._prestar("hoteles") as hotel:
+        assert len({id(uno), id(otro), id(hotel)}) == 3
+    assert len(creados) == 3
+    assert len(agents._agentes_libres["vuelos"]) == 2
+
+
+def test_libres_acotados_por_tipo(monkeypatch):
+    _tipos_falsos(monkeypatch)
+    monkeypatch.setattr(agents, "AGENTES_EN_CACHE", 1)
+    with agents._prestar("vuelos"), agents._prestar("vuelos"):
+        pass
+    assert len(agents._agentes_libres["vuelos"]) == 1
+
+
+def test_precalentar_deja_un_agente_de_cada_tipo(monkeypatch):
+    creados = _tipos_falsos(monkeypatch)
+    agents.precalentar_agentes()
+    assert {tipo: len(libres) for tipo, libres in agents._agentes_libres.items()} == {"vuelos": 1, "hoteles": 1}
+    with agents._prestar("vuelos"), agents._prestar("hoteles"):
+        pass
+    assert len(creados) == 2
+
+
+def test_los_datos_del_viaje_van_en_la_tarea():
+    # Los agentes son iguales para cualquier solicitud; el viaje aparece en la descripción
+    agente = agents.crear_agente_vuelos()
+    datos = agents._datos_vuelos("Madrid", ["Roma", "París"], date(2027, 5, 10), date(2027, 5, 16))
+    assert "París" not in agente.backstory and "2027-05-10" not in agente.backstory
+    assert "ida de Madrid a Roma el 2027-05-10" in datos
+    assert "vuelta de París a Madrid el 2027-05-16" in datos
+    paso = agents._paso_actividades({}, ["Roma"], ["Arte"], "7")
+    assert "['Roma']" in paso and "7 días" in paso and "Arte" in paso
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+import types
+
+import pytest
+
+import cache
+from cache import CacheDisco, MemoLRU, SingleFlight
+
+
+class Reloj:
+    """Reemplazo de `time.time` que solo avanza cuando el test lo pide."""
+
+    def __init__(self):
+        self.ahora = 1_000_000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(time=reloj))
+    return reloj
+
+
+def _esperar(condicion, timeout=5):
+    limite = time.monotonic() + timeout
+    while not condicion():
+        assert time.monotonic() < limite, "la condición no se cumplió a tiempo"
+        time.sleep(0.001)
+
+
+def test_singleflight_agrupa_llamadas_concurrentes():
+    vuelo = SingleFlight()
+    liberar = threading.Event()
+    llamadas = []
+
+    def consulta():
+        llamadas.append(1)
+        liberar.wait(5)
+        return "resultado"
+
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(vuelo.ejecutar("clave", consulta))) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    # Todos menos el primero quedan esperando la consulta en curso
+    _esperar(lambda: vuelo.agrupadas == 7)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join()
+    assert llamadas == [1]
+    assert resultados == ["resultado"] * 8
+    # Terminada la consulta, la misma clave vuelve a ejecutarse
+    assert vuelo.ejecutar("clave", lambda: "otra") == "otra"
+
+
+def test_singleflight_propaga_el_error_a_todos():
+    vuelo = SingleFlight()
+    liberar = threading.Event()
+
+    def consulta():
+        liberar.wait(5)
+        raise ValueError("sin conexión")
+
+    errores = []
+
+    def llamar():
+        try:
+            vuelo.ejecutar("clave", consulta)
+        except ValueError as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=llamar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    _esperar(lambda: vuelo.agrupadas == 3)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join()
+    assert len(errores) == 4 and len({id(e) for e in errores}) == 1
+    assert vuelo._en_vuelo == {}
+
+
+def test_singleflight_async_agrupa_y_propaga_errores():
+    async def probar():
+        vuelo = SingleFlight()
+        llamadas = []
+
+        async def consulta(valor):
+            llamadas.append(valor)
+            await asyncio.sleep(0.01)
+            if isinstance(valor, Exception):
+                raise valor
+            return valor
+
+        resultados = await asyncio.gather(*(vuelo.ejecutar_async("a", lambda: consulta("uno")) for _ in range(5)))
+        assert resultados == ["uno"] * 5 and llamadas == ["uno"]
+        assert vuelo.agrupadas == 4
+
+        error = ValueError("sin conexión")
+        resultados = await asyncio.gather(
+            *(vuelo.ejecutar_async("b", lambda: consulta(error)) for _ in range(3)), return_exceptions=True
+        )
+        assert resultados == [error] * 3
+        assert vuelo._en_vuelo_async == {}
+
+    asyncio.run(probar())
+
+
+def test_singleflight_async_cancela_cuando_nadie_espera():
+    async def probar():
+        vuelo = SingleFlight()
+        iniciada, cancelada = asyncio.Event(), asyncio.Event()
+
+        async def consulta():
+            iniciada.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelada.set()
+                raise
+            return "resultado"
+
+        primera = asyncio.create_task(vuelo.ejecutar_async("clave", consulta))
+        segunda = asyncio.create_task(vuelo.ejecutar_async("clave", consulta))
+        await iniciada.wait()
+        # Cancelar una de las dos no corta la consulta de la otra
+        primera.cancel()
+        await asyncio.sleep(0)
+        assert not cancelada.is_set()
+        segunda.cancel()
+        await asyncio.wait_for(cancelada.wait(), 1)
+        with pytest.raises(asyncio.CancelledError):
+            await segunda
+        await asyncio.sleep(0)
+        assert vuelo._en_vuelo_async == {}
+
+    asyncio.run(probar())
+
+
+def test_memo_vence_por_ttl(reloj):
+    memo = MemoLRU(max_entradas=10, desactivada=False)
+    memo.guardar("clave", {"valor": 1}, ttl=60)
+    reloj.ahora += 59
+    assert memo.obtener("clave") == {"valor": 1}
+    reloj.ahora += 2
+    assert memo.obtener("clave") is None
+    assert memo.estadisticas() == {"hits": 1, "misses": 1, "entradas": 0}
+
+
+def test_memo_desaloja_la_menos_usada():
+    memo = MemoLRU(max_entradas=2, desactivada=False)
+    memo.guardar("a", 1, ttl=60)
+    memo.guardar("b", 2, ttl=60)
+    memo.obtener("a")
+    memo.guardar("c", 3, ttl=60)
+    assert memo.obtener("b") is None
+    assert (memo.obtener("a"), memo.obtener("c")) == (1, 3)
+
+
+def test_disco_vence_por_ttl(reloj, tmp_path):
+    disco = CacheDisco("prueba", ttl=60, max_entradas=10, directorio=tmp_path, desactivada=False)
+    disco.guardar("clave", ["valor"])
+    disco.guardar("corta", "valor", ttl=5)
+    reloj.ahora += 30
+    assert disco.obtener("clave") == ["valor"]
+    assert disco.obtener("corta") is None
+    reloj.ahora += 31
+    assert disco.obtener("clave") is None
+    assert disco.estadisticas()["entradas"] == 0
+
+
+def test_disco_desaloja_las_menos_usadas(reloj, tmp_path):
+    disco = CacheDisco("prueba", ttl=60, max_entradas=3, directorio=tmp_path, desactivada=False)
+    for clave in "abcde":
+        disco.guardar(clave, clave)
+        reloj.ahora += 1
+    disco.obtener("a")
+    reloj.ahora += 1
+    disco.desalojar()
+    assert disco.estadisticas()["entradas"] == 3
+    assert [disco.obtener(clave, contar=False) for clave in "abcde"] == ["a", None, None, "d", "e"]
+
+
+def test_disco_se_comparte_entre_instancias(tmp_path):
+    # Dos procesos abren el mismo archivo: lo que guarda uno lo ve el otro
+    uno = CacheDisco("prueba", ttl=60, max_entradas=10, directorio=tmp_path, desactivada=False)
+    otro = CacheDisco("prueba", ttl=60, max_entradas=10, directorio=tmp_path, desactivada=False)
+    uno.guardar("clave", {"precio": 10})
+    assert otro.obtener("clave") == {"precio": 10}
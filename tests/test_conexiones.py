@@ -0,0 +1,57 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conexiones import cerrar_cliente_http_async, ejecutar_en_loop, obtener_cliente_http_async
+
+
+def test_sesion_async_por_loop_se_cierra_al_terminar():
+    async def usar():
+        cliente = obtener_cliente_http_async()
+        assert obtener_cliente_http_async() is cliente
+        await asyncio.sleep(0)
+        return cliente
+
+    primera, segunda = asyncio.run(usar()), asyncio.run(usar())
+    assert primera is not segunda
+    assert primera.closed and segunda.closed
+
+
+def test_cerrar_a_mano_y_volver_a_pedir():
+    async def usar():
+        cliente = obtener_cliente_http_async()
+        await cerrar_cliente_http_async()
+        assert cliente.closed
+        return obtener_cliente_http_async() is not cliente
+
+    assert asyncio.run(usar())
+
+
+def test_ejecutar_en_loop_comparte_el_loop_y_el_contexto():
+    variable = contextvars.ContextVar("variable", default=None)
+
+    async def leer():
+        return asyncio.get_running_loop(), threading.current_thread().name, variable.get()
+
+    def desde_un_hilo(valor):
+        variable.set(valor)
+        return ejecutar_en_loop(leer())
+
+    with ThreadPoolExecutor(2) as executor:
+        (loop_a, hilo_a, valor_a), (loop_b, hilo_b, valor_b) = executor.map(desde_un_hilo, ["a", "b"])
+    assert loop_a is loop_b
+    assert hilo_a == hilo_b != threading.current_thread().name
+    assert (valor_a, valor_b) == ("a", "b")
+
+
+def test_ejecutar_en_loop_desde_el_loop_falla():
+    async def anidada():
+        async def nada():
+            return None
+        with pytest.raises(RuntimeError):
+            ejecutar_en_loop(nada())
+
+    ejecutar_en_loop(anidada())
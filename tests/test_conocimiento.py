@@ -0,0 +1,81 @@
+import gc
+import os
+import threading
+import weakref
+from datetime import date
+
+import conocimiento
+from conocimiento import IndiceActividades
+
+LINEA = f"FCO\tarte\t{date.today().isoformat()}\tRoma\tArte\tMuseos Vaticanos | Coliseo\tRoscioli\n"
+
+
+def test_generar_no_reescribe_el_archivo_si_fallan_todas(tmp_path, monkeypatch):
+    ruta = tmp_path / "actividades.tsv"
+    ruta.write_text(LINEA, encoding="utf-8")
+
+    def fallar(ciudad):
+        raise RuntimeError("sin conexión")
+
+    monkeypatch.setattr(conocimiento, "generar_ciudad", fallar)
+    assert conocimiento.generar(["Roma", "París"], ruta=str(ruta)) == {"Roma": 0, "París": 0}
+    assert ruta.read_text(encoding="utf-8") == LINEA
+
+
+def test_generar_reemplaza_la_ciudad_regenerada(tmp_path, monkeypatch):
+    ruta = tmp_path / "actividades.tsv"
+    otra = LINEA.replace("FCO", "CDG").replace("Roma", "París")
+    ruta.write_text(otra + LINEA, encoding="utf-8")
+    nueva = LINEA.replace("Coliseo", "Panteón")
+    monkeypatch.setattr(conocimiento, "generar_ciudad", lambda ciudad: [nueva] if ciudad == "Roma" else [])
+    assert conocimiento.generar(["Roma", "Lima"], ruta=str(ruta)) == {"Roma": 1, "Lima": 0}
+    assert ruta.read_text(encoding="utf-8") == otra + nueva
+
+
+def test_recargar_cierra_el_archivo_anterior_cuando_nadie_lo_usa(tmp_path):
+    ruta = tmp_path / "actividades.tsv"
+    ruta.write_text(LINEA, encoding="utf-8")
+    indice = IndiceActividades(str(ruta))
+    assert indice.buscar("FCO", "Arte").actividades == ("Museos Vaticanos", "Coliseo")
+    anterior = weakref.ref(indice._estado[1])
+    indice.recargar()
+    gc.collect()
+    assert anterior() is None
+
+
+def test_se_recarga_si_el_archivo_cambia(tmp_path):
+    # El job puede regenerar el archivo desde otro proceso, sin llamar a recargar
+    ruta = tmp_path / "actividades.tsv"
+    indice = IndiceActividades(str(ruta))
+    assert indice.buscar("FCO", "Arte") is None
+    ruta.write_text(LINEA, encoding="utf-8")
+    assert indice.buscar("FCO", "Arte").actividades == ("Museos Vaticanos", "Coliseo")
+    temporal = tmp_path / "nuevo.tsv"
+    temporal.write_text(LINEA.replace("Coliseo", "Panteón"), encoding="utf-8")
+    os.replace(temporal, ruta)
+    assert indice.buscar("FCO", "Arte").actividades == ("Museos Vaticanos", "Panteón")
+
+
+def test_busquedas_mientras_se_recarga(tmp_path):
+    ruta = tmp_path / "actividades.tsv"
+    ruta.write_text(LINEA, encoding="utf-8")
+    indice = IndiceActividades(str(ruta))
+    errores = []
+    fin = threading.Event()
+
+    def buscar():
+        while not fin.is_set():
+            try:
+                assert indice.buscar("FCO", "Arte").ciudad == "Roma"
+            except Exception as e:
+                errores.append(e)
+
+    hilos = [threading.Thread(target=buscar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for _ in range(300):
+        indice.recargar()
+    fin.set()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == []
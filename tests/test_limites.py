@@ -0,0 +1,84 @@
+import email.utils
+import types
+
+import pytest
+
+import limites
+import tools
+from limites import LimitadorTasa, calcular_espera, esperar_reintento
+
+
+class Reloj:
+    """Reemplazo de `time` que solo avanza cuando alguien duerme o el test lo pide."""
+
+    def __init__(self):
+        self.ahora = 1_000_000.0
+        self.esperas = []
+
+    def time(self):
+        return self.ahora
+
+    monotonic = time
+
+    def sleep(self, segundos):
+        self.esperas.append(round(segundos, 6))
+        self.ahora += segundos
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(limites, "time", reloj)
+    return reloj
+
+
+@pytest.fixture
+def sin_jitter(monkeypatch):
+    # El backoff sortea entre 0 y el máximo del intento: con 0 solo queda Retry-After
+    monkeypatch.setattr(limites, "random", types.SimpleNamespace(uniform=lambda a, b: a))
+
+
+def test_balde_se_rellena_a_la_tasa(reloj):
+    limitador = LimitadorTasa("prueba", tasa=2, capacidad=2)
+    assert [limitador.adquirir() for _ in range(3)] == [0.0, 0.0, 0.5]
+    assert reloj.esperas == [0.5]
+    # Pasado mucho tiempo el balde se llena solo hasta su capacidad
+    reloj.ahora += 60
+    assert [limitador.adquirir() for _ in range(3)] == [0.0, 0.0, 0.5]
+    assert limitador.metricas()["esperas"] == 2
+
+
+def test_balde_compartido_por_sqlite(reloj, tmp_path):
+    # Dos limitadores con la misma ruta son dos procesos consumiendo del mismo balde
+    ruta = str(tmp_path / "limites.sqlite3")
+    uno = LimitadorTasa("serper", tasa=1, capacidad=2, ruta=ruta)
+    otro = LimitadorTasa("serper", tasa=1, capacidad=2, ruta=ruta)
+    assert uno.adquirir() == 0.0
+    assert otro.adquirir() == 0.0
+    assert uno.adquirir() == 1.0
+    # Otro proveedor en el mismo archivo tiene su propio balde
+    assert LimitadorTasa("amadeus", tasa=1, capacidad=1, ruta=ruta).adquirir() == 0.0
+
+
+def test_retry_after_en_segundos_y_fecha(reloj, sin_jitter):
+    assert calcular_espera(0, "7") == 7.0
+    fecha = email.utils.formatdate(reloj.ahora + 12, usegmt=True)
+    assert calcular_espera(0, fecha) == pytest.approx(12.0)
+    # Nunca más que el máximo, y un valor inválido deja solo el backoff
+    assert calcular_espera(0, "3600", maximo=30.0) == 30.0
+    assert calcular_espera(0, "pronto") == 0.0
+    esperar_reintento(1, "4")
+    assert reloj.esperas == [4.0]
+
+
+def test_busqueda_web_respeta_retry_after(reloj, sin_jitter, monkeypatch):
+    respuestas = [
+        types.SimpleNamespace(status_code=429, headers={"Retry-After": "5"}),
+        types.SimpleNamespace(status_code=200, headers={}, json=lambda: {"organic": []}),
+    ]
+    sesion = types.SimpleNamespace(post=lambda *args, **kwargs: respuestas.pop(0))
+    monkeypatch.setattr(tools, "obtener_sesion", lambda: sesion)
+    monkeypatch.setattr(tools, "obtener_limitador", lambda nombre: LimitadorTasa(nombre, tasa=10, capacidad=10))
+    tools.BuscadorWeb(usar_cache=False)._buscar("museos en roma", "museos en roma")
+    assert reloj.esperas == [5.0]
+    assert respuestas == []
@@ -0,0 +1,74 @@
+import litellm
+import pytest
+
+import modelo_llm
+
+
+def _limite_429():
+    return litellm.RateLimitError("429", llm_provider="groq", model="bench")
+
+
+@pytest.fixture(autouse=True)
+def sin_esperas(monkeypatch):
+    monkeypatch.setattr(modelo_llm, "esperar_reintento", lambda intento, retry_after=None: None)
+
+
+def test_stream_reintenta_antes_del_primer_fragmento(monkeypatch):
+    llamadas = []
+
+    def completion(**opciones):
+        llamadas.append(opciones)
+        if len(llamadas) == 1:
+            raise _limite_429()
+        return iter(["Día 1", "Día 2"])
+
+    monkeypatch.setattr(litellm, "completion", completion)
+    respuesta, reintentos = modelo_llm.completar_en_stream([{"role": "user", "content": "hola"}])
+    assert list(respuesta) == ["Día 1", "Día 2"]
+    assert reintentos == 1
+    assert llamadas[-1]["stream"] is True
+
+
+def test_stream_reintenta_si_el_429_llega_con_el_primer_fragmento(monkeypatch):
+    intentos = []
+
+    def fragmentos():
+        if len(intentos) == 1:
+            raise _limite_429()
+        yield "Día 1"
+
+    def completion(**opciones):
+        intentos.append(opciones)
+        return fragmentos()
+
+    monkeypatch.setattr(litellm, "completion", completion)
+    respuesta, reintentos = modelo_llm.completar_en_stream([{"role": "user", "content": "hola"}])
+    assert list(respuesta) == ["Día 1"]
+    assert reintentos == 1
+
+
+def test_stream_no_reintenta_despues_del_primer_fragmento(monkeypatch):
+    llamadas = []
+
+    def fragmentos():
+        yield "Día 1"
+        raise _limite_429()
+
+    def completion(**opciones):
+        llamadas.append(opciones)
+        return fragmentos()
+
+    monkeypatch.setattr(litellm, "completion", completion)
+    respuesta, _ = modelo_llm.completar_en_stream([{"role": "user", "content": "hola"}])
+    assert next(respuesta) == "Día 1"
+    with pytest.raises(litellm.RateLimitError):
+        next(respuesta)
+    assert len(llamadas) == 1
+
+
+def test_reintentos_agotados(monkeypatch):
+    def llamar():
+        raise _limite_429()
+
+    with pytest.raises(litellm.RateLimitError):
+        modelo_llm.con_reintentos(llamar)
@@ -0,0 +1,29 @@
+from modelos import Itinerario, OfertaVuelo, Segmento, resultado_a_json, resultado_desde_json
+
+
+def _oferta(*segmentos):
+    return OfertaVuelo(250.0, "EUR", (Itinerario("PT5H", segmentos),))
+
+
+def test_ida_y_vuelta_por_json_conserva_la_aerolinea():
+    oferta = _oferta(
+        Segmento("IB", "3250", "MAD", "FCO", "2027-05-10T08:00", "2027-05-10T10:30"),
+        # Código ICAO de 3 letras y número con prefijo
+        Segmento("AAL", "X12", "FCO", "CDG", "2027-05-10T12:00", "2027-05-10T14:05"),
+    )
+    origen, destino, fecha, ofertas = resultado_desde_json(resultado_a_json("MAD", "CDG", "2027-05-10", [oferta]))
+    assert (origen, destino, fecha) == ("MAD", "CDG", "2027-05-10")
+    assert ofertas == [oferta]
+    assert oferta.aerolineas == ("IB", "AAL")
+
+
+def test_desde_dict_sin_aerolinea():
+    # Resultados guardados en caché antes de que existiera el campo
+    datos = _oferta(Segmento("IB", "3250", "MAD", "FCO", "2027-05-10T08:00", "2027-05-10T10:30")).a_dict()
+    del datos["itinerarios"][0]["segmentos"][0]["aerolinea"]
+    segmento = OfertaVuelo.desde_dict(datos).itinerarios[0].segmentos[0]
+    assert (segmento.aerolinea, segmento.numero) == ("IB", "3250")
+
+
+def test_resultado_con_error():
+    assert resultado_desde_json("Error al buscar vuelos: [500]") is None
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+import prefetch
+from cache import MemoLRU
+from prefetch import calcular_tramos, repartir_dias
+
+INICIO = date(2027, 5, 10)
+
+
+def test_repartir_dias_reparte_el_resto_en_los_primeros():
+    estadias = repartir_dias(["Roma", "París", "Lisboa"], INICIO, INICIO + timedelta(days=7))
+    assert estadias == [
+        ("Roma", INICIO),
+        ("París", INICIO + timedelta(days=3)),
+        ("Lisboa", INICIO + timedelta(days=5)),
+    ]
+
+
+def test_repartir_dias_un_destino():
+    assert repartir_dias(["Roma"], INICIO, INICIO + timedelta(days=4)) == [("Roma", INICIO)]
+
+
+@pytest.mark.parametrize("dias", [0, 1, 2, 3, 5, 9])
+@pytest.mark.parametrize("cantidad", [1, 2, 4, 6])
+def test_repartir_dias_no_sale_del_viaje(dias, cantidad):
+    destinos = [f"Ciudad {i}" for i in range(cantidad)]
+    fecha_fin = INICIO + timedelta(days=dias)
+    llegadas = [fecha for _, fecha in repartir_dias(destinos, INICIO, fecha_fin)]
+    assert [ciudad for ciudad, _ in repartir_dias(destinos, INICIO, fecha_fin)] == destinos
+    assert llegadas[0] == INICIO
+    assert llegadas == sorted(llegadas)
+    assert llegadas[-1] <= fecha_fin
+
+
+def test_calcular_tramos_con_mas_destinos_que_dias():
+    fecha_fin = INICIO + timedelta(days=2)
+    tramos = calcular_tramos("Madrid", ["Roma", "París", "Lisboa", "Berlín"], INICIO, fecha_fin)
+    assert [(t["origen"], t["destino"]) for t in tramos] == [
+        ("Madrid", "Roma"), ("Roma", "París"), ("París", "Lisboa"), ("Lisboa", "Berlín"), ("Berlín", "Madrid"),
+    ]
+    fechas = [t["fecha"] for t in tramos]
+    assert fechas == sorted(fechas)
+    assert fechas[-1] == fecha_fin
+
+
+def test_piezas_en_bloque_una_sola_llamada_para_las_que_faltan(monkeypatch):
+    monkeypatch.setattr(prefetch, "piezas", MemoLRU(10))
+    prefetch.piezas.guardar(("b",), "B en memo", 60)
+    llamadas = []
+
+    async def calcular(argumentos):
+        llamadas.append(argumentos)
+        return [None if a == "c" else a.upper() for a in argumentos]
+
+    async def recopilar():
+        piezas = prefetch._piezas_en_bloque(
+            [("a",), ("b",), ("c",)], 60, calcular, ["a", "b", "c"], lambda v: v is not None
+        )
+        return await asyncio.gather(*piezas)
+
+    assert asyncio.run(recopilar()) == ["A", "B en memo", None]
+    assert llamadas == [["a", "c"]]
+    # Solo se memoriza lo válido
+    assert prefetch.piezas.obtener(("a",)) == "A"
+    assert prefetch.piezas.obtener(("c",)) is None
+
+
+def test_piezas_en_bloque_propaga_el_error(monkeypatch):
+    monkeypatch.setattr(prefetch, "piezas", MemoLRU(10))
+
+    async def fallar(argumentos):
+        raise RuntimeError("sin conexión")
+
+    async def recopilar():
+        piezas = prefetch._piezas_en_bloque([("a",), ("b",)], 60, fallar, ["a", "b"], bool)
+        return await asyncio.gather(*piezas, return_exceptions=True)
+
+    assert [type(e) for e in asyncio.run(recopilar())] == [RuntimeError, RuntimeError]
+
+
+def test_tramo_con_todos_los_aeropuertos_candidatos():
+    tramo, ciudades = prefetch._tramo_flexible({"origen": "Buenos Aires", "destino": "Córdoba", "fecha": INICIO}, 0)
+    assert tramo.origenes == ("EZE", "AEP")
+    # Córdoba es ambigua: se buscan las dos y la ruta decide
+    assert tramo.destinos == ("COR", "ODB")
+    assert ciudades == {"EZE": "BUE", "AEP": "BUE", "COR": "COR", "ODB": "ODB"}
+    assert prefetch.resolver_aeropuertos("Córdoba, España") == {"ODB": "ODB"}
+    assert len(prefetch.resolver_aeropuertos("Londres")) > 1
@@ -0,0 +1,62 @@
+import pytest
+
+import prompts
+from prompts import MARCA_RECORTE, Plantilla, ajustar_mensajes, ajustar_secciones
+
+
+@pytest.fixture(autouse=True)
+def tokens_por_caracter(monkeypatch):
+    # Un token por carácter: el presupuesto se puede verificar sin el tokenizador del modelo
+    monkeypatch.setattr(prompts, "contar", len)
+    monkeypatch.setattr(prompts, "PROMPT_COMPACTAR", True)
+    monkeypatch.setattr(prompts, "PROMPT_TOKENS_TURNO", 40)
+
+
+def _lineas(prefijo, cantidad):
+    return "\n".join(f"{prefijo} {i:03d}" for i in range(cantidad))
+
+
+def test_plantilla_se_compacta_una_vez():
+    plantilla = Plantilla("""Sos un   planificador.
+        Viaje de {dias} días.
+
+        Viaje de {dias} días.""")
+    assert plantilla.texto == "Sos un planificador.\nViaje de {dias} días."
+    assert plantilla.formatear(dias=7) == "Sos un planificador.\nViaje de 7 días."
+    assert plantilla.ahorro == len(plantilla.original) - len(plantilla.texto)
+
+
+def test_secciones_que_entran_solo_se_compactan():
+    secciones = {"vuelos": "  MAD-FCO  100 EUR  ", "hoteles": "enlace"}
+    assert ajustar_secciones(secciones, presupuesto=100) == {"vuelos": "MAD-FCO 100 EUR", "hoteles": "enlace"}
+
+
+def test_secciones_se_recortan_al_presupuesto():
+    secciones = {"hoteles": "enlace corto", "vuelos": _lineas("vuelo", 50), "actividades": _lineas("actividad", 50)}
+    ajustadas = ajustar_secciones(secciones, presupuesto=300)
+    assert sum(map(len, ajustadas.values())) <= 300
+    # La sección chica queda entera y las largas se recortan en un fin de línea
+    assert ajustadas["hoteles"] == "enlace corto"
+    for nombre in ("vuelos", "actividades"):
+        assert ajustadas[nombre].endswith("\n" + MARCA_RECORTE)
+        assert secciones[nombre].startswith(ajustadas[nombre][:-len(MARCA_RECORTE) - 1])
+
+
+def test_mensajes_recortan_primero_los_turnos_viejos():
+    mensajes = [
+        {"role": "system", "content": _lineas("sistema", 10)},
+        {"role": "user", "content": _lineas("tarea", 10)},
+        {"role": "assistant", "content": _lineas("viejo", 20)},
+        {"role": "user", "content": _lineas("intermedio", 20)},
+        {"role": "assistant", "content": _lineas("reciente", 20)},
+        {"role": "user", "content": _lineas("ultimo", 10)},
+    ]
+    total = sum(len(m["content"]) for m in mensajes)
+    ajustados = ajustar_mensajes(mensajes, presupuesto=total - 150)
+    assert sum(len(m["content"]) for m in ajustados) <= total - 150
+    # Sistema, tarea y los dos últimos quedan enteros; alcanza con recortar el turno más viejo
+    assert [ajustados[i] for i in (0, 1, 4, 5)] == [mensajes[i] for i in (0, 1, 4, 5)]
+    assert ajustados[2]["content"].endswith(MARCA_RECORTE) and len(ajustados[2]["content"]) <= 40
+    assert ajustados[3] == mensajes[3]
+    # Con el presupuesto holgado la conversación no se toca
+    assert ajustar_mensajes(mensajes, presupuesto=total) is mensajes
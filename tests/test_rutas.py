@@ -0,0 +1,86 @@
+from datetime import date
+
+from modelos import Itinerario, OfertaVuelo, Segmento
+from rutas import TramoFlexible, consultas_tramos, optimizar_ruta
+
+IDA = TramoFlexible(("MAD",), ("FCO",), (date(2027, 5, 10),))
+VUELTA = TramoFlexible(("FCO",), ("MAD",), (date(2027, 5, 10), date(2027, 5, 11)))
+
+
+def _oferta(precio, origen, destino, salida, llegada, duracion="PT2H30M"):
+    segmento = Segmento("IB", "1", origen, destino, salida, llegada)
+    return OfertaVuelo(precio, "EUR", (Itinerario(duracion, (segmento,)),))
+
+
+def test_consultas_sin_repetidos():
+    assert consultas_tramos([IDA, IDA, VUELTA]) == [
+        ("MAD", "FCO", "2027-05-10"), ("FCO", "MAD", "2027-05-10"), ("FCO", "MAD", "2027-05-11"),
+    ]
+
+
+def test_ruta_mas_barata_con_conexiones_consistentes():
+    ida = _oferta(100.0, "MAD", "FCO", "2027-05-10T08:00", "2027-05-10T10:30")
+    # La vuelta más barata sale antes de que llegue la ida: no sirve
+    vuelta_imposible = _oferta(20.0, "FCO", "MAD", "2027-05-10T09:00", "2027-05-10T11:30")
+    vuelta_cara = _oferta(90.0, "FCO", "MAD", "2027-05-10T18:00", "2027-05-10T20:30")
+    vuelta_barata = _oferta(60.0, "FCO", "MAD", "2027-05-11T09:00", "2027-05-11T11:30", "PT4H")
+    resultados = {
+        ("MAD", "FCO", "2027-05-10"): [ida],
+        ("FCO", "MAD", "2027-05-10"): [vuelta_imposible, vuelta_cara],
+        ("FCO", "MAD", "2027-05-11"): [vuelta_barata],
+    }
+
+    ruta = optimizar_ruta([IDA, VUELTA], resultados)
+    assert ruta.ofertas == (ida, vuelta_barata)
+    assert (ruta.precio, ruta.minutos) == (160.0, 150 + 240)
+
+    ruta = optimizar_ruta([IDA, VUELTA], resultados, criterio="duracion")
+    assert ruta.ofertas == (ida, vuelta_cara)
+
+
+def test_sin_combinacion_consistente():
+    ida = _oferta(100.0, "MAD", "FCO", "2027-05-10T08:00", "2027-05-10T10:30")
+    vuelta = _oferta(60.0, "FCO", "MAD", "2027-05-10T07:00", "2027-05-10T09:30")
+    assert optimizar_ruta([IDA, VUELTA], {("MAD", "FCO", "2027-05-10"): [ida],
+                                         ("FCO", "MAD", "2027-05-10"): [vuelta]}) is None
+    assert optimizar_ruta([IDA, VUELTA], {("MAD", "FCO", "2027-05-10"): [ida]}) is None
+
+
+def test_poda_conserva_la_ruta_que_llega_antes():
+    # Con ancho 1 por precio se quedaría solo con la ida barata que llega tarde y
+    # perdería la única vuelta posible; el frente de Pareto conserva la que llega antes
+    ida_barata = _oferta(50.0, "MAD", "FCO", "2027-05-10T19:00", "2027-05-10T21:30")
+    ida_temprana = _oferta(80.0, "MAD", "FCO", "2027-05-10T06:00", "2027-05-10T08:30")
+    vuelta = _oferta(60.0, "FCO", "MAD", "2027-05-10T12:00", "2027-05-10T14:30")
+    resultados = {("MAD", "FCO", "2027-05-10"): [ida_barata, ida_temprana],
+                  ("FCO", "MAD", "2027-05-10"): [vuelta]}
+    ruta = optimizar_ruta([IDA, VUELTA], resultados, ancho=2)
+    assert ruta.ofertas == (ida_temprana, vuelta)
+
+
+def test_cambio_de_aeropuerto_solo_dentro_de_la_ciudad():
+    ida = TramoFlexible(("EZE", "AEP"), ("COR", "ODB"), (date(2027, 5, 10),))
+    vuelta = TramoFlexible(("COR", "ODB"), ("EZE", "AEP"), (date(2027, 5, 12),))
+    ciudades = {"EZE": "BUE", "AEP": "BUE", "COR": "COR", "ODB": "ODB"}
+    # La ida a ODB es la más barata, pero la única vuelta sale de COR (la otra Córdoba)
+    ida_odb = _oferta(100.0, "EZE", "ODB", "2027-05-10T08:00", "2027-05-11T06:00")
+    ida_cor = _oferta(300.0, "AEP", "COR", "2027-05-10T21:00", "2027-05-11T07:00")
+    vuelta_cor = _oferta(90.0, "COR", "EZE", "2027-05-12T18:00", "2027-05-12T19:30")
+    resultados = {
+        ("EZE", "ODB", "2027-05-10"): [ida_odb],
+        ("AEP", "COR", "2027-05-10"): [ida_cor],
+        ("COR", "EZE", "2027-05-12"): [vuelta_cor],
+    }
+    # El frente se arma por ciudad de llegada: ida_odb no poda a ida_cor aunque sea más
+    # barata y llegue "antes" (son horas locales de dos ciudades distintas)
+    ruta = optimizar_ruta([ida, vuelta], resultados, ciudades=ciudades)
+    assert ruta.ofertas == (ida_cor, vuelta_cor)
+    # Llegar a AEP y volver a salir de EZE sí conecta: es la misma ciudad
+    siguiente = TramoFlexible(("EZE", "AEP"), ("MAD",), (date(2027, 5, 13),))
+    a_madrid = _oferta(500.0, "EZE", "MAD", "2027-05-13T22:00", "2027-05-14T14:00")
+    resultados[("EZE", "MAD", "2027-05-13")] = [a_madrid]
+    vuelta_aep = _oferta(80.0, "COR", "AEP", "2027-05-12T18:00", "2027-05-12T19:30")
+    resultados[("COR", "AEP", "2027-05-12")] = [vuelta_aep]
+    ruta = optimizar_ruta([ida, vuelta, siguiente], resultados, ciudades=ciudades)
+    assert ruta.ofertas == (ida_cor, vuelta_aep, a_madrid)
+
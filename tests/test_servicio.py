@@ -0,0 +1,134 @@
+import json
+import sys
+import threading
+import types
+from datetime import date, timedelta
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from servicio import Servicio, SolicitudInvalida, _crear_manejador, dividir_dias, validar_solicitud
+
+INICIO = date.today() + timedelta(days=30)
+
+
+def _viaje(**campos):
+    viaje = {
+        "origen": "Madrid",
+        "destinos": ["Roma", "París"],
+        "fecha_inicio": INICIO.isoformat(),
+        "fecha_fin": (INICIO + timedelta(days=6)).isoformat(),
+        "preferencias": ["Arte", "Gastronomía"],
+    }
+    viaje.update(campos)
+    return viaje
+
+
+def test_validar_solicitud_valida():
+    solicitud = validar_solicitud(_viaje(modo="paralelo", regenerar=True))
+    assert solicitud["destinos"] == ["Roma", "París"]
+    assert solicitud["fecha_inicio"] == INICIO
+    assert solicitud["dias"] == "7"
+    assert solicitud["usar_cache"] is False
+    assert solicitud["modo"] == "paralelo"
+
+
+def test_validar_solicitud_destinos_separados_por_comas():
+    assert validar_solicitud(_viaje(destinos="Roma, París ,"))["destinos"] == ["Roma", "París"]
+
+
+@pytest.mark.parametrize("campos, mensaje", [
+    ({"origen": " "}, "origen"),
+    ({"destinos": []}, "destino"),
+    ({"fecha_inicio": "10/05/2027"}, "YYYY-MM-DD"),
+    ({"fecha_inicio": (date.today() - timedelta(days=1)).isoformat()}, "ya pasó"),
+    ({"fecha_fin": INICIO.isoformat()}, "posterior"),
+    ({"preferencias": []}, "preferencia"),
+    ({"preferencias": "Arte"}, "lista"),
+    ({"destinos": 5}, "lista de ciudades"),
+    ({"destinos": ["Roma", 5]}, "lista de ciudades"),
+    ({"destinos": {"ciudad": "Roma"}}, "lista de ciudades"),
+    ({"preferencias": ["Arte", "Relax", "Historia", "Compras"]}, "como máximo"),
+    ({"preferencias": ["Arte", "Surf"]}, "Surf"),
+    ({"modo": "rapido"}, "Modo desconocido"),
+])
+def test_validar_solicitud_invalida(campos, mensaje):
+    with pytest.raises(SolicitudInvalida, match=mensaje):
+        validar_solicitud(_viaje(**campos))
+
+
+def test_validar_solicitud_no_objeto():
+    with pytest.raises(SolicitudInvalida):
+        validar_solicitud(["Madrid"])
+
+
+def test_dividir_dias():
+    itinerario = "# Itinerario\n**Día 1: Llegada**\nVuelo.\n\nDía 2: Museos\nLouvre."
+    assert [d["dia"] for d in dividir_dias(itinerario)] == [1, 2]
+    assert dividir_dias("") == []
+
+
+@pytest.fixture
+def servidor():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _crear_manejador(Servicio(concurrencia=1, max_pendientes=0)))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _post(servidor, ruta, cuerpo):
+    conexion = HTTPConnection("127.0.0.1", servidor.server_address[1], timeout=10)
+    conexion.request("POST", ruta, body=json.dumps(cuerpo))
+    respuesta = conexion.getresponse()
+    return respuesta.status, json.loads(respuesta.read())
+
+
+@pytest.mark.parametrize("ruta", ["/trabajos", "/itinerarios"])
+def test_lista_vacia_es_400(servidor, ruta):
+    estado, cuerpo = _post(servidor, ruta, [])
+    assert estado == 400
+    assert "vacía" in cuerpo["error"]
+
+
+def test_viaje_invalido_es_400(servidor):
+    estado, cuerpo = _post(servidor, "/trabajos", _viaje(preferencias="Arte"))
+    assert estado == 400
+    assert cuerpo["estado"] == "error"
+
+
+def test_salud_incluye_limites(servidor):
+    import limites
+
+    limites.obtener_limitador("serper").adquirir()
+    conexion = HTTPConnection("127.0.0.1", servidor.server_address[1], timeout=10)
+    conexion.request("GET", "/salud")
+    respuesta = conexion.getresponse()
+    cuerpo = json.loads(respuesta.read())
+    assert respuesta.status == 200
+    assert "serper" in [m["nombre"] for m in cuerpo["limites"]]
+
+
+def test_itinerario_que_no_termina_es_504(monkeypatch):
+    liberar = threading.Event()
+
+    def generar(**solicitud):
+        liberar.wait(5)
+        yield {"tipo": "fin", "itinerario": "Día 1"}
+
+    modulo = types.ModuleType("agents")
+    modulo.generar_itinerario_stream = generar
+    monkeypatch.setitem(sys.modules, "agents", modulo)
+    servicio = Servicio(concurrencia=1, max_pendientes=0, timeout=0.3)
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _crear_manejador(servicio))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        estado, cuerpo = _post(servidor, "/itinerarios", _viaje())
+        assert estado == 504
+        assert cuerpo["estado"] in ("pendiente", "en_curso")
+        assert "no terminó" in cuerpo["error"]
+    finally:
+        liberar.set()
+        servidor.shutdown()
+        servidor.server_close()
@@ -0,0 +1,122 @@
+import sqlite3
+import sys
+import threading
+import time
+import types
+from datetime import date
+
+import pytest
+
+import trabajos
+from trabajos import ERROR, EN_CURSO, TERMINADO, AlmacenMemoria, AlmacenSQLite, ColaLlena, ColaTrabajos
+
+VIAJE = dict(origen="Madrid", destinos=["Roma"], fecha_inicio=date(2027, 5, 10), fecha_fin=date(2027, 5, 12),
+             preferencias=["Arte"], dias="3")
+
+
+def _con_agents(monkeypatch, generar):
+    # ColaTrabajos importa agents recién al ejecutar cada trabajo
+    modulo = types.ModuleType("agents")
+    modulo.generar_itinerario_stream = generar
+    monkeypatch.setitem(sys.modules, "agents", modulo)
+
+
+def _esperar_estado(cola, trabajo_id, estados=(TERMINADO, ERROR), timeout=5):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        trabajo = cola.obtener(trabajo_id)
+        if trabajo["estado"] in estados:
+            return trabajo
+        time.sleep(0.01)
+    raise AssertionError(f"El trabajo quedó en {trabajo['estado']}")
+
+
+def test_trabajo_terminado(monkeypatch):
+    def generar(**solicitud):
+        yield {"tipo": "progreso", "mensaje": "✈️ Vuelos listos"}
+        yield {"tipo": "texto", "texto": "Día 1"}
+        yield {"tipo": "fin", "itinerario": "Día 1"}
+
+    _con_agents(monkeypatch, generar)
+    cola = ColaTrabajos(AlmacenMemoria(), max_workers=1, max_pendientes=0)
+    eventos = list(cola.seguir(cola.enviar(**VIAJE), intervalo=0.01))
+    assert [e["tipo"] for e in eventos] == ["progreso", "texto", "fin"]
+    assert eventos[-1]["itinerario"] == "Día 1"
+
+
+def test_error_al_generar(monkeypatch):
+    def generar(**solicitud):
+        raise ValueError("sin vuelos")
+        yield
+
+    _con_agents(monkeypatch, generar)
+    cola = ColaTrabajos(AlmacenMemoria(), max_workers=1, max_pendientes=0)
+    with pytest.raises(RuntimeError, match="sin vuelos"):
+        list(cola.seguir(cola.enviar(**VIAJE), intervalo=0.01))
+
+
+def test_falla_del_import_libera_el_cupo(monkeypatch):
+    # Con None en sys.modules, "from agents import ..." lanza ImportError
+    monkeypatch.setitem(sys.modules, "agents", None)
+    cola = ColaTrabajos(AlmacenMemoria(), max_workers=1, max_pendientes=1)
+    for _ in range(5):
+        trabajo = _esperar_estado(cola, cola.enviar(**VIAJE))
+        assert trabajo["estado"] == ERROR
+        assert "agents" in trabajo["error"]
+
+
+def test_cola_llena_y_cupos(monkeypatch):
+    seguir = threading.Event()
+
+    def generar(**solicitud):
+        seguir.wait(5)
+        yield {"tipo": "fin", "itinerario": "listo"}
+
+    _con_agents(monkeypatch, generar)
+    cola = ColaTrabajos(AlmacenMemoria(), max_workers=1, max_pendientes=1)
+    ids = [cola.enviar(**VIAJE), cola.enviar(**VIAJE)]
+    with pytest.raises(ColaLlena):
+        cola.enviar(**VIAJE)
+    seguir.set()
+    for trabajo_id in ids:
+        assert _esperar_estado(cola, trabajo_id)["estado"] == TERMINADO
+    # Al terminar se liberan los cupos
+    assert _esperar_estado(cola, cola.enviar(**VIAJE))["estado"] == TERMINADO
+
+
+def test_seguir_con_timeout(monkeypatch):
+    seguir = threading.Event()
+
+    def generar(**solicitud):
+        seguir.wait(5)
+        yield {"tipo": "fin", "itinerario": "listo"}
+
+    _con_agents(monkeypatch, generar)
+    cola = ColaTrabajos(AlmacenMemoria(), max_workers=1, max_pendientes=0)
+    trabajo_id = cola.enviar(**VIAJE)
+    try:
+        with pytest.raises(TimeoutError):
+            list(cola.seguir(trabajo_id, intervalo=0.01, timeout=0.1))
+    finally:
+        seguir.set()
+
+
+def test_sqlite_marca_interrumpidos_al_iniciar(tmp_path):
+    ruta = str(tmp_path / "trabajos.sqlite3")
+    almacen = AlmacenSQLite(ruta)
+    for trabajo_id in ("viejo_en_curso", "viejo_pendiente", "reciente", "terminado"):
+        almacen.crear(trabajo_id, VIAJE)
+    almacen.actualizar("viejo_en_curso", estado=EN_CURSO)
+    almacen.actualizar("reciente", estado=EN_CURSO)
+    almacen.actualizar("terminado", estado=TERMINADO, resultado="Día 1")
+    hace_mucho = time.time() - trabajos.TRABAJOS_TIMEOUT - 60
+    with sqlite3.connect(ruta) as conexion:
+        conexion.execute("UPDATE trabajos SET actualizado = ? WHERE id != 'reciente'", (hace_mucho,))
+
+    # Un proceso nuevo que abre el mismo almacén
+    almacen = AlmacenSQLite(ruta)
+    assert almacen.obtener("viejo_en_curso")["estado"] == ERROR
+    assert almacen.obtener("viejo_pendiente")["estado"] == ERROR
+    assert almacen.obtener("viejo_en_curso")["error"] == trabajos.INTERRUMPIDO
+    assert almacen.obtener("reciente")["estado"] == EN_CURSO
+    assert almacen.obtener("terminado")["estado"] == TERMINADO